@@ -11,6 +11,7 @@ from Backend.helper.pyro import restart_notification, setup_bot_commands
 from Backend.pyrofork.bot import Helper, StreamBot
 from Backend.pyrofork.clients import initialize_clients
 from Backend.helper.link_checker import DeadLinkChecker
+from Backend.helper.session_warmup import warmup_planner
 from Backend.fastapi.main import app
 from Backend.pyrofork.plugins.channels import _load_channels_from_db
 
@@ -48,6 +49,7 @@ async def start_services():
         await restart_notification()
         loop.create_task(server.serve())
         loop.create_task(ping())
+        loop.create_task(warmup_planner.run_forever())
         
         # Start the background Dead Link Checker
         link_checker_task = DeadLinkChecker(db, app, check_interval_hours=24)
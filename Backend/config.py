@@ -14,6 +14,25 @@ class Telegram:
 
     PARALLEL = int(getenv("PARALLEL", "1"))
     PRE_FETCH = int(getenv("PRE_FETCH", "1"))
+    CHUNK_CACHE_MB = int(getenv("CHUNK_CACHE_MB", "256"))
+    READAHEAD_RAMP_SECS = float(getenv("READAHEAD_RAMP_SECS", "2"))
+    READAHEAD_RAMP_MB = int(getenv("READAHEAD_RAMP_MB", "2"))
+    FILE_ID_TTL = int(getenv("FILE_ID_TTL", "7200"))
+    STRIPE_BOTS = int(getenv("STRIPE_BOTS", "1"))
+    HEDGE_REQUESTS = getenv("HEDGE_REQUESTS", "true").lower() == "true"
+    ADAPTIVE_PARALLEL = getenv("ADAPTIVE_PARALLEL", "true").lower() == "true"
+    AIMD_MAX_PARALLEL = int(getenv("AIMD_MAX_PARALLEL", "8"))
+    STREAM_MEMORY_MB = int(getenv("STREAM_MEMORY_MB", "512"))
+    CDN_DOWNLOADS = getenv("CDN_DOWNLOADS", "false").lower() == "true"
+    MEDIA_SESSIONS = int(getenv("MEDIA_SESSIONS", "2"))
+    SESSION_STORE = getenv("SESSION_STORE", "sessions")
+    SESSION_SECRET = getenv("SESSION_SECRET", "") or API_HASH
+    STREAM_WARMER = getenv("STREAM_WARMER", "false").lower() == "true"
+    STREAM_WARMER_TOP = int(getenv("STREAM_WARMER_TOP", "2"))
+    STREAM_WARMER_BUDGET = int(getenv("STREAM_WARMER_BUDGET", "20"))
+    NEXT_EPISODE_AT = float(getenv("NEXT_EPISODE_AT", "0.85"))
+    NEXT_EPISODE_BUDGET = int(getenv("NEXT_EPISODE_BUDGET", "4"))
+    PACE_BUFFER_SECS = int(getenv("PACE_BUFFER_SECS", "60"))
 
     AUTH_CHANNEL = [channel.strip() for channel in (getenv("AUTH_CHANNEL") or "").split(",") if channel.strip()]
     DATABASE = [db.strip() for db in (getenv("DATABASE") or "").split(",") if db.strip()]
@@ -18,7 +18,7 @@ from Backend.fastapi.routes.api_routes import (
     delete_tv_episode_api, delete_tv_season_api,
     create_token_api, revoke_token_api, update_token_limits_api,
     speed_test_api, speed_test_stream_api,
-    get_admin_stats_api, clear_cache_api, get_dead_links_api,
+    get_admin_stats_api, get_scheduler_api, clear_cache_api, get_dead_links_api,
     get_stream_analytics_api, clear_stream_analytics_api,
     get_subscription_plans_api, add_subscription_plan_api,
     update_subscription_plan_api, delete_subscription_plan_api,
@@ -168,6 +168,10 @@ async def get_system_stats(_: bool = Depends(require_auth)):
 async def admin_system_stats(_: bool = Depends(require_auth)):
     return await get_admin_stats_api()
 
+@app.get("/api/admin/scheduler")
+async def admin_scheduler(_: bool = Depends(require_auth)):
+    return await get_scheduler_api()
+
 @app.post("/api/admin/clear-cache")
 async def clear_cache(_: bool = Depends(require_auth)):
     return await clear_cache_api()
@@ -408,10 +408,10 @@ async def speed_test_stream_api(
 
 async def get_admin_stats_api() -> dict:
     from Backend.pyrofork.bot import work_loads, multi_clients, client_failures, client_avg_mbps
-    from Backend.fastapi.routes.stream_routes import _streamer_by_client
+    from Backend.helper.file_resolver import file_resolver
+    from Backend.helper.circuit_breaker import breakers, flood_stats
     
-    # Sum cache entries across all active ByteStreamer instances
-    cache_size = sum(len(s._file_id_cache) for s in _streamer_by_client.values())
+    cache_size = file_resolver.stats()["entries"]
     
     # Calculate bot workloads and health
     bot_stats = []
@@ -419,12 +419,16 @@ async def get_admin_stats_api() -> dict:
         load = work_loads.get(client_index, 0)
         failures = client_failures.get(client_index, 0)
         mbps = client_avg_mbps.get(client_index, 0.0)
+        floods = flood_stats.get(client_index, {})
+        held_for = breakers.bot_held_for(client_index)
         
         status = "healthy"
         if failures > 5:
             status = "degraded"
         if failures > 15:
             status = "failing"
+        if held_for > 0:
+            status = "flood_wait"
             
         bot_stats.append({
             "client_index": client_index,
@@ -432,6 +436,10 @@ async def get_admin_stats_api() -> dict:
             "current_load": load,
             "failures": failures,
             "avg_mbps": round(mbps, 2),
+            "flood_waits": floods.get("floods", 0),
+            "flood_wait_seconds": floods.get("wait_seconds", 0),
+            "last_flood_wait": floods.get("last_wait", 0),
+            "flood_held_for": round(held_for, 1),
             "status": status
         })
         
@@ -441,17 +449,21 @@ async def get_admin_stats_api() -> dict:
         "bot_workloads": bot_stats
     }
 
+async def get_scheduler_api() -> dict:
+    from Backend.helper.scheduler import scheduler
+    return {"status": "success", "data": scheduler.snapshot()}
+
 async def clear_cache_api() -> dict:
-    from Backend.fastapi.routes.stream_routes import _streamer_by_client
+    from Backend.helper.file_resolver import file_resolver
     from Backend.logger import LOGGER
     
-    # Clear cache across all active ByteStreamer instances
-    total_cleared = sum(len(s._file_id_cache) for s in _streamer_by_client.values())
-    for streamer in _streamer_by_client.values():
-        streamer._file_id_cache.clear()
-    LOGGER.info(f"Admin cleared the FileId cache ({total_cleared} items purged across {len(_streamer_by_client)} clients).")
+    total_cleared = await file_resolver.clear()
+    LOGGER.info(f"Admin cleared the FileId cache ({total_cleared} items purged).")
+
+    from Backend.helper.chunk_cache import chunk_cache
+    chunks_cleared = chunk_cache.clear()
     
-    return {"status": "success", "message": f"{total_cleared} cached items cleared."}
+    return {"status": "success", "message": f"{total_cleared} cached items and {chunks_cleared} cached chunks cleared."}
 
 async def get_dead_links_api() -> dict:
     from Backend import db
@@ -1,22 +1,34 @@
-import math
 import secrets
 import mimetypes
 import time
-from typing import Dict
+from typing import Dict, List
 
 from fastapi import APIRouter, Request, HTTPException, Depends
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import JSONResponse
 
 from collections import deque
 
 from Backend import db
 from Backend.helper.encrypt import decode_string
 from Backend.helper.exceptions import InvalidHash
-from Backend.helper.custom_dl import ByteStreamer, ACTIVE_STREAMS, RECENT_STREAMS, get_adaptive_chunk_size
+from Backend.helper.custom_dl import ByteStreamer, ACTIVE_STREAMS, RECENT_STREAMS, get_adaptive_chunk_size, getfile_flights, tail_stats
+from Backend.helper.chunk_cache import chunk_cache
+from Backend.helper.memory_governor import memory_governor
+from Backend.helper.viewer_session import ViewerSession, viewer_sessions
+from Backend.helper.scheduler import scheduler
+from Backend.helper.circuit_breaker import breakers
+from Backend.helper.session_pool import pool_stats
+from Backend.helper.session_store import session_store
+from Backend.helper.session_warmup import warmup_planner
+from Backend.helper.stream_warmer import stream_warmer
+from Backend.helper.next_episode import next_episodes
+from Backend.helper.file_resolver import file_resolver
+from Backend.helper.bot_metrics import hedge_stats, latency_summary
 from Backend.pyrofork.bot import StreamBot, work_loads, multi_clients, client_dc_map, client_failures, client_avg_mbps
 from Backend.config import Telegram
 from Backend.logger import LOGGER
 from Backend.fastapi.security.tokens import verify_token
+from Backend.fastapi.stream_response import ChunkStreamResponse
 import asyncio
 
 router = APIRouter(tags=["Streaming"])
@@ -88,38 +100,40 @@ def parse_range_header(range_header: str, file_size: int):
     return start, end
 
 
+def is_probe_range(start: int, end: int) -> bool:
+    """True for small ranges (``bytes=0-0``, ``bytes=0-1023``, 64 KB hash reads ...)
+    up to ByteStreamer.SMALL_RANGE that are served without the prefetch pipeline."""
+    return end - start + 1 <= ByteStreamer.SMALL_RANGE
+
+
 def select_best_client(target_dc: int) -> int:
-    """Pick the best available client.
+    """Pick the bot with the most spare capacity for ``target_dc``.
 
-    Score = work_loads + 3 × client_failures
-    Failures are weighted 3× so a bot that has been timing out / erroring
-    is deprioritised even if its current workload is low.
-    DC-aware selection is kept but currently commented out (uncomment to
-    prefer same-DC bots).
+    Delegates to the scheduler, which scores bots on their live per-(bot, DC)
+    latency and delivered bytes/s rather than on stream counts, and records
+    each decision for /api/admin/scheduler.
     """
-    def _score(idx: int) -> int:
-        return work_loads.get(idx, 0) + 3 * client_failures.get(idx, 0)
-
-    # --- DC-aware selection (uncomment to enable) ---------------------------
-    # matching = [
-    #     idx for idx, dc in client_dc_map.items()
-    #     if dc == target_dc and idx in multi_clients
-    # ]
-    # if matching:
-    #     selected = min(matching, key=_score)
-    #     LOGGER.debug("DC-match client %s (DC %s) score=%s", selected, target_dc, _score(selected))
-    #     return selected
-    # ------------------------------------------------------------------------
-
-    if multi_clients:
-        selected = min(multi_clients.keys(), key=_score)
-        LOGGER.debug(
-            "Selected client %s (DC %s) score=%s",
-            selected, client_dc_map.get(selected, "?"), _score(selected),
-        )
-        return selected
+    if not multi_clients:
+        return 0
+    selected = scheduler.choose(target_dc)
+    LOGGER.debug("Selected client %s (DC %s) for DC %s", selected, client_dc_map.get(selected, "?"), target_dc)
+    return selected
+
+
+def select_stripe_clients(primary: int, count: int, target_dc: int) -> List[int]:
+    """Pick up to ``count`` bots (primary first) to stripe one stream across.
+
+    Bots whose circuit breaker for the DC is open, or that are waiting out a
+    FloodWait, are left out so a struggling bot doesn't stall every Nth chunk.
+    """
+    if count <= 1:
+        return [primary]
 
-    return 0
+    others = [
+        c["client_index"] for c in scheduler.rank(target_dc, exclude=primary)
+        if breakers.allow(c["client_index"], target_dc)
+    ]
+    return [primary] + others[:count - 1]
 
 
 async def decay_client_failures() -> None:
@@ -138,7 +152,14 @@ async def decay_client_failures() -> None:
 
 
 
-async def track_usage_from_stats(stream_id: str, token: str, token_data: dict):
+async def track_usage_from_stats(viewer: ViewerSession, token: str, token_data: dict, stream_id_hash: str = None):
+    """Report a viewer session's bytes to the token's usage every 10 seconds.
+
+    One tracker runs per viewer session rather than per Range request, and
+    it exits with a final update once the session has gone idle.  It also
+    starts the next-episode prefetch once playback is far enough in, and
+    cancels it when the session ends.
+    """
     await asyncio.sleep(2)
     
     limits = token_data.get("limits", {}) if token_data else {}
@@ -156,54 +177,44 @@ async def track_usage_from_stats(stream_id: str, token: str, token_data: dict):
     try:
         while True:
             await asyncio.sleep(update_interval)
-            stream_info = ACTIVE_STREAMS.get(stream_id)
-            if not stream_info:
-                for rec in RECENT_STREAMS:
-                    if rec.get("stream_id") == stream_id:
-                        final_bytes = rec.get("total_bytes", 0)
-                        delta = final_bytes - last_tracked_bytes
-                        if delta > 0:
-                            try:
-                                await db.update_token_usage(token, delta)
-                                LOGGER.debug(f"Final usage update for {stream_id}: {delta} bytes")
-                            except Exception as e:
-                                LOGGER.error(f"Final usage update failed: {e}")
-                        break
-                return
-            
-            current_bytes = stream_info.get("total_bytes", 0)
+            current_bytes = viewer.total_bytes
             delta = current_bytes - last_tracked_bytes
             
             if delta > 0:
                 try:
                     await db.update_token_usage(token, delta)
                     last_tracked_bytes = current_bytes
-                    LOGGER.debug(f"Updated usage for {stream_id}: +{delta} bytes (total: {current_bytes})")
+                    LOGGER.debug(f"Updated usage for viewer session: +{delta} bytes (total: {current_bytes})")
                 except Exception as e:
                     LOGGER.error(f"Periodic usage update failed: {e}")
+
+            if viewer.expired():
+                viewer_sessions.drop(viewer)
+                next_episodes.cancel(viewer)
+                return
+
+            next_episodes.check(viewer, token, stream_id_hash)
             
             # Check limits (don't stop stream, just log - client manages connection)
             if daily_limit_gb and daily_limit_gb > 0:
                 current_daily_gb = (initial_daily_bytes + current_bytes) / (1024 ** 3)
                 if current_daily_gb >= daily_limit_gb:
-                    LOGGER.debug(f"Daily limit reached for token, stream {stream_id} may be blocked by verify_token")
+                    LOGGER.debug("Daily limit reached for token, viewer session may be blocked by verify_token")
             
             if monthly_limit_gb and monthly_limit_gb > 0:
                 current_monthly_gb = (initial_monthly_bytes + current_bytes) / (1024 ** 3)
                 if current_monthly_gb >= monthly_limit_gb:
-                    LOGGER.debug(f"Monthly limit reached for token, stream {stream_id} may be blocked by verify_token")
+                    LOGGER.debug("Monthly limit reached for token, viewer session may be blocked by verify_token")
                     
     except asyncio.CancelledError:
-        stream_info = ACTIVE_STREAMS.get(stream_id)
-        if stream_info:
-            current_bytes = stream_info.get("total_bytes", 0)
-            delta = current_bytes - last_tracked_bytes
-            if delta > 0:
-                try:
-                    await db.update_token_usage(token, delta)
-                    LOGGER.info(f"Cancelled - final update for {stream_id}: {delta} bytes")
-                except Exception as e:
-                    LOGGER.error(f"Cancelled usage update failed: {e}")
+        next_episodes.cancel(viewer)
+        delta = viewer.total_bytes - last_tracked_bytes
+        if delta > 0:
+            try:
+                await db.update_token_usage(token, delta)
+                LOGGER.info(f"Cancelled - final usage update for viewer session: {delta} bytes")
+            except Exception as e:
+                LOGGER.error(f"Cancelled usage update failed: {e}")
 
 
 @router.get("/dl/{token}/{id}/{name}")
@@ -221,9 +232,8 @@ async def stream_handler(
         raise HTTPException(status_code=400, detail="Missing id")
 
     chat_id = int(f"-100{decoded['chat_id']}")
-    message = await StreamBot.get_messages(chat_id, int(msg_id))
-    file = message.video or message.document
-    secure_hash = file.file_unique_id[:6]
+    file_id = await file_resolver.resolve(StreamBot, 0, chat_id, int(msg_id))
+    secure_hash = file_id.unique_id[:6]
 
     return await media_streamer(
         request=request,
@@ -250,33 +260,108 @@ async def media_streamer(
         _streamer_by_client[temp_client] = ByteStreamer(temp_client, idx)
     temp_streamer = _streamer_by_client[temp_client]
 
-    file_id = await temp_streamer.get_file_properties(chat_id=chat_id, message_id=msg_id)
+    # Successive Range requests of one playback share a viewer session that
+    # keeps the bot, FileId and tail of the last readahead window.
+    session_key = (token, stream_id_hash or f"{chat_id}:{msg_id}")
+    viewer = viewer_sessions.get(session_key)
+    if viewer is not None and viewer.file_id_fresh():
+        file_id = viewer.file_id
+    else:
+        file_id = await temp_streamer.get_file_properties(chat_id=chat_id, message_id=msg_id)
+        if viewer is not None:
+            viewer.file_id = file_id
+            viewer.file_id_at = time.time()
 
     if secure_hash != "SKIP_HASH_CHECK":  # Don't check this it is for my Webdav
         if file_id.unique_id[:6] != secure_hash:
             raise InvalidHash
 
+    file_size = file_id.file_size
+    range_header = request.headers.get("Range", "")
+    start, end = parse_range_header(range_header, file_size)
+    req_length = end - start + 1
+
+    file_name = file_id.file_name or f"{secrets.token_hex(4)}.bin"
+    mime_type = file_id.mime_type or mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+
+    if "." not in file_name and "/" in mime_type:
+        file_name = f"{file_name}.{mime_type.split('/')[1]}"
+
+    # HEAD: return headers only (no body), include Content-Length so the
+    # client knows the file size without opening a stream.
+    # GET: do NOT set Content-Length on the streaming response.
+    # If a Telegram chunk fetch times out mid-stream the generator exits early,
+    # delivering fewer bytes than the declared length.  h11 enforces
+    # Content-Length strictly and raises LocalProtocolError in that case.
+    # Without Content-Length, uvicorn uses chunked transfer encoding which
+    # handles early termination gracefully.  Stremio / media players
+    # are fine with chunked 206 responses.
+    headers = {
+        "Content-Type": mime_type,
+        "Content-Disposition": f'inline; filename="{file_name}"',
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(req_length),
+        "Cache-Control": "public, max-age=3600",
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Expose-Headers": "Content-Length, Content-Range, Accept-Ranges",
+    }
+
+    if range_header:
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        status = 206
+    else:
+        status = 200
+
+    from fastapi.responses import Response as PlainResponse
+
+    # HEAD and small reads (bytes=0-0 probes, subtitle hash reads) are answered
+    # from the cached FileId without touching the scheduler: no registry entry,
+    # no work_loads slot and no new usage tracker, so probes don't skew
+    # select_best_client.  Their bytes still count for an open viewer session.
+    if request.method == "HEAD":
+        return PlainResponse(status_code=status, headers=headers)
+
+    # A read from the start is a (re)open: fetch the file's tail alongside the
+    # head, since the player's next request is usually for the index there.
+    if start == 0:
+        temp_streamer.prefetch_tail(file_id)
+
+    if range_header and is_probe_range(start, end):
+        try:
+            body = await temp_streamer.read_probe(file_id, start, end)
+        except Exception as e:
+            LOGGER.debug(f"Probe read failed for msg_id={msg_id}, using full pipeline: {e}")
+            body = None
+        if body is not None and len(body) == req_length:
+            if viewer is not None:
+                viewer.total_bytes += req_length
+            return PlainResponse(content=body, status_code=status, headers=headers, media_type=mime_type)
+
     target_dc = file_id.dc_id
     LOGGER.debug(f"File msg_id={msg_id} is in DC {target_dc}")
 
-    index = select_best_client(target_dc)
+    if viewer is not None and viewer.client_index in multi_clients and breakers.allow(viewer.client_index, target_dc):
+        index = viewer.client_index
+        chunk_size = viewer.chunk_size
+    else:
+        index = select_best_client(target_dc)
+        # Adaptive chunk size based on this client's recent measured throughput
+        chunk_size = get_adaptive_chunk_size(index)
+        if viewer is not None:
+            viewer.rebind(index, chunk_size)
+        else:
+            viewer = viewer_sessions.open(session_key, file_id, index, chunk_size)
+            asyncio.create_task(track_usage_from_stats(viewer, token, token_data, stream_id_hash))
     tg_client = multi_clients[index]
 
     if tg_client not in _streamer_by_client:
         _streamer_by_client[tg_client] = ByteStreamer(tg_client, index)
     streamer: ByteStreamer = _streamer_by_client[tg_client]
 
-    file_size = file_id.file_size
-    range_header = request.headers.get("Range", "")
-    start, end = parse_range_header(range_header, file_size)
-    req_length = end - start + 1
-
-    # Adaptive chunk size based on this client's recent measured throughput
-    chunk_size = get_adaptive_chunk_size(index)
     offset = start - (start % chunk_size)
     first_part_cut = start - offset
     last_part_cut = (end % chunk_size) + 1
-    part_count = math.ceil(end / chunk_size) - math.floor(offset / chunk_size)
+    part_count = end // chunk_size - offset // chunk_size + 1
 
     from urllib.parse import unquote
     
@@ -285,11 +370,14 @@ async def media_streamer(
     # Extract original title from the URL path name, fallback to raw name
     decoded_name = unquote(request.path_params.get("name", ""))
     
-    # Look up the real title from the database using the Stremio stream_id_hash
-    db_title = None
-    if stream_id_hash:
-        db_title = await db.get_title_by_stream_id(stream_id_hash)
-        LOGGER.info(f"Stream lookup for hash '{stream_id_hash}' returned title: {db_title}")
+    # Look up the real title (and runtime, for bitrate pacing) from the database
+    # using the Stremio stream_id_hash; the viewer session keeps it for later requests
+    if viewer.media_info is None:
+        viewer.media_info = {}
+        if stream_id_hash:
+            viewer.media_info = await db.get_media_info_by_stream_id(stream_id_hash) or {}
+            LOGGER.info(f"Stream lookup for hash '{stream_id_hash}' returned title: {viewer.media_info.get('title')}")
+    db_title = viewer.media_info.get("title")
         
     final_title = db_title if db_title else decoded_name
     
@@ -297,12 +385,15 @@ async def media_streamer(
         "request_path": str(request.url.path),
         "client_host": request.client.host if request.client else None,
         "title": final_title,
+        "runtime": viewer.media_info.get("runtime"),
         "user_name": token_data.get("name", "Unknown") if token_data else "Unknown"
     }
 
     prefetch_count = Telegram.PARALLEL
     parallelism = Telegram.PRE_FETCH
+    stripe_clients = select_stripe_clients(index, min(Telegram.STRIPE_BOTS, part_count), target_dc)
 
+    disconnected = asyncio.Event()
     body_gen = await streamer.prefetch_stream(
         file_id=file_id,
         client_index=index,
@@ -316,69 +407,17 @@ async def media_streamer(
         meta=meta,
         parallelism=parallelism,
         request=request,
+        stripe_clients=stripe_clients,
+        viewer=viewer,
+        disconnected=disconnected,
     )
 
-    asyncio.create_task(track_usage_from_stats(stream_id, token, token_data))
-
-    file_name = file_id.file_name or f"{secrets.token_hex(4)}.bin"
-    mime_type = file_id.mime_type or mimetypes.guess_type(file_name)[0] or "application/octet-stream"
-
-    if "." not in file_name and "/" in mime_type:
-        file_name = f"{file_name}.{mime_type.split('/')[1]}"
-
-    # HEAD: return headers only (no body), include Content-Length so the
-    # client knows the file size without opening a stream.
-    # GET: do NOT set Content-Length on the StreamingResponse.
-    # If a Telegram chunk fetch times out mid-stream the generator exits early,
-    # delivering fewer bytes than the declared length.  h11 enforces
-    # Content-Length strictly and raises LocalProtocolError in that case.
-    # Without Content-Length, uvicorn uses chunked transfer encoding which
-    # handles early termination gracefully.  Stremio / media players
-    # are fine with chunked 206 responses.
-
-    # HEAD request support
-    from fastapi.responses import Response as PlainResponse
-
-    if request.method == "HEAD":
-        headers = {
-            "Content-Type": mime_type,
-            "Content-Length": str(req_length),
-            "Content-Disposition": f'inline; filename="{file_name}"',
-            "Accept-Ranges": "bytes",
-            "Cache-Control": "public, max-age=3600",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Expose-Headers": "Content-Length, Content-Range, Accept-Ranges",
-        }
-
-        if range_header:
-            headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
-
-        return PlainResponse(
-            status_code=206 if range_header else 200,
-            headers=headers,
-        )
-
-    headers = {
-        "Content-Type": mime_type,
-        "Content-Disposition": f'inline; filename="{file_name}"',
-        "Accept-Ranges": "bytes",
-        "Content-Length": str(req_length),
-        "Cache-Control": "public, max-age=3600",
-        "Access-Control-Allow-Origin": "*",
-        "Access-Control-Expose-Headers": "Content-Length, Content-Range, Accept-Ranges",
-    }
-
-    if range_header:
-        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
-        status = 206
-    else:
-        status = 200
-
-    return StreamingResponse(
+    return ChunkStreamResponse(
         body_gen,
         headers=headers,
         status_code=status,
         media_type=mime_type,
+        disconnected=disconnected,
     )
 
 
@@ -407,12 +446,24 @@ async def get_stream_stats():
                 "chat_id": info.get("chat_id"),
                 "title": info.get("meta", {}).get("title"),
                 "client_index": info.get("client_index"),
+                "stripe_clients": info.get("stripe_clients"),
                 "dc_id": info.get("dc_id"),
                 "status": info.get("status"),
                 "total_bytes": info.get("total_bytes"),
                 "instant_mbps": round(info.get("instant_mbps", 0.0), 3),
                 "avg_mbps": round(info.get("avg_mbps", 0.0), 3),
                 "peak_mbps": round(info.get("peak_mbps", 0.0), 3),
+                "cache_hits": info.get("cache_hits", 0),
+                "hedged_chunks": info.get("hedged_chunks", 0),
+                "readahead_parallel": info.get("readahead_parallel"),
+                "aimd": info.get("aimd"),
+                "pacing": info.get("pacing"),
+                "prefetched_bytes": info.get("prefetched_bytes", 0),
+                "warm_start": info.get("warm_start", False),
+                "tail_hits": info.get("tail_hits", 0),
+                "warm_hits": info.get("warm_hits", 0),
+                "reference_refreshes": info.get("reference_refreshes", 0),
+                "reserved_bytes": memory_governor.held_by(sid),
                 "start_ts": info.get("start_ts"),
             }
         )
@@ -431,6 +482,10 @@ async def get_stream_stats():
                 "total_bytes": info.get("total_bytes"),
                 "duration": info.get("duration"),
                 "avg_mbps": round(info.get("avg_mbps", 0.0), 3),
+                "wasted_prefetch_bytes": info.get("wasted_prefetch_bytes", 0),
+                "prefetch_bytes_saved": info.get("prefetch_bytes_saved", 0),
+                "cancelled_fetches": info.get("cancelled_fetches", 0),
+                "donated_bytes": info.get("donated_bytes", 0),
                 "start_ts": info.get("start_ts"),
                 "end_ts": info.get("end_ts"),
             }
@@ -442,6 +497,19 @@ async def get_stream_stats():
             "recent_streams": recent,
             "client_dc_map": client_dc_map,
             "work_loads": work_loads,
+            "chunk_cache": chunk_cache.stats(),
+            "getfile_flights": getfile_flights.stats(),
+            "tail_prefetch": tail_stats,
+            "file_resolver": file_resolver.stats(),
+            "hedging": hedge_stats,
+            "chunk_latency": latency_summary(),
+            "memory": memory_governor.stats(),
+            "viewer_sessions": viewer_sessions.stats(),
+            "media_session_pools": pool_stats(),
+            "session_store": session_store.stats(),
+            "session_warmup": warmup_planner.stats(),
+            "stream_warmer": stream_warmer.stats(),
+            "next_episode": next_episodes.stats(),
         }
     )
 
@@ -6,6 +6,7 @@ from Backend import db, __version__
 import PTN
 from datetime import datetime, timezone, timedelta
 from Backend.fastapi.security.tokens import verify_token
+from Backend.helper.stream_warmer import stream_warmer
 
 
 # --- Configuration ---
@@ -552,6 +553,7 @@ async def get_streams(
         return {"streams": []}
 
     streams = []
+    quality_ids = {}  # stream url -> encoded quality id, for the stream warmer
     for quality in media_details.get("telegram", []):
         if quality.get("id"):
             filename = quality.get("name", "")
@@ -562,16 +564,19 @@ async def get_streams(
                 filename, quality_str, size
             )
 
+            url = f"{BASE_URL}/dl/{token}/{quality.get('id')}/video.mkv"
+            quality_ids[url] = quality.get("id")
             streams.append({
                 "name": stream_name,
                 "title": stream_title,
-                "url": f"{BASE_URL}/dl/{token}/{quality.get('id')}/video.mkv"
+                "url": url
             })
 
     streams.sort(
         key=lambda s: get_resolution_priority(s.get("name", "")),
         reverse=True
     )
+    stream_warmer.schedule([quality_ids[s["url"]] for s in streams])
 
     # Deduplicate stream names — Stremio collapses streams with identical names,
     # so when two files share the same caption we append (1), (2) ... to each duplicate.
@@ -0,0 +1,78 @@
+import asyncio
+from typing import AsyncIterator, Mapping, Optional, Union
+
+from fastapi.responses import Response
+
+from Backend.logger import LOGGER
+
+Chunk = Union[bytes, memoryview]
+
+
+class ChunkStreamResponse(Response):
+    """Streaming response for ``/dl`` that hands chunks straight to ``send``.
+
+    Starlette's ``StreamingResponse`` wraps every chunk in its own task
+    group plumbing and the stream generator used to await
+    ``request.is_disconnected()`` before each chunk.  Here the chunks
+    (``bytes`` or ``memoryview`` slices of them, never copies) go to the
+    ASGI server as they come, and one side task waits on ``receive()``
+    for ``http.disconnect``.  On disconnect ``disconnected`` is set and
+    the send loop is cancelled, which cancels the stream generator where
+    it waits for its next chunk.
+    """
+
+    def __init__(
+        self,
+        content: AsyncIterator[Chunk],
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        media_type: Optional[str] = None,
+        disconnected: Optional[asyncio.Event] = None,
+    ):
+        self.body_iterator = content
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.disconnected = disconnected if disconnected is not None else asyncio.Event()
+        self.init_headers(headers)
+
+    async def _watch_disconnect(self, receive, sender: asyncio.Task) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+        self.disconnected.set()
+        sender.cancel()
+
+    async def _send_body(self, send) -> None:
+        try:
+            async for chunk in self.body_iterator:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        except OSError:
+            # The server noticed the closed socket before receive() did
+            self.disconnected.set()
+        finally:
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    async def __call__(self, scope, receive, send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        sender = asyncio.create_task(self._send_body(send))
+        watcher = asyncio.create_task(self._watch_disconnect(receive, sender))
+        try:
+            await sender
+        except asyncio.CancelledError:
+            # Only swallow the cancellation the watcher caused, never our own
+            if asyncio.current_task().cancelling() or not self.disconnected.is_set():
+                raise
+            LOGGER.debug("Client disconnected; stopped sending %s", scope.get("path"))
+        finally:
+            watcher.cancel()
+            if not sender.done():
+                sender.cancel()
@@ -0,0 +1,86 @@
+from typing import Dict, Optional, Tuple
+
+# Bucket upper bounds (seconds) for GetFile chunk latency
+LATENCY_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 8.0, 15.0)
+MIN_SAMPLES = 20     # don't trust percentiles below this many observations
+DECAY_AT = 2000      # halve all counts once this many samples accumulate
+HEDGE_MIN_DELAY = 0.25  # never hedge a chunk earlier than this
+
+
+class LatencyHistogram:
+    """Bucketed chunk-latency histogram for one (bot, DC) pair.
+
+    Counts are halved periodically so percentiles follow the session's
+    current behaviour rather than its whole history.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0
+
+    def observe(self, seconds: float) -> None:
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                break
+        else:
+            i = len(LATENCY_BUCKETS)
+        self.counts[i] += 1
+        self.total += 1
+        if self.total >= DECAY_AT:
+            self.counts = [c // 2 for c in self.counts]
+            self.total = sum(self.counts)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if self.total < MIN_SAMPLES:
+            return None
+        target = self.total * p
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else LATENCY_BUCKETS[-1] * 2
+        return LATENCY_BUCKETS[-1] * 2
+
+
+chunk_latency: Dict[Tuple[int, int], LatencyHistogram] = {}
+hedge_stats = {"hedged": 0, "hedge_wins": 0, "primary_wins": 0}
+
+
+def observe_latency(client_index: int, dc_id: int, seconds: float) -> None:
+    key = (client_index, dc_id)
+    hist = chunk_latency.get(key)
+    if hist is None:
+        hist = chunk_latency[key] = LatencyHistogram()
+    hist.observe(seconds)
+
+
+def observe_cancelled(client_index: int, dc_id: int, seconds: float) -> None:
+    """Record a request cancelled after ``seconds`` only if it had already
+    outlived the (bot, DC)'s p95: it is then a lower bound on the slow tail.
+    Cancelled earlier (a hedge race it lost, a closed stream) it says
+    nothing about latency and would only pull the p95 down."""
+    hist = chunk_latency.get((client_index, dc_id))
+    p95 = hist.percentile(0.95) if hist else None
+    if p95 is not None and seconds >= p95:
+        hist.observe(seconds)
+
+
+def hedge_delay(client_index: int, dc_id: int) -> Optional[float]:
+    """How long to wait on a chunk before hedging it: the observed p95, or None
+    while there is not enough history for this (bot, DC)."""
+    hist = chunk_latency.get((client_index, dc_id))
+    p95 = hist.percentile(0.95) if hist else None
+    if p95 is None:
+        return None
+    return max(p95, HEDGE_MIN_DELAY)
+
+
+def latency_summary() -> Dict[str, Dict]:
+    return {
+        f"{idx}:{dc}": {
+            "samples": hist.total,
+            "p50": hist.percentile(0.5),
+            "p95": hist.percentile(0.95),
+        }
+        for (idx, dc), hist in chunk_latency.items()
+    }
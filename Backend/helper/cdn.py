@@ -0,0 +1,117 @@
+import asyncio
+from hashlib import sha256
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from pyrogram import Client, raw
+from pyrogram.crypto import aes
+from pyrogram.session import Session, Auth
+
+from Backend.helper.exceptions import CDNHashMismatch, CDNReuploadFailed
+from Backend.logger import LOGGER
+
+CdnSessionFactory = Callable[[Client, int], Awaitable[Session]]
+
+_cdn_sessions: Dict[Tuple[int, int], Session] = {}
+_cdn_lock = asyncio.Lock()
+
+
+async def get_cdn_session(client: Client, dc_id: int) -> Session:
+    """Shared media session to a CDN DC for ``client``.
+
+    CDN DCs get their own auth key and never an imported authorization:
+    they only ever see encrypted file parts.
+    """
+    key = (id(client), dc_id)
+    session = _cdn_sessions.get(key)
+    if session:
+        return session
+
+    async with _cdn_lock:
+        session = _cdn_sessions.get(key)
+        if session:
+            return session
+
+        test_mode = await client.storage.test_mode()
+        auth_key = await Auth(client, dc_id, test_mode).create()
+        session = Session(client, dc_id, auth_key, test_mode, is_media=True, is_cdn=True)
+        session.no_updates = True
+        session.timeout = 30
+        await session.start()
+
+        _cdn_sessions[key] = session
+        LOGGER.debug("Created CDN session for DC %s", dc_id)
+        return session
+
+
+class CdnFetcher:
+    """Download parts of one file that Telegram redirected to a CDN DC.
+
+    Parts come from ``upload.getCdnFile`` on the CDN DC, are decrypted with
+    AES-256-CTR using the redirect's key and an IV whose last 4 bytes are
+    ``offset / 16``, and every 128 KB block is checked against the SHA-256
+    hashes the main DC publishes for the file.  When the CDN doesn't hold
+    the part yet it answers ``cdnFileReuploadNeeded`` and the part is
+    pushed there through the bot's own media session.
+
+    ``session_factory`` (client, dc_id) -> Session can be swapped for a fake
+    CDN session.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        main_session: Session,
+        redirect: "raw.types.upload.FileCdnRedirect",
+        session_factory: Optional[CdnSessionFactory] = None,
+    ):
+        self.client = client
+        self.main_session = main_session
+        self.dc_id = redirect.dc_id
+        self.file_token = redirect.file_token
+        self.key = redirect.encryption_key
+        self.iv = redirect.encryption_iv
+        self.session_factory = session_factory or get_cdn_session
+        self.hashes: Dict[int, "raw.types.FileHash"] = {}
+        self._add_hashes(redirect.file_hashes)
+        self.reuploads = 0
+
+    def _add_hashes(self, hashes) -> None:
+        for h in hashes or []:
+            self.hashes[h.offset] = h
+
+    async def fetch(self, offset: int, limit: int) -> bytes:
+        session = await self.session_factory(self.client, self.dc_id)
+        for _ in range(3):
+            r = await session.send(
+                raw.functions.upload.GetCdnFile(file_token=self.file_token, offset=offset, limit=limit)
+            )
+            if not isinstance(r, raw.types.upload.CdnFileReuploadNeeded):
+                break
+            self.reuploads += 1
+            hashes = await self.main_session.send(
+                raw.functions.upload.ReuploadCdnFile(file_token=self.file_token, request_token=r.request_token)
+            )
+            self._add_hashes(hashes)
+        else:
+            raise CDNReuploadFailed(f"CDN DC {self.dc_id} kept asking for a reupload at offset {offset}")
+
+        iv = bytearray(self.iv[:-4] + (offset // 16).to_bytes(4, "big"))
+        data = aes.ctr256_decrypt(r.bytes, self.key, iv)
+        await self._verify(offset, data)
+        return data
+
+    async def _verify(self, offset: int, data: bytes) -> None:
+        pos = 0
+        while pos < len(data):
+            h = self.hashes.get(offset + pos)
+            if h is None:
+                self._add_hashes(await self.main_session.send(
+                    raw.functions.upload.GetCdnFileHashes(file_token=self.file_token, offset=offset + pos)
+                ))
+                h = self.hashes.get(offset + pos)
+                if h is None:
+                    raise CDNHashMismatch(f"No CDN hash for offset {offset + pos}")
+            block = data[pos:pos + h.limit]
+            if sha256(block).digest() != h.hash:
+                raise CDNHashMismatch(f"CDN block at offset {offset + pos} failed verification")
+            pos += h.limit
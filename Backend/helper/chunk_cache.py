@@ -0,0 +1,95 @@
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+from Backend.config import Telegram
+from Backend.logger import LOGGER
+
+
+class ChunkCache:
+    """Process-wide cache of ``upload.GetFile`` chunks shared by every stream.
+
+    Keys are ``(file unique_id, aligned offset, chunk size)`` so two viewers
+    reading the same region of the same file hit the same entry regardless of
+    which bot fetched it.  The cache is bounded by a byte budget rather than
+    an entry count because chunk sizes vary from 512 KB to 4 MB.
+
+    Eviction is LRU with a frequency "second chance": an entry that was hit
+    since it last reached the cold end is moved back to the hot end once
+    instead of being dropped, so popular chunks survive a burst of one-off
+    reads (seeks, probes) that would flush a plain LRU.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(0, max_bytes)
+        self._entries: "OrderedDict[Hashable, Tuple[bytes, int]]" = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(file_id, offset: int, chunk_size: int) -> Tuple:
+        unique_id = getattr(file_id, "unique_id", None) or getattr(file_id, "media_id", None)
+        return unique_id, offset, chunk_size
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        data, freq = entry
+        self._entries[key] = (data, freq + 1)
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return data
+
+    def put(self, key: Hashable, data: Optional[bytes]) -> None:
+        if not data or not self.max_bytes:
+            return
+
+        size = len(data)
+        if size > self.max_bytes:
+            return
+
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.current_bytes -= len(old[0])
+
+        self._entries[key] = (data, 0)
+        self.current_bytes += size
+        self._evict()
+
+    def _evict(self) -> None:
+        while self.current_bytes > self.max_bytes and self._entries:
+            key, (data, freq) = next(iter(self._entries.items()))
+            if freq > 0:
+                # Recently re-read: give it one more trip through the list.
+                self._entries[key] = (data, 0)
+                self._entries.move_to_end(key)
+                continue
+            del self._entries[key]
+            self.current_bytes -= len(data)
+            self.evictions += 1
+
+    def clear(self) -> int:
+        count = len(self._entries)
+        self._entries.clear()
+        self.current_bytes = 0
+        LOGGER.debug("ChunkCache: cleared %s entries", count)
+        return count
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+chunk_cache = ChunkCache(Telegram.CHUNK_CACHE_MB * 1024 * 1024)
@@ -0,0 +1,163 @@
+import time
+from typing import Dict, Optional, Tuple
+
+from Backend.logger import LOGGER
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+FAILURE_THRESHOLD = 3   # consecutive failures that trip a closed breaker
+BASE_COOLDOWN = 5.0     # seconds a freshly tripped breaker stays open
+MAX_COOLDOWN = 60.0     # cap for the doubling cooldown after failed probes
+
+
+class CircuitBreaker:
+    """Health state of one (bot, DC) media session.
+
+    closed    - traffic flows; consecutive failures are counted.
+    open      - the session is isolated until ``retry_at``.
+    half_open - the cooldown has passed and a single cheap probe is in
+                flight; its result closes the breaker or re-opens it with a
+                doubled cooldown.
+
+    Any success closes the breaker and resets the cooldown, so a bot that
+    had one bad burst is back as soon as it answers again.
+
+    Separately, a FloodWait holds the session until Telegram's deadline
+    (``held_until``) without touching the state machine: the session is
+    healthy, just rate limited.
+    """
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.cooldown = BASE_COOLDOWN
+        self.retry_at = 0.0
+        self.held_until = 0.0
+        self.trips = 0
+        self.last_error: Optional[str] = None
+
+    def allow(self) -> bool:
+        return self.state == CLOSED and time.time() >= self.held_until
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+        self.cooldown = BASE_COOLDOWN
+
+    def record_failure(self, reason: str) -> bool:
+        """Count a failure; return True if this call tripped the breaker open."""
+        self.last_error = reason
+        if self.state == HALF_OPEN:
+            self.cooldown = min(self.cooldown * 2, MAX_COOLDOWN)
+            self._open()
+            return False
+        if self.state == OPEN:
+            return False
+        self.failures += 1
+        if self.failures >= FAILURE_THRESHOLD:
+            self._open()
+            self.trips += 1
+            return True
+        return False
+
+    def _open(self) -> None:
+        self.state = OPEN
+        self.retry_at = time.time() + self.cooldown
+
+    def begin_probe(self) -> bool:
+        """Move an open breaker whose cooldown has passed to half-open."""
+        if self.state == OPEN and time.time() >= self.retry_at:
+            self.state = HALF_OPEN
+            return True
+        return False
+
+
+class BreakerBoard:
+    """Circuit breakers for every (bot, DC) pair, created on first use."""
+
+    def __init__(self):
+        self._breakers: Dict[Tuple[int, int], CircuitBreaker] = {}
+
+    def get(self, client_index: int, dc_id: int) -> CircuitBreaker:
+        key = (client_index, dc_id)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = CircuitBreaker()
+        return breaker
+
+    def allow(self, client_index: int, dc_id: int) -> bool:
+        breaker = self._breakers.get((client_index, dc_id))
+        return breaker is None or breaker.allow()
+
+    def state(self, client_index: int, dc_id: int) -> str:
+        breaker = self._breakers.get((client_index, dc_id))
+        return breaker.state if breaker is not None else CLOSED
+
+    def hold(self, client_index: int, dc_id: int, seconds: float, reason: str) -> None:
+        """Keep a rate-limited (bot, DC) out of rotation until its FloodWait deadline."""
+        breaker = self.get(client_index, dc_id)
+        breaker.held_until = max(breaker.held_until, time.time() + seconds)
+        breaker.last_error = reason
+
+        stats = flood_stats.setdefault(client_index, {"floods": 0, "wait_seconds": 0, "last_wait": 0, "last_dc": None})
+        stats["floods"] += 1
+        stats["wait_seconds"] += seconds
+        stats["last_wait"] = seconds
+        stats["last_dc"] = dc_id
+        LOGGER.warning("%s on client %s DC %s: holding it for %ss", reason, client_index, dc_id, seconds)
+
+    def held_for(self, client_index: int, dc_id: int) -> float:
+        breaker = self._breakers.get((client_index, dc_id))
+        return max(0.0, breaker.held_until - time.time()) if breaker is not None else 0.0
+
+    def ready_in(self, client_index: int, dc_id: int) -> float:
+        """Seconds until ``allow()`` may turn true: the FloodWait hold, or the
+        cooldown of an open breaker (a half-open one waits for its probe)."""
+        breaker = self._breakers.get((client_index, dc_id))
+        if breaker is None:
+            return 0.0
+        now = time.time()
+        wait = max(0.0, breaker.held_until - now)
+        if breaker.state == OPEN:
+            wait = max(wait, breaker.retry_at - now)
+        elif breaker.state == HALF_OPEN:
+            wait = max(wait, 1.0)
+        return wait
+
+    def bot_held_for(self, client_index: int) -> float:
+        """Longest remaining FloodWait hold of a bot across all DCs."""
+        return max((self.held_for(idx, dc) for idx, dc in self._breakers if idx == client_index), default=0.0)
+
+    def record_success(self, client_index: int, dc_id: int) -> None:
+        breaker = self._breakers.get((client_index, dc_id))
+        if breaker is not None and breaker.state != CLOSED:
+            LOGGER.info("Circuit closed for client %s DC %s", client_index, dc_id)
+        if breaker is not None:
+            breaker.record_success()
+
+    def record_failure(self, client_index: int, dc_id: int, reason: str) -> bool:
+        tripped = self.get(client_index, dc_id).record_failure(reason)
+        if tripped:
+            LOGGER.warning("Circuit opened for client %s DC %s: %s", client_index, dc_id, reason)
+        return tripped
+
+    def snapshot(self) -> Dict[str, Dict]:
+        now = time.time()
+        return {
+            f"{idx}:{dc}": {
+                "state": b.state,
+                "failures": b.failures,
+                "trips": b.trips,
+                "retry_in": round(max(0.0, b.retry_at - now), 1) if b.state == OPEN else 0,
+                "held_for": round(max(0.0, b.held_until - now), 1),
+                "last_error": b.last_error,
+            }
+            for (idx, dc), b in self._breakers.items()
+        }
+
+
+# Per-bot FloodWait counters for the admin dashboard
+flood_stats: Dict[int, Dict] = {}
+breakers = BreakerBoard()
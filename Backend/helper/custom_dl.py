@@ -6,18 +6,43 @@ from typing import Dict, List, Union, Optional, Tuple
 import traceback
 from fastapi import Request
 from pyrogram import Client, raw, utils
-from pyrogram.errors import AuthBytesInvalid
+from pyrogram.errors import AuthBytesInvalid, Unauthorized, Flood, RPCError, FileReferenceExpired, FileReferenceInvalid
 from pyrogram.file_id import FileId, FileType, ThumbnailSource
 from pyrogram.session import Session, Auth
 from Backend.logger import LOGGER
-from Backend.helper.exceptions import FIleNotFound
-from Backend.helper.pyro import get_file_ids
+from Backend.helper.file_resolver import file_resolver
+from Backend.helper.chunk_cache import chunk_cache
+from Backend.helper.range_cache import range_cache
+from Backend.helper.single_flight import SingleFlight
+from Backend.helper.readahead import ReadaheadPolicy, AimdController, BitratePacer, MAX_GETFILE_LIMIT
+from Backend.helper.bot_metrics import observe_latency, observe_cancelled, hedge_delay, hedge_stats
+from Backend.helper.memory_governor import memory_governor
+from Backend.helper.viewer_session import ViewerSession
+from Backend.helper.scheduler import scheduler
+from Backend.helper.circuit_breaker import breakers, CLOSED
+from Backend.helper.cdn import CdnFetcher
+from Backend.helper.exceptions import CDNFetchFailed
+from Backend.helper.session_pool import MediaSessionPool, pool_for
+from Backend.helper.session_store import session_store
+from Backend.config import Telegram
 from Backend import db
 from Backend.pyrofork.bot import work_loads, multi_clients, client_dc_map, client_failures, client_avg_mbps
 
 ACTIVE_STREAMS: Dict[str, Dict] = {}
 RECENT_STREAMS = deque(maxlen=3)
 
+# Concurrent GetFile calls for the same (file, offset, limit) share one request
+getfile_flights = SingleFlight()
+
+GETFILE_TIMEOUT = 15.0    # seconds one GetFile may take before it counts against its bot
+TAIL_BYTES = 1024 * 1024  # end of the file fetched alongside the head on first open
+TAIL_TTL = 600            # seconds the tail stays in the range cache
+DONATE_TTL = 60           # seconds undelivered chunks of an aborted stream stay in the range cache
+CDN_RETRY_AFTER = 600     # seconds a file whose CDN download failed is only fetched from its main DC
+tail_stats = {"started": 0, "cached": 0, "failed": 0}
+_tail_fetches = set()     # unique ids whose tail is being fetched
+_cdn_failed: Dict[str, float] = {}  # unique id -> when its CDN download last failed
+
 
 def get_adaptive_chunk_size(client_index: int) -> int:
     """Return the best chunk size (bytes) for this client based on recent speed.
@@ -27,7 +52,12 @@ def get_adaptive_chunk_size(client_index: int) -> int:
       5-20 MB/s  →   1 MB  (default)
       20-60 MB/s →   2 MB  (fewer round-trips on fast sessions)
       > 60 MB/s  →   4 MB  (maximise throughput on very fast sessions)
+
+    While the memory governor is under pressure every client gets 512 KB.
     """
+    if memory_governor.under_pressure():
+        # Stream buffers are close to the memory budget; keep new ones small
+        return 512 * 1024
     speed = client_avg_mbps.get(client_index, 0.0)
     if speed >= 60:
         return 4 * 1024 * 1024
@@ -38,82 +68,227 @@ def get_adaptive_chunk_size(client_index: int) -> int:
     # Unknown speed or < 5 MB/s → start conservative
     return 512 * 1024
 
+def getfile_windows(start: int, end: int) -> List[Tuple[int, int]]:
+    """Smallest legal ``upload.GetFile`` (offset, limit) windows covering bytes start..end.
+
+    Telegram requires the offset to be a multiple of 4 KB, the limit to be
+    a multiple of 4 KB dividing 1 MB, and a window not to cross a 1 MB
+    boundary; the offset need not be a multiple of the limit.  Each window
+    starts at its first byte rounded down to 4 KB and takes the smallest
+    power of two that covers the rest of its piece without leaving the
+    1 MB block.  A range crossing a 1 MB boundary gets one window per side.
+    """
+    windows = []
+    pos = start
+    while pos <= end:
+        offset = pos - pos % ByteStreamer.PROBE_BLOCK
+        block_end = offset - offset % MAX_GETFILE_LIMIT + MAX_GETFILE_LIMIT
+        need = min(end + 1, block_end) - offset
+        limit = ByteStreamer.PROBE_BLOCK
+        while limit < need:
+            limit *= 2
+        # Rounding up may overshoot the block: take what fits, the loop covers the rest
+        while offset + limit > block_end:
+            limit //= 2
+        windows.append((offset, limit))
+        pos = offset + limit
+    return windows
+
+
 class ByteStreamer:
     CHUNK_SIZE = 1024 * 1024  # 1 MB
-    CLEAN_INTERVAL = 30 * 60  # 30 minutes
+    PROBE_BLOCK = 4096  # smallest legal upload.GetFile window
+    SMALL_RANGE = 128 * 1024  # ranges up to this size are read by read_probe
     _instances: Dict[int, "ByteStreamer"] = {}  # client_index → streamer (for fallback)
+    # (client, dc_id) → lock; shared by every streamer of a client, one per DC so DCs connect in parallel
+    _session_locks: Dict[Tuple[int, int], asyncio.Lock] = {}
 
     def __init__(self, client: Client, client_index: int = -1):
         self.client = client
         self.client_index = client_index
-        self._file_id_cache: Dict[int, FileId] = {}
-        self._session_lock = asyncio.Lock()
         # Register this streamer so fallback logic can reuse it
         if client_index >= 0:
             ByteStreamer._instances[client_index] = self
-        asyncio.create_task(self._clean_cache())
-        asyncio.create_task(self._prewarm_sessions())
 
-    async def _prewarm_sessions(self):
-        common_dcs = [1, 2, 4, 5]  # Main Telegram DCs
-        LOGGER.debug("Pre-warming media sessions for common DCs...")
-        
-        for dc in common_dcs:
+    async def _open_media_session(self, dc: int) -> Session:
+        """Start an authorized media session to ``dc``.
+
+        A non-home DC reuses the auth key kept in the session store, which
+        is already authorized there.  Only without one, or when the DC no
+        longer accepts it, a new key is created and the bot's authorization
+        exported to it; that key is then stored for the next start.
+        A stored key that can't be checked for any reason is treated like a
+        rejected one.  A session that fails is always stopped, and if the
+        authorization can't be imported the error is raised rather than an
+        unauthorized session returned.
+        """
+        test_mode = await self.client.storage.test_mode()
+        current_dc = await self.client.storage.dc_id()
+
+        if dc == current_dc:
+            return await self._start_media_session(dc, await self.client.storage.auth_key(), test_mode)
+
+        stored = session_store.media_key(self.client, dc)
+        if stored:
+            session = None
+            verified = False
             try:
-                if dc in self.client.media_sessions:
-                    LOGGER.debug(f"Media session for DC {dc} already exists, skipping")
-                    continue
+                session = await self._start_media_session(dc, stored, test_mode)
+                await session.send(raw.functions.users.GetUsers(id=[raw.types.InputUserSelf()]))
+                verified = True
+                session_store.reused += 1
+                LOGGER.debug("Reused stored auth key for DC %s", dc)
+                return session
+            except (AuthBytesInvalid, Unauthorized) as e:
+                LOGGER.debug("Stored auth key for DC %s rejected (%s); re-authorizing", dc, e)
+                session_store.forget_media_key(self.client, dc)
+            except Exception as e:
+                LOGGER.debug("Could not check stored auth key for DC %s (%s); re-authorizing", dc, e)
+            finally:
+                if session is not None and not verified:
+                    await self._stop_media_session(session)
+
+        auth_key = await Auth(self.client, dc, test_mode).create()
+        session = await self._start_media_session(dc, auth_key, test_mode)
+        try:
+            error = None
+            for _ in range(6):
+                try:
+                    exported = await self.client.invoke(raw.functions.auth.ExportAuthorization(dc_id=dc))
+                    await session.send(raw.functions.auth.ImportAuthorization(id=exported.id, bytes=exported.bytes))
+                    break
+                except AuthBytesInvalid as e:
+                    error = e
+                    LOGGER.debug("AuthBytesInvalid during media session import for DC %s; retrying...", dc)
+                    await asyncio.sleep(0.5)
+                except OSError as e:
+                    error = e
+                    LOGGER.debug("OSError during media session import for DC %s; retrying...", dc)
+                    await asyncio.sleep(1)
+            else:
+                LOGGER.warning("Could not authorize media session for DC %s: %s", dc, error)
+                raise error
+        except BaseException:
+            # Never hand out (or leak) a session the DC doesn't accept
+            await self._stop_media_session(session)
+            raise
+        session_store.save_media_key(self.client, dc, auth_key)
+        session_store.created += 1
+        return session
+
+    async def _start_media_session(self, dc: int, auth_key: bytes, test_mode: bool) -> Session:
+        session = Session(self.client, dc, auth_key, test_mode, is_media=True)
+        session.no_updates = True
+        session.timeout = 30
+        session.sleep_threshold = 60
+        await session.start()
+        return session
 
-                test_mode = await self.client.storage.test_mode()
-                current_dc = await self.client.storage.dc_id()
- 
-                if dc == current_dc:
-                    continue
-                
-                auth_key = await Auth(self.client, dc, test_mode).create()
-                session = Session(self.client, dc, auth_key, test_mode, is_media=True)
-                session.no_updates = True
-                session.timeout = 30
-                session.sleep_threshold = 60
-                
-                await session.start()
-                
-                for attempt in range(6):
-                    try:
-                        exported = await self.client.invoke(
-                            raw.functions.auth.ExportAuthorization(dc_id=dc)
-                        )
-                        await session.send(
-                            raw.functions.auth.ImportAuthorization(
-                                id=exported.id, bytes=exported.bytes
+    @staticmethod
+    async def _stop_media_session(session: Session) -> None:
+        try:
+            await session.stop()
+        except Exception as e:
+            LOGGER.debug("Stopping media session for DC %s failed: %s", getattr(session, "dc_id", None), e)
+
+    async def get_file_properties(self, chat_id: int, message_id: int) -> FileId:
+        return await file_resolver.resolve(self.client, self.client_index, chat_id, message_id)
+
+    async def read_probe(self, file_id: FileId, start: int, end: int) -> Optional[bytes]:
+        """Read a small range (up to SMALL_RANGE) with the smallest legal GetFile windows.
+
+        Used for probes such as ``bytes=0-1023`` and the 64 KB hash reads
+        of subtitle addons: each piece costs a 4-64 KB GetFile instead of a
+        multi-MB adaptive chunk, and it bypasses prefetch_stream entirely,
+        so no registry entry is created and no work_loads slot is taken.
+        """
+        warmed = range_cache.take(file_id, start, end - start + 1)
+        if warmed is not None:
+            return warmed
+        parts = []
+        media_session = location = None
+        for block, limit in getfile_windows(start, end):
+            cache_key = chunk_cache.make_key(file_id, block, limit)
+            data = chunk_cache.get(cache_key)
+            if data is None:
+                if media_session is None:
+                    media_session = await self._get_media_session(file_id)
+                    location = await self._get_location(file_id)
+                r = await asyncio.wait_for(
+                    getfile_flights.run(
+                        cache_key,
+                        lambda block=block, limit=limit: media_session.send(
+                            raw.functions.upload.GetFile(
+                                location=location, offset=block, limit=limit
                             )
-                        )
-                        break
-                    except AuthBytesInvalid:
-                        LOGGER.debug(f"AuthBytesInvalid during pre-warm for DC {dc}; retrying...")
-                        await asyncio.sleep(0.5)
-                    except OSError:
-                        LOGGER.debug(f"OSError during pre-warm for DC {dc}; retrying...")
-                        await asyncio.sleep(1)
-                    except Exception as e:
-                        LOGGER.debug(f"Error during pre-warm for DC {dc}: {e}")
-                        break
-                
-                self.client.media_sessions[dc] = session
-                LOGGER.debug(f"Pre-warmed media session for DC {dc}")
-                
+                        ),
+                    ),
+                    timeout=15.0,
+                )
+                data = getattr(r, "bytes", None) if r else None
+                if not data:
+                    return None
+                chunk_cache.put(cache_key, data)
+            parts.append(data[max(start, block) - block:end - block + 1])
+        return b"".join(parts)
+
+    def prefetch_tail(self, file_id: FileId) -> None:
+        """Fetch the last TAIL_BYTES of the file in the background.
+
+        MKV players jump to the end for Cues right after reading the head,
+        and MP4s without faststart keep their moov there.  Started on the
+        first open of a file, in parallel with the head, so that follow-up
+        request is served from the range cache instead of a cold pipeline.
+        """
+        size = file_id.file_size or 0
+        key = getattr(file_id, "unique_id", None)
+        if size <= 2 * TAIL_BYTES or key in _tail_fetches or range_cache.covers(file_id, size - 1):
+            return
+        _tail_fetches.add(key)
+        tail_stats["started"] += 1
+
+        async def fetch():
+            try:
+                offset, data = await self.read_blocks(file_id, size - TAIL_BYTES, TAIL_BYTES)
+                range_cache.put(file_id, offset, data, TAIL_TTL)
+                tail_stats["cached"] += 1
             except Exception as e:
-                LOGGER.debug(f"Could not pre-warm DC {dc}: {e}")
-                continue
+                tail_stats["failed"] += 1
+                LOGGER.debug("Tail prefetch failed for %s: %s", key, e)
+            finally:
+                _tail_fetches.discard(key)
 
-    async def get_file_properties(self, chat_id: int, message_id: int) -> FileId:
-        if message_id not in self._file_id_cache:
-            file_id = await get_file_ids(self.client, int(chat_id), int(message_id))
-            if not file_id:
-                LOGGER.warning("Message %s not found", message_id)
-                raise FIleNotFound
-            self._file_id_cache[message_id] = file_id
-        return self._file_id_cache[message_id]
+        asyncio.create_task(fetch())
+
+    async def read_blocks(self, file_id: FileId, start: int, length: int) -> Tuple[int, bytes]:
+        """Read whole 1 MB GetFile blocks covering ``length`` bytes from ``start``.
+
+        Returns the block-aligned offset and the bytes read from it (shorter
+        at end of file).  Used to warm ranges before a viewer asks for them.
+        """
+        block_size = 1024 * 1024
+        first = start - (start % block_size)
+        media_session = await self._get_media_session(file_id)
+        location = await self._get_location(file_id)
+        parts = []
+        for off in range(first, start + length, block_size):
+            cache_key = chunk_cache.make_key(file_id, off, block_size)
+            r = await asyncio.wait_for(
+                getfile_flights.run(
+                    cache_key,
+                    lambda off=off: media_session.send(
+                        raw.functions.upload.GetFile(location=location, offset=off, limit=block_size)
+                    ),
+                ),
+                timeout=15.0,
+            )
+            data = getattr(r, "bytes", None) if r else None
+            if not data:
+                break
+            parts.append(data)
+            if len(data) < block_size:
+                break
+        return first, b"".join(parts)
 
     async def prefetch_stream(
         self,
@@ -129,7 +304,32 @@ class ByteStreamer:
         meta: Optional[dict] = None,
         parallelism: int = 2,
         request: Optional[Request] = None,
+        stripe_clients: Optional[List[int]] = None,
+        viewer: Optional[ViewerSession] = None,
+        disconnected: Optional[asyncio.Event] = None,
     ):
+        """Return an async generator yielding the requested byte range.
+
+        With ``stripe_clients`` (primary first) consecutive chunks are spread
+        round-robin across those bots' media sessions for the file's DC and
+        reassembled in order, so one stream can use more than one bot's
+        bandwidth.  ``work_loads`` is charged 1/N per striped bot.
+
+        With a ``viewer`` session, a range that starts inside or just after
+        the session's last window starts warm: no lazy probing phase, the
+        previous AIMD operating point, and the undelivered chunks of the last
+        window served without a fetch.  When the stream ends the session is
+        updated with this stream's window and tail.
+
+        Edge chunks are yielded as ``memoryview`` slices rather than copies.
+        With ``disconnected`` (set by ``ChunkStreamResponse``'s disconnect
+        watcher) the generator checks the event between chunks instead of
+        polling ``request.is_disconnected()``.  However the stream ends, its
+        outstanding fetches are cancelled and its ``work_loads`` share freed
+        at once, and chunks fetched but not delivered are kept in the range
+        cache for ``DONATE_TTL`` seconds (beyond what the viewer's tail holds)
+        so the player's reconnect a little further on starts from memory.
+        """
         if not stream_id:
             stream_id = secrets.token_hex(8)
 
@@ -148,83 +348,344 @@ class ByteStreamer:
             "peak_mbps": 0.0,
             "recent_measurements": deque(maxlen=3),
             "status": "active",
+            "cache_hits": 0,
+            "hedged_chunks": 0,
+            "readahead_parallel": 1,
+            "prefetched_bytes": 0,
+            "wasted_prefetch_bytes": 0,
+            "prefetch_bytes_saved": 0,
+            "warm_start": False,
+            "tail_hits": 0,
+            "warm_hits": 0,
+            "cancelled_fetches": 0,
+            "donated_bytes": 0,
+            "reference_refreshes": 0,
+            "cdn_chunks": 0,
             "part_count": part_count,
             "prefetch": prefetch,
             "meta": meta or {},
         }
 
+        media_session = await self._get_media_session(file_id)
+        location = await self._get_location(file_id)
+
+        stripe_sessions = {client_index: media_session}
+        for idx in stripe_clients or []:
+            if idx in stripe_sessions or idx not in multi_clients:
+                continue
+            try:
+                stripe_sessions[idx] = await ByteStreamer.for_client(idx)._get_media_session(file_id)
+            except Exception as e:
+                LOGGER.debug("Stripe: skipping client %s for stream %s: %s", idx, stream_id, e)
+        stripe = list(stripe_sessions)
+        load_share = 1 if len(stripe) == 1 else 1 / len(stripe)
+        bytes_by_client: Dict[int, int] = {idx: 0 for idx in stripe}
+        registry_entry["stripe_clients"] = stripe
+        registry_entry["bytes_by_client"] = bytes_by_client
+
         ACTIVE_STREAMS[stream_id] = registry_entry
-        work_loads[client_index] += 1
+        memory_governor.register(stream_id)
+        for idx in stripe:
+            work_loads[idx] = work_loads.get(idx, 0) + load_share
+
+        # Absolute byte range requested by the client (end exclusive)
+        range_start = offset + first_part_cut
+        range_end = offset + (part_count - 1) * chunk_size + last_part_cut
 
         queue_maxsize = max(1, prefetch)
-        q: asyncio.Queue = asyncio.Queue(maxsize=queue_maxsize)
         stop_event = asyncio.Event()
-
-        media_session = await self._get_media_session(file_id)
-        location = await self._get_location(file_id)
-
-        async def fetch_chunk_with_retries(seq_idx: int, off: int) -> Tuple[int, Optional[bytes]]:
+        drained = asyncio.Event()
+        readahead = ReadaheadPolicy()
+        aimd = AimdController(parallelism, prefetch, chunk_size)
+        warm = viewer is not None and viewer.is_near(range_start)
+        if viewer is not None:
+            viewer.active += 1
+            viewer.requests += 1
+        if warm:
+            viewer.warm_starts += 1
+            registry_entry["warm_start"] = True
+            readahead.skip_probing()
+            aimd.resume(viewer.parallel, viewer.prefetch)
+        registry_entry["aimd"] = aimd.snapshot()
+        pacer = BitratePacer.for_file(file_id.file_size, (meta or {}).get("runtime"), range_start)
+        registry_entry["pacing"] = pacer.snapshot() if pacer else None
+        delivered_to = range_start  # absolute end of what the client has drained
+        q: asyncio.Queue = asyncio.Queue(maxsize=aimd.max_prefetch)
+        reserved_sizes: Dict[int, int] = {}  # chunk offset -> bytes reserved from the governor
+        chunk_offsets: Dict[int, int] = {}  # seq -> absolute offset, until handed to the queue
+        results_buffer: Dict[int, bytes] = {}  # seq -> fetched chunk waiting for its turn
+        scheduled_tasks: Dict[int, asyncio.Task] = {}  # seq -> fetch_chunk_with_retries task
+
+        def best_other_client(exclude: int) -> Optional[int]:
+            # The bot with the most spare capacity for this DC, other than ``exclude``
+            return scheduler.best_other(file_id.dc_id, exclude)
+
+        cdn_fetchers: Dict[int, CdnFetcher] = {}  # client index -> CDN redirect it received
+
+        file_key = getattr(file_id, "unique_id", None)
+
+        async def get_file(idx: int, session: MediaSessionPool, off: int, limit: int):
+            fetcher = cdn_fetchers.get(idx)
+            if fetcher is None:
+                use_cdn = Telegram.CDN_DOWNLOADS and time.time() - _cdn_failed.get(file_key, 0) > CDN_RETRY_AFTER
+                r = await asyncio.wait_for(
+                    session.send(
+                        raw.functions.upload.GetFile(
+                            location=location, offset=off, limit=limit,
+                            cdn_supported=use_cdn or None,
+                        )
+                    ),
+                    timeout=GETFILE_TIMEOUT,
+                )
+                if not isinstance(r, raw.types.upload.FileCdnRedirect):
+                    return r
+                fetcher = cdn_fetchers[idx] = CdnFetcher(multi_clients.get(idx, self.client), session, r)
+                registry_entry["cdn_dc"] = r.dc_id
+                LOGGER.debug("Stream %s redirected to CDN DC %s via client %s", stream_id, r.dc_id, idx)
+            try:
+                data = await asyncio.wait_for(fetcher.fetch(off, limit), timeout=GETFILE_TIMEOUT)
+            except Exception as e:
+                # Asking again with cdn_supported would only redirect back to
+                # the same CDN: fetch this file from its main DC for a while.
+                cdn_fetchers.clear()
+                now = time.time()
+                for key in [k for k, t in _cdn_failed.items() if now - t > CDN_RETRY_AFTER]:
+                    del _cdn_failed[key]
+                _cdn_failed[file_key] = now
+                LOGGER.warning("CDN DC %s failed for stream %s, using the main DC: %r", fetcher.dc_id, stream_id, e)
+                raise CDNFetchFailed(f"CDN DC {fetcher.dc_id} failed at offset {off}") from e
+            registry_entry["cdn_chunks"] += 1
+            return raw.types.upload.File(type=raw.types.storage.FilePartial(), mtime=0, bytes=data)
+
+        async def timed_send(idx: int, session: MediaSessionPool, off: int, limit: int, cache_key, primary: bool = True):
+            async def send():
+                sent = time.perf_counter()
+                # Charged here, not by the caller: a joined request's flood
+                # or timeout belongs to the bot that sent it, not to every
+                # waiter's.
+                try:
+                    r = await get_file(idx, session, off, limit)
+                except asyncio.CancelledError:
+                    if primary:
+                        observe_cancelled(idx, file_id.dc_id, time.perf_counter() - sent)
+                    raise
+                except asyncio.TimeoutError:
+                    client_failures[idx] = client_failures.get(idx, 0) + 1
+                    session_failed(idx, "timeout")
+                    raise
+                except Flood as e:
+                    wait = getattr(e, "value", None)
+                    breakers.hold(idx, file_id.dc_id, int(wait) if isinstance(wait, int) else 5, type(e).__name__)
+                    raise
+                except (RPCError, CDNFetchFailed):
+                    # Telegram answered an RPC error, or the CDN DC failed:
+                    # this bot's own session is fine
+                    raise
+                except Exception as e:
+                    session_failed(idx, type(e).__name__)
+                    raise
+                # Only requests that really went out feed the scheduler and
+                # the latency histogram, under the bot that sent them.
+                elapsed = time.perf_counter() - sent
+                scheduler.observe(idx, file_id.dc_id, len(r.bytes), elapsed)
+                breakers.record_success(idx, file_id.dc_id)
+                observe_latency(idx, file_id.dc_id, elapsed)
+                return r
+
+            # Only answers feed the latency histogram: an RPC error such as a
+            # FloodWait returns at once and a hedge loser is cancelled early,
+            # and either would pull the p95 (and so the hedge delay) down.
+            # A primary cancelled past the p95 still counts, as a lower bound;
+            # a shared request is only cancelled once its last waiter left.
+            # The hedge must not join the primary's in-flight request.
+            return await (getfile_flights.run(cache_key, send) if primary else send())
+
+        async def hedged_send(idx: int, session: MediaSessionPool, off: int, limit: int, cache_key):
+            """Send one GetFile; if it outlives this (bot, DC)'s observed p95,
+            race a duplicate on the next-best bot and cancel the loser.
+
+            Returns ``(result, client_index_that_answered)``.
+            """
+            primary = asyncio.ensure_future(timed_send(idx, session, off, limit, cache_key))
+            tasks = {primary: idx}
+            try:
+                delay = hedge_delay(idx, file_id.dc_id) if Telegram.HEDGE_REQUESTS else None
+                if delay is not None:
+                    done, _ = await asyncio.wait({primary}, timeout=delay)
+                    hedge_idx = None if done else best_other_client(idx)
+                    if hedge_idx is not None:
+                        try:
+                            hedge_session = await ByteStreamer.for_client(hedge_idx)._get_media_session(file_id)
+                            hedge = asyncio.ensure_future(
+                                timed_send(hedge_idx, hedge_session, off, limit, cache_key, primary=False)
+                            )
+                            tasks[hedge] = hedge_idx
+                            hedge_stats["hedged"] += 1
+                            registry_entry["hedged_chunks"] += 1
+                            LOGGER.debug("Hedging chunk off=%s: client %s → %s after %.2fs", off, idx, hedge_idx, delay)
+                        except Exception as e:
+                            LOGGER.debug("Hedge session for client %s unavailable: %s", hedge_idx, e)
+
+                pending = set(tasks)
+                error = None
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            if len(tasks) > 1:
+                                hedge_stats["primary_wins" if task is primary else "hedge_wins"] += 1
+                            return task.result(), tasks[task]
+                        error = task.exception()
+                raise error
+            finally:
+                for task in tasks:
+                    if not task.done():
+                        task.cancel()
+
+        def session_failed(idx: int, reason: str) -> None:
+            if breakers.record_failure(idx, file_id.dc_id, reason):
+                asyncio.create_task(probe_when_due(idx, file_id))
+
+        async def refresh_location(stale) -> None:
+            # Swap in a fresh file reference once per expiry: chunks that
+            # failed with an already replaced location just retry.
+            nonlocal location
+            if location is not stale:
+                return
+            fresh = await file_resolver.refresh_reference(file_id)
+            if location is stale:
+                location = await self._get_location(fresh)
+                registry_entry["reference_refreshes"] += 1
+                if viewer is not None:
+                    viewer.file_id = fresh
+                    viewer.file_id_at = time.time()
+                LOGGER.info("Refreshed expired file reference for stream %s", stream_id)
+
+        async def fetch_chunk_with_retries(seq_idx: int, off: int, limit: int) -> Tuple[int, Optional[bytes]]:
             """Fetch one chunk with timeout, exponential back-off, and bot fallback.
 
+            Each chunk's home bot is its stripe slot (the primary client when
+            striping is off).
+
             Retry schedule (max 6 tries):
-              tries 0-2  → same bot / same session, 15 s timeout each
+              tries 0-2  → home bot / same session, 15 s timeout each
               tries 3-5  → try a healthier fallback bot (if available),
                            still with 15 s timeout
-            On every TimeoutError the primary client's failure counter is incremented
-            so select_best_client will avoid it for future requests.
+            While the home bot's circuit breaker for this DC is not closed the
+            fallback is used from the first try.
+            A GetFile that times out charges the failure counter and breaker
+            of the bot that sent it, and the stream's AIMD controller backs off.
+            A failed CDN download charges no bot; the file is fetched from its
+            main DC (without cdn_supported) for CDN_RETRY_AFTER seconds.
+            An expired or invalid file reference re-resolves the FileId (once
+            for the whole stream, see refresh_location) and the same offset is
+            retried straight away with the new location.
+            A FloodWait (or other 420 rate error) holds the bot/DC that sent
+            the request until the deadline Telegram gave and the chunk is
+            retried on another bot right away; chunks whose home bot is held
+            go straight to the fallback.  A bot whose breaker refuses traffic (held or tripped)
+            is never sent to: when no bot is usable the fetch sleeps until
+            the earliest one is.  Every FloodWait counts as a try.
+            Chunks already in the shared chunk cache, the viewer's tail or a
+            warmed range (see range_cache) are returned without an RPC,
+            and a request already in flight for the same region (from any
+            stream, on any bot) is joined instead of being sent again.
+            A try that runs past the bot's p95 latency is hedged (see hedged_send).
             """
+            cache_key = chunk_cache.make_key(file_id, off, limit)
+            cached = chunk_cache.get(cache_key)
+            if cached is not None:
+                registry_entry["cache_hits"] += 1
+                return seq_idx, cached
+            if viewer is not None:
+                cached = viewer.take_tail(off, limit)
+                if cached is not None:
+                    registry_entry["tail_hits"] += 1
+                    return seq_idx, cached
+            cached = range_cache.take(file_id, off, limit)
+            if cached is not None:
+                registry_entry["warm_hits"] += 1
+                return seq_idx, cached
+
+            home_idx = stripe[seq_idx % len(stripe)]
+            home_session = stripe_sessions[home_idx]
+
             tries = 0
             while tries < 6 and not stop_event.is_set():
                 # --- choose which media session to use this attempt ---
-                use_session = media_session
-                use_client_idx = client_index
-                if tries >= 3 and len(multi_clients) > 1:
-                    # Pick the best *other* client by score = workload + 3×failures
-                    def _score(idx):
-                        return work_loads.get(idx, 0) + 3 * client_failures.get(idx, 0)
-                    fallback_idx = min(
-                        (i for i in multi_clients if i != client_index),
-                        key=_score,
-                        default=None,
-                    )
-                    if fallback_idx is not None:
-                        fb_streamer = ByteStreamer._instances.get(fallback_idx)
-                        if fb_streamer is None:
-                            fb_streamer = ByteStreamer(multi_clients[fallback_idx], fallback_idx)
+                # Only bots whose breaker allows traffic are used; a held or
+                # tripped home bot is never sent to just because no fallback
+                # is available.
+                use_client_idx = None
+                use_session = None
+                if tries < 3 and breakers.allow(home_idx, file_id.dc_id):
+                    use_client_idx, use_session = home_idx, home_session
+                elif len(multi_clients) > 1:
+                    fallback_idx = best_other_client(home_idx)
+                    if fallback_idx is not None and breakers.allow(fallback_idx, file_id.dc_id):
                         try:
-                            use_session = await fb_streamer._get_media_session(file_id)
+                            use_session = await ByteStreamer.for_client(fallback_idx)._get_media_session(file_id)
                             use_client_idx = fallback_idx
                             LOGGER.debug(
                                 "Chunk fallback: seq=%s try=%s primary=%s → fallback=%s",
-                                seq_idx, tries, client_index, fallback_idx,
+                                seq_idx, tries, home_idx, fallback_idx,
                             )
-                        except Exception:
-                            use_session = media_session  # revert if fallback session fails
-                            use_client_idx = client_index
+                        except Exception as e:
+                            LOGGER.debug("Fallback session for client %s unavailable: %s", fallback_idx, e)
+                if use_client_idx is None and breakers.allow(home_idx, file_id.dc_id):
+                    use_client_idx, use_session = home_idx, home_session
+                if use_client_idx is None:
+                    # Every bot is held or tripped for this DC: wait for the
+                    # earliest one to come back instead of sending anyway.
+                    tries += 1
+                    wait = min(breakers.ready_in(i, file_id.dc_id) for i in set(multi_clients) | {home_idx})
+                    await asyncio.sleep(min(max(wait, 0.5), 30.0))
+                    continue
 
                 # --- attempt the fetch with a hard timeout ---
+                used_location = location
                 try:
-                    r = await asyncio.wait_for(
-                        use_session.send(
-                            raw.functions.upload.GetFile(
-                                location=location, offset=off, limit=chunk_size
-                            )
-                        ),
-                        timeout=15.0,
+                    # Each GetFile times out on its own (see timed_send); this
+                    # only bounds a try that also waits for a hedge session.
+                    r, served_by = await asyncio.wait_for(
+                        hedged_send(use_client_idx, use_session, off, limit, cache_key),
+                        timeout=2 * GETFILE_TIMEOUT,
                     )
                     chunk_bytes = getattr(r, "bytes", None) if r else None
-                    # If we succeeded via a fallback, mark primary as degraded
-                    if use_client_idx != client_index:
-                        client_failures[client_index] = client_failures.get(client_index, 0) + 1
+                    chunk_cache.put(cache_key, chunk_bytes)
+                    if chunk_bytes:
+                        bytes_by_client[served_by] = bytes_by_client.get(served_by, 0) + len(chunk_bytes)
+                    # If we succeeded via a fallback, mark the home bot as degraded
+                    if use_client_idx != home_idx:
+                        client_failures[home_idx] = client_failures.get(home_idx, 0) + 1
                     return seq_idx, chunk_bytes
 
                 except asyncio.TimeoutError:
+                    # The bot that sent the request is already charged (see timed_send)
                     tries += 1
-                    client_failures[use_client_idx] = client_failures.get(use_client_idx, 0) + 1
+                    aimd.on_congestion("timeout")
                     LOGGER.warning(
                         "Chunk timeout seq=%s off=%s try=%s client=%s",
                         seq_idx, off, tries, use_client_idx,
                     )
+                except Flood as e:
+                    # The bot that sent the request is already held (see timed_send)
+                    aimd.on_congestion("flood_wait")
+                    LOGGER.debug(
+                        "FloodWait on chunk seq=%s off=%s try=%s client=%s wait=%s",
+                        seq_idx, off, tries, use_client_idx, getattr(e, "value", None),
+                    )
+                    # The next try only goes to a bot that isn't held, and
+                    # waits for the earliest deadline when every bot is.
+                    tries += 1
+                    continue
+                except (FileReferenceExpired, FileReferenceInvalid):
+                    tries += 1
+                    try:
+                        await refresh_location(used_location)
+                        continue
+                    except Exception as e:
+                        LOGGER.warning("Could not refresh file reference for stream %s: %s", stream_id, e)
                 except Exception as e:
                     tries += 1
                     LOGGER.debug(
@@ -237,40 +698,58 @@ class ByteStreamer:
 
             LOGGER.error(
                 "Failed to fetch chunk seq=%s off=%s after 6 retries, client=%s",
-                seq_idx, off, client_index,
+                seq_idx, off, home_idx,
             )
             return seq_idx, None
 
         async def producer():
             try:
-                if part_count <= 0:
+                if range_end <= range_start:
                     await q.put((None, None))
                     return
 
                 next_to_schedule = 0
-                scheduled_tasks = {}
-                results_buffer = {}
+                next_off = offset
                 next_to_put = 0
-                max_parallel = max(1, parallelism)
 
-                initial = min(part_count, max_parallel)
-                for i in range(initial):
-                    seq = next_to_schedule
-                    off = offset + seq * chunk_size
-                    task = asyncio.create_task(fetch_chunk_with_retries(seq, off))
-                    scheduled_tasks[seq] = task
-                    next_to_schedule += 1
+                def schedule_more():
+                    nonlocal next_to_schedule, next_off
+                    limit = 1 if readahead.probing(registry_entry) else aimd.parallel
+                    registry_entry["readahead_parallel"] = limit
+                    while next_off < range_end and len(scheduled_tasks) < limit:
+                        seq = next_to_schedule
+                        size = aimd.chunk_size_at(next_off)
+                        if size > aimd.min_chunk_size and memory_governor.under_pressure():
+                            size = aimd.min_chunk_size
+                        if not memory_governor.try_reserve(stream_id, size):
+                            break
+                        reserved_sizes[next_off] = size
+                        scheduled_tasks[seq] = asyncio.create_task(fetch_chunk_with_retries(seq, next_off, size))
+                        chunk_offsets[seq] = next_off
+                        next_to_schedule += 1
+                        next_off += size
 
-                while next_to_put < part_count:
+                async def wait_for_room(limit: int):
+                    # Hold back readahead until the client has drained the
+                    # queue below ``limit`` chunks (0 while probing).
+                    while q.qsize() > limit and not stop_event.is_set():
+                        drained.clear()
+                        await drained.wait()
+
+                while next_to_put < next_to_schedule or next_off < range_end:
                     if stop_event.is_set():
                         break
 
                     if not scheduled_tasks:
-                        seq = next_to_schedule
-                        off = offset + seq * chunk_size
-                        task = asyncio.create_task(fetch_chunk_with_retries(seq, off))
-                        scheduled_tasks[seq] = task
-                        next_to_schedule += 1
+                        await wait_for_room(0 if readahead.probing(registry_entry) else aimd.prefetch - 1)
+                    schedule_more()
+                    if not scheduled_tasks:
+                        if next_off >= range_end:
+                            break
+                        # Over our share of the memory budget: wait for bytes
+                        # to be released (by this stream's consumer or others).
+                        await memory_governor.wait_for_release()
+                        continue
 
                     done, _ = await asyncio.wait(scheduled_tasks.values(), return_when=asyncio.FIRST_COMPLETED)
 
@@ -294,13 +773,8 @@ class ByteStreamer:
                                 return
 
                             results_buffer[seq_idx] = chunk_bytes
-
-                            if next_to_schedule < part_count:
-                                seq = next_to_schedule
-                                off = offset + seq * chunk_size
-                                task = asyncio.create_task(fetch_chunk_with_retries(seq, off))
-                                scheduled_tasks[seq] = task
-                                next_to_schedule += 1
+                            registry_entry["prefetched_bytes"] += len(chunk_bytes)
+                            aimd.on_chunk(len(chunk_bytes))
 
                         except asyncio.CancelledError:
                             raise
@@ -309,9 +783,16 @@ class ByteStreamer:
                             await q.put((None, None))
                             return
 
+                    registry_entry["aimd"] = aimd.snapshot()
+                    if pacer is not None:
+                        registry_entry["pacing"] = pacer.snapshot()
+                    if not readahead.probing(registry_entry):
+                        schedule_more()
+
                     while next_to_put in results_buffer:
                         chunk_bytes = results_buffer.pop(next_to_put)
-                        await q.put((offset + next_to_put * chunk_size, chunk_bytes))
+                        await wait_for_room(aimd.prefetch - 1)
+                        await q.put((chunk_offsets.pop(next_to_put), chunk_bytes))
                         next_to_put += 1
 
                 await q.put((None, None))
@@ -319,7 +800,7 @@ class ByteStreamer:
             except asyncio.CancelledError:
                 LOGGER.debug("Producer cancelled for stream %s", stream_id)
                 try:
-                    await q.put((None, None))
+                    q.put_nowait((None, None))
                 except Exception:
                     pass
                 raise
@@ -330,21 +811,60 @@ class ByteStreamer:
                 except Exception:
                     pass
 
+        load_released = False
+
+        def release_load() -> None:
+            nonlocal load_released
+            if load_released:
+                return
+            load_released = True
+            for idx in stripe:
+                try:
+                    work_loads[idx] = round(work_loads[idx] - load_share, 6)
+                except Exception:
+                    pass
+
+        def stop_fetches() -> int:
+            """Cancel the fetches still running; keep chunks that already arrived.
+
+            Returns how many fetches were cancelled.  Chunks of finished tasks
+            the producer had not collected yet go to ``results_buffer`` so they
+            are handed on with the rest of the undelivered readahead.
+            """
+            cancelled = 0
+            for seq, task in list(scheduled_tasks.items()):
+                if not task.done():
+                    task.cancel()
+                    cancelled += 1
+                elif not task.cancelled() and task.exception() is None:
+                    chunk = task.result()[1]
+                    if chunk:
+                        results_buffer[seq] = chunk
+            scheduled_tasks.clear()
+            return cancelled
+
         async def consumer_generator():
+            nonlocal delivered_to
             producer_task = asyncio.create_task(producer())
-            current_part_idx = 1
 
             try:
                 while True:
-                    try:
-                        if request and await request.is_disconnected():
+                    if disconnected is not None:
+                        if disconnected.is_set():
                             LOGGER.debug("Client disconnected for stream %s; cancelling stream", stream_id)
                             ACTIVE_STREAMS[stream_id]["status"] = "cancelled"
                             break
-                    except Exception:
-                        pass
+                    else:
+                        try:
+                            if request and await request.is_disconnected():
+                                LOGGER.debug("Client disconnected for stream %s; cancelling stream", stream_id)
+                                ACTIVE_STREAMS[stream_id]["status"] = "cancelled"
+                                break
+                        except Exception:
+                            pass
 
                     off_chunk = await q.get()
+                    drained.set()
                     if off_chunk is None:
                         break
 
@@ -357,6 +877,15 @@ class ByteStreamer:
                     except Exception:
                         chunk_len = 0
 
+                    if pacer is not None:
+                        # Far enough ahead of the viewer's estimated playback
+                        # position: hold this chunk; the full queue holds the
+                        # fetches behind it.
+                        hold = pacer.delay(min(off + chunk_len, range_end))
+                        registry_entry["pacing"] = pacer.snapshot()
+                        if hold > 0:
+                            await asyncio.sleep(hold)
+
                     now_ts = time.time()
                     elapsed = now_ts - ACTIVE_STREAMS[stream_id]["last_ts"]
                     if elapsed <= 0:
@@ -385,16 +914,21 @@ class ByteStreamer:
                     if instant_mbps > ACTIVE_STREAMS[stream_id]["peak_mbps"]:
                         ACTIVE_STREAMS[stream_id]["peak_mbps"] = instant_mbps
 
-                    if part_count == 1:
-                        yield chunk[first_part_cut:last_part_cut]
-                    elif current_part_idx == 1:
-                        yield chunk[first_part_cut:]
-                    elif current_part_idx == part_count:
-                        yield chunk[:last_part_cut]
-                    else:
+                    # Chunks are aligned to their own size, so only the first
+                    # and last ones need trimming to the requested range.
+                    lo = max(0, range_start - off)
+                    hi = min(chunk_len, range_end - off)
+                    delivered_to = off + hi
+                    drained.set()
+                    if viewer is not None:
+                        viewer.total_bytes += max(0, hi - lo)
+                        viewer.advance(delivered_to, ACTIVE_STREAMS[stream_id]["total_bytes"])
+                        viewer.touch()
+                    if lo == 0 and hi == chunk_len:
                         yield chunk
-
-                    current_part_idx += 1
+                    else:
+                        yield memoryview(chunk)[lo:hi]
+                    memory_governor.release(stream_id, reserved_sizes.pop(off, 0))
 
             except asyncio.CancelledError:
                 LOGGER.debug("Consumer cancelled for stream %s", stream_id)
@@ -409,9 +943,15 @@ class ByteStreamer:
                     producer_task.cancel()
                 raise
             finally:
+                # Stop every GetFile still out for this stream at once and give
+                # its bots back to the scheduler before any bookkeeping.
+                stop_event.set()
+                if not producer_task.done():
+                    producer_task.cancel()
+                registry_entry["cancelled_fetches"] = stop_fetches()
+                release_load()
                 if not producer_task.done():
                     try:
-                        producer_task.cancel()
                         await asyncio.wait_for(producer_task, timeout=2.0)
                     except (Exception, asyncio.CancelledError):
                         pass
@@ -423,22 +963,67 @@ class ByteStreamer:
                     duration = end_ts - start_ts if end_ts > start_ts else 0.0
                     avg_mbps = (total_bytes / (1024 * 1024)) / (duration if duration > 0 else 1e-6)
 
+                    # Chunks fetched but never handed to the client are wasted
+                    # readahead; estimate what eager readahead would have wasted
+                    # at the same point to report the saving.
+                    wasted = max(0, registry_entry["prefetched_bytes"] - total_bytes)
+                    remaining = max(0, range_end - delivered_to)
+                    eager_ahead = min(remaining, (max(1, parallelism) + queue_maxsize) * chunk_size)
+                    registry_entry["wasted_prefetch_bytes"] = wasted
+                    registry_entry["prefetch_bytes_saved"] = max(0, eager_ahead - wasted) if remaining else 0
+                    registry_entry["aimd"] = aimd.snapshot()
+
+                    # Whatever was fetched but not delivered becomes the viewer
+                    # session's tail for the next request; the rest goes to the
+                    # range cache for a reconnect at a nearby offset.
+                    tail = {}
+                    while not q.empty():
+                        item = q.get_nowait()
+                        if item and item[0] is not None:
+                            tail[item[0]] = (reserved_sizes.get(item[0], len(item[1])), item[1])
+                    for seq, chunk in results_buffer.items():
+                        off = chunk_offsets.get(seq)
+                        if off is not None:
+                            tail[off] = (reserved_sizes.get(off, len(chunk)), chunk)
+                    if viewer is not None:
+                        # The stream's reservations end here; the viewer
+                        # session's tail is charged on its own (see finish).
+                        memory_governor.unregister(stream_id)
+                        window_end = max([delivered_to] + [off + len(c) for off, (_, c) in tail.items()])
+                        viewer.finish(range_start, window_end, tail, aimd.parallel, aimd.prefetch)
+                    for off, (_, chunk) in tail.items():
+                        if viewer is None or off not in viewer.tail:
+                            range_cache.put(file_id, off, chunk, DONATE_TTL)
+                            registry_entry["donated_bytes"] += len(chunk)
+
                     entry = ACTIVE_STREAMS.get(stream_id, {})
+                    if disconnected is not None and disconnected.is_set() and entry.get("status") == "active":
+                        # Closed at a yield by the response, not cancelled inside it
+                        entry["status"] = "cancelled"
                     entry.update({
                         "end_ts": end_ts,
                         "duration": duration,
                         "avg_mbps": avg_mbps,
                         "status": "finished" if entry.get("status") == "active" else entry.get("status", "finished"),
-                        "parallelism": parallelism,
+                        "parallelism": aimd.parallel,
                     })
 
-                    # --- Update rolling average speed for this client ---
-                    prev = client_avg_mbps.get(client_index, 0.0)
-                    if prev == 0.0:
-                        client_avg_mbps[client_index] = avg_mbps
-                    else:
-                        # Exponential moving average: 30% new, 70% history
-                        client_avg_mbps[client_index] = 0.7 * prev + 0.3 * avg_mbps
+                    # --- Update rolling average speed for each client used ---
+                    # Striped bots are credited with their share of the bytes.
+                    fetched_total = sum(bytes_by_client.values())
+                    for idx in stripe:
+                        if len(stripe) == 1:
+                            client_mbps = avg_mbps
+                        elif fetched_total:
+                            client_mbps = avg_mbps * bytes_by_client.get(idx, 0) / fetched_total
+                        else:
+                            continue
+                        prev = client_avg_mbps.get(idx, 0.0)
+                        if prev == 0.0:
+                            client_avg_mbps[idx] = client_mbps
+                        else:
+                            # Exponential moving average: 30% new, 70% history
+                            client_avg_mbps[idx] = 0.7 * prev + 0.3 * client_mbps
                     
                     # --- Log Analytics to DB ---
                     entry["chunk_size"] = chunk_size
@@ -454,58 +1039,48 @@ class ByteStreamer:
                     
                     asyncio.create_task(delayed_pop())
                 finally:
-                    try:
-                        work_loads[client_index] -= 1
-                    except Exception:
-                        pass
+                    release_load()
+                    memory_governor.unregister(stream_id)
+                    if viewer is not None:
+                        viewer.active -= 1
 
                 stop_event.set()
 
         return consumer_generator()
 
-    async def _get_media_session(self, file_id: FileId) -> Session:
-        dc = file_id.dc_id
+    @staticmethod
+    def for_client(client_index: int) -> "ByteStreamer":
+        """Return the registered streamer for a client index, creating it if needed."""
+        streamer = ByteStreamer._instances.get(client_index)
+        if streamer is None:
+            streamer = ByteStreamer(multi_clients[client_index], client_index)
+        return streamer
+
+    async def _get_media_session(self, file_id: FileId) -> MediaSessionPool:
+        return await self.get_dc_session(file_id.dc_id)
+
+    async def get_dc_session(self, dc: int) -> MediaSessionPool:
+        """Pool of media sessions to ``dc`` (see session_pool).
+
+        The pool's first member is the bot's regular media session, kept in
+        ``client.media_sessions``; it grows up to MEDIA_SESSIONS under load.
+        The session warm-up planner calls this ahead of the first viewer.
+        """
         media_session = self.client.media_sessions.get(dc)
 
         if media_session:
-            return media_session
+            return pool_for(self.client, self.client_index, dc, media_session)
 
-        async with self._session_lock:
+        lock = ByteStreamer._session_locks.setdefault((id(self.client), dc), asyncio.Lock())
+        async with lock:
             media_session = self.client.media_sessions.get(dc)
             if media_session:
-                return media_session
-
-            test_mode = await self.client.storage.test_mode()
-            current_dc = await self.client.storage.dc_id()
-
-            if dc != current_dc:
-                auth_key = await Auth(self.client, dc, test_mode).create()
-            else:
-                auth_key = await self.client.storage.auth_key()
-
-            session = Session(self.client, dc, auth_key, test_mode, is_media=True)
-            session.no_updates = True
-            session.timeout = 30 
-            session.sleep_threshold = 60 
-
-            await session.start()
-
-            if dc != current_dc:
-                for _ in range(6):
-                    try:
-                        exported = await self.client.invoke(raw.functions.auth.ExportAuthorization(dc_id=dc))
-                        await session.send(raw.functions.auth.ImportAuthorization(id=exported.id, bytes=exported.bytes))
-                        break
-                    except AuthBytesInvalid:
-                        LOGGER.debug("AuthBytesInvalid during media session import; retrying...")
-                        await asyncio.sleep(0.5)
-                    except OSError:
-                        LOGGER.debug("OSError during media session import; retrying...")
-                        await asyncio.sleep(1)
+                return pool_for(self.client, self.client_index, dc, media_session)
 
+            session = await self._open_media_session(dc)
             self.client.media_sessions[dc] = session
             LOGGER.debug("Created media session for DC %s", dc)
-            return session
+            return pool_for(self.client, self.client_index, dc, session)
 
     @staticmethod
     async def _get_location(file_id: FileId) -> Union[
@@ -547,11 +1122,45 @@ class ByteStreamer:
             thumb_size=file_id.thumbnail_size,
         )
 
-    async def _clean_cache(self) -> None:
-        while True:
-            await asyncio.sleep(self.CLEAN_INTERVAL)
-            self._file_id_cache.clear()
-            LOGGER.debug("ByteStreamer: cleared file_id cache")
+
+_probing = set()
+
+
+async def probe_when_due(client_index: int, file_id: FileId) -> None:
+    """Probe a tripped (bot, DC) breaker once its cooldown passes.
+
+    The probe is a single PROBE_BLOCK GetFile for ``file_id`` on the bot's
+    media session.  Any answer from Telegram - including an RPC error such
+    as an expired file reference - proves the session is alive and closes
+    the breaker; a timeout or connection error re-opens it for longer.
+    """
+    key = (client_index, file_id.dc_id)
+    if key in _probing:
+        return
+    _probing.add(key)
+    breaker = breakers.get(*key)
+    try:
+        while breaker.state != CLOSED:
+            await asyncio.sleep(max(0.0, breaker.retry_at - time.time()))
+            if not breaker.begin_probe():
+                continue
+            try:
+                streamer = ByteStreamer.for_client(client_index)
+                session = await streamer._get_media_session(file_id)
+                location = await streamer._get_location(file_id)
+                await asyncio.wait_for(
+                    session.send(raw.functions.upload.GetFile(
+                        location=location, offset=0, limit=ByteStreamer.PROBE_BLOCK,
+                    )),
+                    timeout=5.0,
+                )
+                breakers.record_success(*key)
+            except RPCError:
+                breakers.record_success(*key)
+            except Exception as e:
+                breakers.record_failure(*key, f"probe: {type(e).__name__}")
+    finally:
+        _probing.discard(key)
 
 
 # ---------------------------------------------------------------------------
@@ -587,7 +1196,7 @@ async def _speed_test_single_client(
         # Each client MUST fetch its own FileId — file references are
         # per-session and will raise FILE_REFERENCE_EXPIRED if shared.
         streamer = ByteStreamer(client)
-        file_id = await streamer.get_file_properties(chat_id, message_id)
+        file_id = await file_resolver.resolve(client, client_index, chat_id, message_id, refresh=True)
 
         media_session = await streamer._get_media_session(file_id)
         location = await ByteStreamer._get_location(file_id)
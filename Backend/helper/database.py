@@ -3,7 +3,7 @@ import string
 from asyncio import create_task
 from bson import ObjectId
 import motor.motor_asyncio
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from pydantic import ValidationError
 from pymongo import ASCENDING, DESCENDING
 from typing import Dict, List, Optional, Tuple, Any
@@ -966,6 +966,11 @@ class Database:
     async def get_title_by_stream_id(self, stream_id_hash: str) -> Optional[str]:
         """Look up the original media title across all storage DBs using the telegram file ID hash.
         For TV shows, it includes the Season and Episode number in the title."""
+        info = await self.get_media_info_by_stream_id(stream_id_hash)
+        return info["title"] if info else None
+
+    async def get_media_info_by_stream_id(self, stream_id_hash: str) -> Optional[dict]:
+        """Title (with SxxEyy for episodes) and runtime of the movie or show a file belongs to."""
         for i in range(1, self.current_db_index + 1):
             db = self.dbs[f"storage_{i}"]
             
@@ -974,7 +979,7 @@ class Database:
             if movie and "telegram" in movie:
                 for t in movie["telegram"]:
                     if t.get("id") == stream_id_hash:
-                        return movie.get("title")
+                        return {"title": movie.get("title"), "runtime": movie.get("runtime")}
 
             # Check TV Shows
             tv = await db["tv"].find_one({"seasons.episodes.telegram.id": stream_id_hash})
@@ -986,8 +991,47 @@ class Database:
                             if t.get("id") == stream_id_hash:
                                 s_num = season.get("season_number", 0)
                                 e_num = episode.get("episode_number", 0)
-                                return f"{title} S{s_num:02d}E{e_num:02d}"
+                                return {
+                                    "title": f"{title} S{s_num:02d}E{e_num:02d}",
+                                    "runtime": tv.get("runtime"),
+                                }
+
+        return None
 
+    async def get_next_episode(self, stream_id_hash: str) -> Optional[dict]:
+        """Return the file entry of the episode after the one ``stream_id_hash`` belongs to.
+
+        The next episode is SxxE(yy+1), or the first episode of the next
+        season.  A file of the same quality is preferred.  Returns None for
+        movies, unknown hashes and season finales without a next season.
+        """
+        for i in range(1, self.current_db_index + 1):
+            tv = await self.dbs[f"storage_{i}"]["tv"].find_one({"seasons.episodes.telegram.id": stream_id_hash})
+            if not tv:
+                continue
+
+            episodes = sorted((
+                (season.get("season_number", 0), episode.get("episode_number", 0), episode)
+                for season in tv.get("seasons", [])
+                for episode in season.get("episodes", [])
+            ), key=lambda item: item[:2])
+            for pos, (s_num, e_num, episode) in enumerate(episodes):
+                current = next((t for t in episode.get("telegram", []) if t.get("id") == stream_id_hash), None)
+                if current is None:
+                    continue
+                if pos + 1 >= len(episodes):
+                    return None
+                n_season, n_episode, nxt = episodes[pos + 1]
+                if not (n_season == s_num and n_episode == e_num + 1) and not (n_season == s_num + 1):
+                    return None
+                files = [t for t in nxt.get("telegram", []) if t.get("id")]
+                if not files:
+                    return None
+                same = next((t for t in files if t.get("quality") == current.get("quality")), files[0])
+                return {
+                    "id": same["id"],
+                    "title": f"{tv.get('title', 'Unknown Series')} S{n_season:02d}E{n_episode:02d}",
+                }
         return None
 
     async def delete_media_by_stream_id(self, stream_id_hash: str) -> bool:
@@ -1383,6 +1427,22 @@ class Database:
                                 
         return dead_links
 
+    # -------------------------------
+    # FileId Resolution Cache
+    # -------------------------------
+
+    async def get_cached_file_id(self, key: str) -> Optional[dict]:
+        return await self.dbs["tracking"]["file_id_cache"].find_one({"_id": key})
+
+    async def save_cached_file_id(self, key: str, doc: dict) -> None:
+        await self.dbs["tracking"]["file_id_cache"].update_one(
+            {"_id": key}, {"$set": doc}, upsert=True
+        )
+
+    async def clear_cached_file_ids(self) -> int:
+        result = await self.dbs["tracking"]["file_id_cache"].delete_many({})
+        return result.deleted_count
+
     # -------------------------------
     # Stream Analytics
     # -------------------------------
@@ -1404,12 +1464,30 @@ class Database:
                 "status":      stats.get("status", "finished"),
                 "parallelism": stats.get("parallelism"),
                 "chunk_size":  stats.get("chunk_size"),
+                "wasted_prefetch_bytes": stats.get("wasted_prefetch_bytes", 0),
                 "logged_at":   datetime.utcnow(),
             }
             await self.dbs["tracking"]["stream_analytics"].insert_one(record)
         except Exception as e:
             LOGGER.warning(f"Stream analytics log failed: {e}")
 
+    async def get_dc_distribution(self, days: int = 7) -> Dict[int, int]:
+        """Count recent streams and cached file ids per Telegram DC."""
+        since = datetime.utcnow() - timedelta(days=days)
+        sources = [
+            (self.dbs["tracking"]["stream_analytics"], {"logged_at": {"$gte": since}, "dc_id": {"$ne": None}}),
+            (self.dbs["tracking"]["file_id_cache"], {"dc_id": {"$ne": None}}),
+        ]
+        counts: Dict[int, int] = {}
+        for col, match in sources:
+            rows = await col.aggregate([
+                {"$match": match},
+                {"$group": {"_id": "$dc_id", "count": {"$sum": 1}}},
+            ]).to_list(None)
+            for row in rows:
+                counts[row["_id"]] = counts.get(row["_id"], 0) + row["count"]
+        return counts
+
     async def get_stream_analytics(self, limit: int = 200) -> dict:
         """Return summary stats + recent stream records from the tracking DB."""
         try:
@@ -3,4 +3,16 @@ class InvalidHash(Exception):
 
 
 class FIleNotFound(Exception):
-    message = 'File not found!'
\ No newline at end of file
+    message = 'File not found!'
+
+
+class CDNHashMismatch(Exception):
+    message = 'CDN file part failed verification!'
+
+
+class CDNReuploadFailed(Exception):
+    message = 'CDN kept asking for the file part to be reuploaded!'
+
+
+class CDNFetchFailed(Exception):
+    message = 'CDN download failed; the part is fetched from the main DC instead!'
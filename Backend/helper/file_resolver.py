@@ -0,0 +1,244 @@
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from pyrogram import Client
+from pyrogram.file_id import FileId
+
+from Backend import db
+from Backend.config import Telegram
+from Backend.helper.exceptions import FIleNotFound
+from Backend.helper.pyro import get_file_ids, file_id_from_message
+from Backend.helper.single_flight import SingleFlight
+from Backend.pyrofork.bot import multi_clients
+from Backend.logger import LOGGER
+
+_FILE_ATTRS = ("file_name", "file_size", "mime_type", "unique_id")
+
+
+class _Entry:
+    __slots__ = ("file_id", "fetched_at", "refresh_at", "expires_at")
+
+    def __init__(self, file_id: Optional[FileId], ttl: float, refresh_ahead: float):
+        now = time.time()
+        self.file_id = file_id
+        self.fetched_at = now
+        self.refresh_at = now + ttl * refresh_ahead
+        self.expires_at = now + ttl
+
+
+class FileResolver:
+    """Resolve (bot, chat, message) to a FileId with its size, mime, name and unique_id.
+
+    This is the single place the streaming path turns a message into a
+    FileId.  Entries carry their own TTL instead of being wiped in bulk, and
+    once an entry passes ``refresh_ahead`` of its lifetime it is still served
+    while a background refresh replaces it, so popular files never expire
+    under load.  Missing messages are negatively cached for a short while.
+
+    Resolved entries are also written to the tracking DB, so after a restart
+    the first stream of a known file is served without a ``get_messages``.
+
+    Every FileId handed out carries ``source_key`` (bot, chat, message) so a
+    stream whose file reference expires can ask for a fresh one with
+    ``refresh_reference``.
+    """
+
+    def __init__(
+        self,
+        ttl: int = Telegram.FILE_ID_TTL,
+        refresh_ahead: float = 0.8,
+        negative_ttl: int = 60,
+        max_entries: int = 20000,
+    ):
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[int, int, int], _Entry]" = OrderedDict()
+        self._flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.persisted_hits = 0
+        self.refreshes = 0
+        self.reference_refreshes = 0
+
+    async def resolve(
+        self,
+        client: Client,
+        client_index: int,
+        chat_id: int,
+        message_id: int,
+        refresh: bool = False,
+    ) -> FileId:
+        key = (client_index, int(chat_id), int(message_id))
+        now = time.time()
+
+        entry = self._entries.get(key)
+        if entry is not None and not refresh and now < entry.expires_at:
+            self._entries.move_to_end(key)
+            if entry.file_id is None:
+                self.negative_hits += 1
+                raise FIleNotFound
+            self.hits += 1
+            if now >= entry.refresh_at:
+                asyncio.create_task(self._refresh(client, key))
+            return entry.file_id
+
+        self.misses += 1
+        if not refresh:
+            file_id = await self._load_persisted(key)
+            if file_id is not None:
+                self.persisted_hits += 1
+                return file_id
+
+        return await self._flights.run(key, lambda: self._fetch(client, key))
+
+    async def _fetch(self, client: Client, key: Tuple[int, int, int]) -> FileId:
+        _, chat_id, message_id = key
+        try:
+            file_id = await get_file_ids(client, chat_id, message_id)
+        except FIleNotFound:
+            self._store(key, _Entry(None, self.negative_ttl, 1.0))
+            raise
+        if not file_id:
+            LOGGER.warning("Message %s not found", message_id)
+            self._store(key, _Entry(None, self.negative_ttl, 1.0))
+            raise FIleNotFound
+
+        file_id.source_key = key
+        self._store(key, _Entry(file_id, self.ttl, self.refresh_ahead))
+        asyncio.create_task(self._persist(key, file_id))
+        return file_id
+
+    async def resolve_many(
+        self,
+        client: Client,
+        client_index: int,
+        chat_id: int,
+        message_ids: Iterable[int],
+    ) -> Dict[int, FileId]:
+        """Resolve several messages of one chat with a single ``get_messages``.
+
+        Messages already cached (in memory or in the DB) are not fetched
+        again; missing ones are negatively cached like in ``resolve``.
+        """
+        resolved: Dict[int, FileId] = {}
+        missing = []
+        now = time.time()
+        for message_id in dict.fromkeys(int(m) for m in message_ids):
+            key = (client_index, int(chat_id), message_id)
+            entry = self._entries.get(key)
+            if entry is not None and now < entry.expires_at:
+                if entry.file_id is not None:
+                    resolved[message_id] = entry.file_id
+                continue
+            file_id = await self._load_persisted(key)
+            if file_id is not None:
+                resolved[message_id] = file_id
+            else:
+                missing.append(message_id)
+
+        if not missing:
+            return resolved
+
+        messages = await client.get_messages(chat_id, missing)
+        for message in messages if isinstance(messages, list) else [messages]:
+            key = (client_index, int(chat_id), message.id)
+            file_id = None if message.empty else file_id_from_message(message)
+            if file_id is None:
+                self._store(key, _Entry(None, self.negative_ttl, 1.0))
+                continue
+            file_id.source_key = key
+            self._store(key, _Entry(file_id, self.ttl, self.refresh_ahead))
+            asyncio.create_task(self._persist(key, file_id))
+            resolved[message.id] = file_id
+        return resolved
+
+    async def refresh_reference(self, file_id: FileId) -> FileId:
+        """Re-fetch a FileId whose ``file_reference`` Telegram rejected.
+
+        Concurrent callers for the same message share one ``get_messages``.
+        """
+        key = getattr(file_id, "source_key", None)
+        if key is None or key[0] not in multi_clients:
+            raise FIleNotFound("No source message to refresh the file reference from")
+        self.reference_refreshes += 1
+        return await self.resolve(multi_clients[key[0]], *key, refresh=True)
+
+    async def _refresh(self, client: Client, key: Tuple[int, int, int]) -> None:
+        try:
+            await self._flights.run(key, lambda: self._fetch(client, key))
+            self.refreshes += 1
+        except Exception as e:
+            LOGGER.debug("FileResolver: refresh-ahead failed for %s: %s", key, e)
+
+    def _store(self, key: Tuple[int, int, int], entry: _Entry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _doc_id(key: Tuple[int, int, int]) -> str:
+        return "{}:{}:{}".format(*key)
+
+    async def _persist(self, key: Tuple[int, int, int], file_id: FileId) -> None:
+        try:
+            doc = {attr: getattr(file_id, attr, None) for attr in _FILE_ATTRS}
+            doc["file_id"] = file_id.encode()
+            doc["dc_id"] = file_id.dc_id
+            doc["expires_at"] = datetime.utcnow() + timedelta(seconds=self.ttl)
+            await db.save_cached_file_id(self._doc_id(key), doc)
+        except Exception as e:
+            LOGGER.debug("FileResolver: could not persist %s: %s", key, e)
+
+    async def _load_persisted(self, key: Tuple[int, int, int]) -> Optional[FileId]:
+        try:
+            doc = await db.get_cached_file_id(self._doc_id(key))
+        except Exception as e:
+            LOGGER.debug("FileResolver: persisted lookup failed for %s: %s", key, e)
+            return None
+        if not doc:
+            return None
+
+        remaining = (doc["expires_at"] - datetime.utcnow()).total_seconds()
+        if remaining <= 0:
+            return None
+
+        file_id = FileId.decode(doc["file_id"])
+        for attr in _FILE_ATTRS:
+            setattr(file_id, attr, doc.get(attr))
+        file_id.source_key = key
+
+        entry = _Entry(file_id, self.ttl, self.refresh_ahead)
+        entry.expires_at = entry.fetched_at + remaining
+        entry.refresh_at = entry.expires_at - self.ttl * (1 - self.refresh_ahead)
+        self._store(key, entry)
+        return file_id
+
+    async def clear(self) -> int:
+        count = len(self._entries)
+        self._entries.clear()
+        try:
+            count += await db.clear_cached_file_ids()
+        except Exception as e:
+            LOGGER.debug("FileResolver: could not clear persisted entries: %s", e)
+        return count
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "negative_hits": self.negative_hits,
+            "persisted_hits": self.persisted_hits,
+            "refreshes": self.refreshes,
+            "reference_refreshes": self.reference_refreshes,
+        }
+
+
+file_resolver = FileResolver()
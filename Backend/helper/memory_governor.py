@@ -0,0 +1,145 @@
+import asyncio
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+from Backend.config import Telegram
+
+
+class MemoryGovernor:
+    """Process-wide byte budget for chunks that are in flight or queued.
+
+    A stream's producer reserves a chunk's size before scheduling its fetch
+    and the consumer releases it once the chunk has been handed to the
+    client.  Each stream is entitled to a fair share of the budget (the
+    budget divided by the number of active streams); past that, or once the
+    whole budget is taken, reservations are refused and the stream simply
+    reads ahead less.  A stream holding nothing is always granted one chunk
+    so playback never deadlocks, which is the only way the budget can be
+    exceeded, and then by at most one chunk per stream.
+
+    Chunks left over when a stream ends (a viewer session's tail) are
+    charged too, as long as they fit under the pressure mark.  They are
+    only a shortcut for the next request, so they are the first thing
+    dropped, oldest first, when a stream needs the room.
+    """
+
+    PRESSURE = 0.75  # above this share of the budget new streams start with small chunks
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.reserved = 0
+        self.peak = 0
+        self.denied = 0
+        self._streams: Dict[str, int] = {}
+        self._tails: "OrderedDict[Hashable, Tuple[int, Callable[[], None]]]" = OrderedDict()
+        self.tail_bytes = 0
+        self.tails_dropped = 0
+        self._released: Optional[asyncio.Event] = None
+
+    def register(self, stream_id: str) -> None:
+        self._streams.setdefault(stream_id, 0)
+
+    def unregister(self, stream_id: str) -> None:
+        held = self._streams.pop(stream_id, 0)
+        if held:
+            self.reserved -= held
+            self._notify()
+
+    def fair_share(self) -> int:
+        return self.max_bytes // max(1, len(self._streams))
+
+    def try_reserve(self, stream_id: str, nbytes: int) -> bool:
+        held = self._streams.get(stream_id, 0)
+        self._drop_tails(self.max_bytes - nbytes)
+        if held and (
+            self.reserved + nbytes > self.max_bytes
+            or held + nbytes > self.fair_share()
+        ):
+            self.denied += 1
+            return False
+        self._streams[stream_id] = held + nbytes
+        self.reserved += nbytes
+        self.peak = max(self.peak, self.reserved)
+        return True
+
+    def release(self, stream_id: str, nbytes: int) -> None:
+        if stream_id not in self._streams:
+            return
+        nbytes = min(nbytes, self._streams[stream_id])
+        self._streams[stream_id] -= nbytes
+        self.reserved -= nbytes
+        self._notify()
+
+    def keep_tail(self, owner: Hashable, nbytes: int, drop: Callable[[], None]) -> bool:
+        """Charge ``nbytes`` of leftover chunks to ``owner``, replacing what it held.
+
+        ``drop`` is called if the bytes are reclaimed later.  Returns False
+        (and charges nothing) when they do not fit under the pressure mark
+        even after dropping older tails.
+        """
+        self.release_tail(owner)
+        if not nbytes:
+            return True
+        limit = int(self.max_bytes * self.PRESSURE)
+        self._drop_tails(limit - nbytes)
+        if self.reserved + nbytes > limit:
+            return False
+        self._tails[owner] = (nbytes, drop)
+        self.tail_bytes += nbytes
+        self.reserved += nbytes
+        self.peak = max(self.peak, self.reserved)
+        return True
+
+    def release_tail(self, owner: Hashable) -> None:
+        entry = self._tails.pop(owner, None)
+        if entry is not None:
+            self.tail_bytes -= entry[0]
+            self.reserved -= entry[0]
+            self._notify()
+
+    def _drop_tails(self, room_until: int) -> None:
+        # Oldest tails first, until reserved is at most room_until
+        if not self._tails or self.reserved <= room_until:
+            return
+        while self._tails and self.reserved > room_until:
+            _, (nbytes, drop) = self._tails.popitem(last=False)
+            self.tail_bytes -= nbytes
+            self.reserved -= nbytes
+            self.tails_dropped += 1
+            drop()
+        self._notify()
+
+    async def wait_for_release(self, timeout: float = 1.0) -> None:
+        """Wait until some stream releases bytes (or ``timeout`` passes)."""
+        if self._released is None:
+            self._released = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._released.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _notify(self) -> None:
+        if self._released is not None:
+            self._released.set()
+            self._released = None
+
+    def under_pressure(self) -> bool:
+        return self.reserved >= self.max_bytes * self.PRESSURE
+
+    def held_by(self, stream_id: str) -> int:
+        return self._streams.get(stream_id, 0)
+
+    def stats(self) -> Dict:
+        return {
+            "max_bytes": self.max_bytes,
+            "reserved_bytes": self.reserved,
+            "peak_bytes": self.peak,
+            "streams": len(self._streams),
+            "fair_share_bytes": self.fair_share(),
+            "denied": self.denied,
+            "tail_bytes": self.tail_bytes,
+            "tails_dropped": self.tails_dropped,
+        }
+
+
+memory_governor = MemoryGovernor(Telegram.STREAM_MEMORY_MB * 1024 * 1024)
@@ -0,0 +1,98 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, Hashable, Set
+
+from Backend import db
+from Backend.config import Telegram
+from Backend.logger import LOGGER
+from Backend.helper.stream_warmer import stream_warmer
+from Backend.helper.viewer_session import ViewerSession
+
+BUDGET_WINDOW = 3600.0   # seconds over which NEXT_EPISODE_BUDGET applies per token
+WARM_TTL = 900           # seconds the next episode's first and last MB are kept
+
+
+class NextEpisodePrefetcher:
+    """Prepare the next episode while the current one is still playing.
+
+    Once a viewer session's playback position passes ``NEXT_EPISODE_AT``
+    of the file, the show document gives SxxE(yy+1) (or the next season's
+    first episode) in the same quality, and the stream warmer resolves its
+    FileId, opens the media session and caches its first and last MB.
+
+    Each token may trigger ``NEXT_EPISODE_BUDGET`` prefetches per hour, one
+    per viewer session, and a prefetch still running when its viewer
+    session ends is cancelled.
+    """
+
+    def __init__(self, threshold: float = Telegram.NEXT_EPISODE_AT, budget: int = Telegram.NEXT_EPISODE_BUDGET):
+        self.threshold = threshold
+        self.budget = budget
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self._handled: Set[Hashable] = set()
+        self._spent: Dict[str, Deque[float]] = {}
+        self.started = 0
+        self.prefetched = 0
+        self.over_budget = 0
+        self.cancelled = 0
+
+    def _take_budget(self, token: str) -> bool:
+        now = time.time()
+        spent = self._spent.setdefault(token, deque())
+        while spent and now - spent[0] > BUDGET_WINDOW:
+            spent.popleft()
+        if len(spent) >= self.budget:
+            return False
+        spent.append(now)
+        return True
+
+    def check(self, viewer: ViewerSession, token: str, stream_id_hash: str) -> None:
+        """Start the next-episode prefetch for ``viewer`` once it is far enough in."""
+        if self.threshold <= 0 or not stream_id_hash or viewer.key in self._handled:
+            return
+        if viewer.progress() < self.threshold:
+            return
+        self._handled.add(viewer.key)
+        if not self._take_budget(token):
+            self.over_budget += 1
+            return
+        self.started += 1
+        self._tasks[viewer.key] = asyncio.create_task(self._prefetch(viewer.key, stream_id_hash))
+
+    def cancel(self, viewer: ViewerSession) -> None:
+        """The viewer left: stop its prefetch if it is still running."""
+        self._handled.discard(viewer.key)
+        task = self._tasks.pop(viewer.key, None)
+        if task is not None and not task.done():
+            task.cancel()
+            self.cancelled += 1
+
+    async def _prefetch(self, key: Hashable, stream_id_hash: str) -> None:
+        try:
+            nxt = await db.get_next_episode(stream_id_hash)
+            if not nxt:
+                return
+            for file_id in await stream_warmer.resolve_ids([nxt["id"]]):
+                if await stream_warmer.warm_file(file_id, ttl=WARM_TTL):
+                    self.prefetched += 1
+                    LOGGER.info(f"Prefetched next episode: {nxt['title']}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            LOGGER.debug("Next-episode prefetch for %s failed: %s", stream_id_hash, e)
+        finally:
+            self._tasks.pop(key, None)
+
+    def stats(self) -> Dict:
+        return {
+            "threshold": self.threshold,
+            "running": len(self._tasks),
+            "started": self.started,
+            "prefetched": self.prefetched,
+            "over_budget": self.over_budget,
+            "cancelled": self.cancelled,
+        }
+
+
+next_episodes = NextEpisodePrefetcher()
@@ -17,21 +17,28 @@ def is_media(message):
     return next((getattr(message, attr) for attr in ["document", "photo", "video", "audio", "voice", "video_note", "sticker", "animation"] if getattr(message, attr)), None)
 
 
+def file_id_from_message(message) -> Optional[FileId]:
+    """Decode the media of ``message`` into a FileId carrying name, size, mime and unique_id."""
+    if not (media := is_media(message)):
+        return None
+    file_id_obj = FileId.decode(media.file_id)
+    file_unique_id = media.file_unique_id
+    
+    setattr(file_id_obj, 'file_name', getattr(media, 'file_name', ''))
+    setattr(file_id_obj, 'file_size', getattr(media, 'file_size', 0))
+    setattr(file_id_obj, 'mime_type', getattr(media, 'mime_type', ''))
+    setattr(file_id_obj, 'unique_id', file_unique_id)
+    
+    return file_id_obj
+
+
 async def get_file_ids(client: Client, chat_id: int, message_id: int) -> Optional[FileId]:
     try:
         message = await client.get_messages(chat_id, message_id)
         if message.empty:
             raise FIleNotFound("Message not found or empty")
         
-        if media := is_media(message):
-            file_id_obj = FileId.decode(media.file_id)
-            file_unique_id = media.file_unique_id
-            
-            setattr(file_id_obj, 'file_name', getattr(media, 'file_name', ''))
-            setattr(file_id_obj, 'file_size', getattr(media, 'file_size', 0))
-            setattr(file_id_obj, 'mime_type', getattr(media, 'mime_type', ''))
-            setattr(file_id_obj, 'unique_id', file_unique_id)
-            
+        if file_id_obj := file_id_from_message(message):
             return file_id_obj
         else:
             raise FIleNotFound("No supported media found in message")
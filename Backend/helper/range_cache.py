@@ -0,0 +1,109 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+from pyrogram.file_id import FileId
+
+DEFAULT_TTL = 180                 # seconds a warmed range is kept
+MAX_BYTES = 64 * 1024 * 1024
+
+
+class _Range:
+    __slots__ = ("data", "eof", "expires_at")
+
+    def __init__(self, data: bytes, eof: bool, expires_at: float):
+        self.data = data
+        self.eof = eof
+        self.expires_at = expires_at
+
+
+class RangeCache:
+    """Short-lived byte ranges of files fetched ahead of a viewer.
+
+    Unlike the chunk cache, entries are arbitrary ranges (the first MB of a
+    file, its last MB) and a stream's chunk is served by slicing whichever
+    range covers it, whatever chunk size that stream settled on.  Entries
+    expire after ``ttl`` seconds: they are bets on a click that is about to
+    happen, not a long-term cache.
+    """
+
+    def __init__(self, max_bytes: int = MAX_BYTES, ttl: float = DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._files: "OrderedDict[Hashable, Dict[int, _Range]]" = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.puts = 0
+        self.expired = 0
+
+    @staticmethod
+    def _key(file_id: FileId) -> Hashable:
+        return getattr(file_id, "unique_id", None) or getattr(file_id, "media_id", None)
+
+    def put(self, file_id: FileId, offset: int, data: bytes, ttl: Optional[float] = None) -> None:
+        if not data or len(data) > self.max_bytes:
+            return
+        key = self._key(file_id)
+        file_size = getattr(file_id, "file_size", 0) or 0
+        ranges = self._files.setdefault(key, {})
+        old = ranges.pop(offset, None)
+        if old is not None:
+            self.current_bytes -= len(old.data)
+        eof = bool(file_size) and offset + len(data) >= file_size
+        ranges[offset] = _Range(data, eof, time.time() + (ttl or self.ttl))
+        self._files.move_to_end(key)
+        self.current_bytes += len(data)
+        self.puts += 1
+        self._evict()
+
+    def take(self, file_id: FileId, offset: int, limit: int) -> Optional[bytes]:
+        """``limit`` bytes at ``offset`` if one live range covers them (or runs to EOF)."""
+        ranges = self._files.get(self._key(file_id))
+        if not ranges:
+            return None
+        now = time.time()
+        for start, r in list(ranges.items()):
+            if now >= r.expires_at:
+                self._drop(ranges, start)
+                continue
+            rel = offset - start
+            if 0 <= rel < len(r.data) and (rel + limit <= len(r.data) or r.eof):
+                self.hits += 1
+                return r.data[rel:rel + limit]
+        return None
+
+    def covers(self, file_id: FileId, offset: int) -> bool:
+        ranges = self._files.get(self._key(file_id)) or {}
+        now = time.time()
+        return any(
+            0 <= offset - start < len(r.data) and now < r.expires_at for start, r in ranges.items()
+        )
+
+    def _drop(self, ranges: Dict[int, _Range], start: int) -> None:
+        r = ranges.pop(start)
+        self.current_bytes -= len(r.data)
+        self.expired += 1
+
+    def _evict(self) -> None:
+        now = time.time()
+        for key, ranges in list(self._files.items()):
+            for start in [s for s, r in ranges.items() if now >= r.expires_at]:
+                self._drop(ranges, start)
+            if not ranges:
+                del self._files[key]
+        while self.current_bytes > self.max_bytes and self._files:
+            _, ranges = self._files.popitem(last=False)
+            self.current_bytes -= sum(len(r.data) for r in ranges.values())
+
+    def stats(self) -> Dict:
+        return {
+            "files": len(self._files),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "puts": self.puts,
+            "expired": self.expired,
+        }
+
+
+range_cache = RangeCache()
@@ -0,0 +1,232 @@
+import re
+import time
+from collections import deque
+from typing import Dict, Optional, Union
+
+from Backend.config import Telegram
+
+MAX_GETFILE_LIMIT = 1024 * 1024  # largest chunk the in-stream ramp will grow to
+MIN_PACE_AHEAD = 16 * 1024 * 1024  # never hold a stream less than this far ahead of playback
+LOW_WATER = 0.5                    # sprint again once the lead falls under this share of the target
+
+
+class ReadaheadPolicy:
+    """Per-stream readahead policy that stays lazy until the client proves it is playing.
+
+    Players open a file with several short-lived probe requests (the head,
+    the tail for MKV cues / MP4 moov, then the seek target).  Starting the
+    full parallel producer for each of those wastes up to
+    ``parallelism + prefetch`` chunks per probe.  Until a connection has been
+    open for ``ramp_seconds`` *and* drained ``ramp_bytes`` the stream runs
+    with a single fetch in flight and no queued readahead; after that the
+    stream's AimdController decides.
+    """
+
+    def __init__(
+        self,
+        ramp_seconds: float = Telegram.READAHEAD_RAMP_SECS,
+        ramp_bytes: int = Telegram.READAHEAD_RAMP_MB * 1024 * 1024,
+    ):
+        self.ramp_seconds = ramp_seconds
+        self.ramp_bytes = ramp_bytes
+        self._widened = False
+
+    def skip_probing(self) -> None:
+        """Start widened, e.g. for a viewer that is already known to be playing."""
+        self._widened = True
+
+    def probing(self, entry: Dict) -> bool:
+        if self._widened:
+            return False
+        open_for = time.time() - entry.get("start_ts", time.time())
+        if open_for >= self.ramp_seconds and entry.get("total_bytes", 0) >= self.ramp_bytes:
+            self._widened = True
+            return False
+        return True
+
+
+class AimdController:
+    """Additive-increase / multiplicative-decrease control of one stream's fetch pipeline.
+
+    Throughput is sampled over windows of completed chunks.  While each
+    window beats the best seen so far the stream gets one more request in
+    flight, one more queued chunk and (where alignment allows) a doubled
+    chunk size.  A timeout or FloodWait halves parallelism and readahead.
+    The result is that every stream settles near the operating point its
+    bot and DC can actually sustain instead of a global static guess.
+    """
+
+    GROWTH = 1.05  # a window must beat the best by 5% to count as "rising"
+
+    def __init__(self, parallel: int, prefetch: int, chunk_size: int, enabled: bool = Telegram.ADAPTIVE_PARALLEL):
+        self.parallel = max(1, parallel)
+        self.prefetch = max(1, prefetch)
+        self.chunk_size = chunk_size
+        self.min_chunk_size = chunk_size
+        if enabled:
+            self.max_parallel = max(self.parallel, Telegram.AIMD_MAX_PARALLEL)
+            self.max_prefetch = max(self.prefetch, Telegram.AIMD_MAX_PARALLEL)
+            self.max_chunk_size = max(chunk_size, MAX_GETFILE_LIMIT)
+        else:
+            self.max_parallel = self.parallel
+            self.max_prefetch = self.prefetch
+            self.max_chunk_size = chunk_size
+        self.best_mbps = 0.0
+        self.last_mbps = 0.0
+        self.decisions = deque(maxlen=10)
+        self._window_start = time.perf_counter()
+        self._window_bytes = 0
+        self._window_chunks = 0
+
+    def resume(self, parallel: Optional[int], prefetch: Optional[int]) -> None:
+        """Start from an earlier stream's operating point instead of the defaults."""
+        if parallel:
+            self.parallel = max(1, min(parallel, self.max_parallel))
+        if prefetch:
+            self.prefetch = max(1, min(prefetch, self.max_prefetch))
+
+    def chunk_size_at(self, offset: int) -> int:
+        """Largest size up to the current target that ``offset`` is aligned to."""
+        size = self.chunk_size
+        while size > self.min_chunk_size and offset % size:
+            size //= 2
+        return size
+
+    def on_chunk(self, nbytes: int) -> None:
+        self._window_bytes += nbytes
+        self._window_chunks += 1
+        if self._window_chunks < max(2, self.parallel):
+            return
+
+        elapsed = max(time.perf_counter() - self._window_start, 1e-6)
+        mbps = (self._window_bytes / (1024 * 1024)) / elapsed
+        self.last_mbps = mbps
+        self._window_start = time.perf_counter()
+        self._window_bytes = 0
+        self._window_chunks = 0
+
+        if mbps > self.best_mbps * self.GROWTH:
+            self.best_mbps = mbps
+            grown = False
+            if self.parallel < self.max_parallel:
+                self.parallel += 1
+                grown = True
+            if self.prefetch < self.max_prefetch:
+                self.prefetch += 1
+                grown = True
+            if self.chunk_size < self.max_chunk_size:
+                self.chunk_size *= 2
+                grown = True
+            if grown:
+                self._record("increase", mbps)
+
+    def on_congestion(self, reason: str) -> None:
+        self.parallel = max(1, self.parallel // 2)
+        self.prefetch = max(1, self.prefetch // 2)
+        # Throughput measured before the back-off is no longer a fair bar.
+        self.best_mbps = self.last_mbps * 0.5
+        self._record(reason, self.last_mbps)
+
+    def _record(self, action: str, mbps: float) -> None:
+        self.decisions.append({
+            "ts": round(time.time(), 3),
+            "action": action,
+            "parallel": self.parallel,
+            "prefetch": self.prefetch,
+            "chunk_size": self.chunk_size,
+            "mbps": round(mbps, 3),
+        })
+
+    def snapshot(self) -> Dict:
+        return {
+            "parallel": self.parallel,
+            "prefetch": self.prefetch,
+            "chunk_size": self.chunk_size,
+            "last_mbps": round(self.last_mbps, 3),
+            "best_mbps": round(self.best_mbps, 3),
+            "decisions": list(self.decisions),
+        }
+
+
+def runtime_seconds(runtime: Union[str, int, float, None]) -> Optional[float]:
+    """Parse a stored runtime ("120 min", "2h 10min", "1h", 95) into seconds."""
+    if runtime is None or runtime == "":
+        return None
+    if isinstance(runtime, (int, float)):
+        minutes = float(runtime)
+    else:
+        text = str(runtime).lower()
+        hours = re.search(r"(\d+(?:\.\d+)?)\s*h", text)
+        mins = re.search(r"(\d+(?:\.\d+)?)\s*m", text)
+        if hours or mins:
+            minutes = (float(hours.group(1)) * 60 if hours else 0) + (float(mins.group(1)) if mins else 0)
+        else:
+            bare = re.search(r"\d+(?:\.\d+)?", text)
+            if not bare:
+                return None
+            minutes = float(bare.group())
+    return minutes * 60 if minutes > 0 else None
+
+
+class BitratePacer:
+    """Keep a stream a fixed playback time ahead of the viewer.
+
+    The average bitrate is the file size over the title's runtime.  The
+    viewer's playback position is estimated as the request's first byte
+    plus the time since the request started at that bitrate, and the
+    target lead is ``buffer_seconds`` of playback (never less than
+    ``MIN_PACE_AHEAD``).  A stream sprints - delivers as fast as the
+    client reads - until what it has delivered runs that far ahead of the
+    estimate, then holds until the lead falls under ``LOW_WATER`` of the
+    target.  The held chunk keeps the queue full, which stops the fetches
+    behind it too.  Every new request (open, seek) starts sprinting.
+    """
+
+    def __init__(self, bitrate: float, buffer_seconds: float, start: int = 0):
+        self.bitrate = bitrate
+        self.target = max(int(bitrate * buffer_seconds), MIN_PACE_AHEAD)
+        self.low_water = int(self.target * LOW_WATER)
+        self.start = start
+        self.started_at = time.monotonic()
+        self.sprinting = True
+        self.holds = 0
+        self.held_seconds = 0.0
+        self.lead = 0
+
+    @classmethod
+    def for_file(cls, file_size: int, runtime: Union[str, int, float, None], start: int = 0,
+                 buffer_seconds: float = Telegram.PACE_BUFFER_SECS) -> Optional["BitratePacer"]:
+        seconds = runtime_seconds(runtime)
+        if buffer_seconds <= 0 or not seconds or not file_size:
+            return None
+        return cls(file_size / seconds, buffer_seconds, start)
+
+    def position(self, now: Optional[float] = None) -> float:
+        """Estimated playback position (absolute byte offset)."""
+        now = time.monotonic() if now is None else now
+        return self.start + (now - self.started_at) * self.bitrate
+
+    def delay(self, delivered_to: int, now: Optional[float] = None) -> float:
+        """Seconds to wait before the stream may deliver up to ``delivered_to``."""
+        self.lead = int(delivered_to - self.position(now))
+        if self.sprinting:
+            if self.lead <= self.target:
+                return 0.0
+            self.sprinting = False
+            self.holds += 1
+        elif self.lead <= self.low_water:
+            self.sprinting = True
+            return 0.0
+        wait = (self.lead - self.low_water) / self.bitrate
+        self.held_seconds += wait
+        return wait
+
+    def snapshot(self) -> Dict:
+        return {
+            "bitrate_mbps": round(self.bitrate * 8 / 1_000_000, 2),
+            "target_bytes": self.target,
+            "lead_bytes": self.lead,
+            "sprinting": self.sprinting,
+            "holds": self.holds,
+            "held_seconds": round(self.held_seconds, 1),
+        }
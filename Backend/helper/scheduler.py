@@ -0,0 +1,172 @@
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from Backend.helper.circuit_breaker import breakers
+from Backend.pyrofork.bot import multi_clients, client_failures, client_dc_map
+
+EWMA_ALPHA = 0.2
+WINDOW = 5.0                           # seconds of delivered bytes that count as current load
+DEFAULT_CAPACITY = 20 * 1024 * 1024    # bytes/s assumed for a bot we have not measured yet
+NEW_STREAM_BPS = 2 * 1024 * 1024       # demand charged for a stream that has not produced bytes yet
+CAPACITY_DECAY = 0.995                 # per observation, so an old peak slowly stops counting
+DEFAULT_LATENCY = 0.5                  # seconds, for a (bot, DC) with no samples
+
+
+class _Link:
+    """EWMA of one (bot, DC) pair's GetFile latency and per-request throughput."""
+
+    __slots__ = ("latency", "bps", "samples")
+
+    def __init__(self):
+        self.latency: Optional[float] = None
+        self.bps: Optional[float] = None
+        self.samples = 0
+
+    def observe(self, nbytes: int, seconds: float) -> None:
+        seconds = max(seconds, 1e-3)
+        bps = nbytes / seconds
+        if self.latency is None:
+            self.latency, self.bps = seconds, bps
+        else:
+            self.latency += EWMA_ALPHA * (seconds - self.latency)
+            self.bps += EWMA_ALPHA * (bps - self.bps)
+        self.samples += 1
+
+
+class BotScheduler:
+    """Pick the bot with the most spare capacity for a file's DC.
+
+    Every GetFile that actually goes to Telegram is reported here, which
+    gives a live EWMA latency per (bot, DC) and the bytes each bot has
+    delivered over the last few seconds.  A bot's capacity is the highest
+    aggregate rate it has sustained (decaying slowly), so its spare
+    capacity is that minus its current rate - one heavy 4K stream counts
+    for far more than an idle probe.  New assignments are charged a
+    provisional demand until their bytes show up, so a burst of new
+    streams doesn't all land on the same bot.
+    """
+
+    def __init__(self):
+        self._links: Dict[Tuple[int, int], _Link] = {}
+        self._delivered: Dict[int, Deque[Tuple[float, int]]] = {}
+        self._delivered_bytes: Dict[int, int] = {}  # running sum of each _delivered window
+        self._assigned: Dict[int, Deque[float]] = {}
+        self._capacity: Dict[int, float] = {}
+        self.decisions: Deque[Dict] = deque(maxlen=100)
+
+    def observe(self, client_index: int, dc_id: int, nbytes: int, seconds: float) -> None:
+        key = (client_index, dc_id)
+        link = self._links.get(key)
+        if link is None:
+            link = self._links[key] = _Link()
+        link.observe(nbytes, seconds)
+
+        now = time.time()
+        delivered = self._delivered.setdefault(client_index, deque())
+        delivered.append((now, nbytes))
+        self._delivered_bytes[client_index] = self._delivered_bytes.get(client_index, 0) + nbytes
+        rate = self._delivered_bps(client_index, now)
+        cap = self._capacity.get(client_index, 0.0) * CAPACITY_DECAY
+        self._capacity[client_index] = max(cap, rate)
+
+    def _delivered_bps(self, client_index: int, now: float) -> float:
+        delivered = self._delivered.get(client_index)
+        if not delivered:
+            return 0.0
+        total = self._delivered_bytes.get(client_index, 0)
+        while delivered and now - delivered[0][0] > WINDOW:
+            total -= delivered.popleft()[1]
+        self._delivered_bytes[client_index] = total
+        return total / WINDOW
+
+    def load_bps(self, client_index: int, now: Optional[float] = None) -> float:
+        now = now or time.time()
+        assigned = self._assigned.get(client_index)
+        while assigned and now - assigned[0] > WINDOW:
+            assigned.popleft()
+        pending = len(assigned) * NEW_STREAM_BPS if assigned else 0
+        return self._delivered_bps(client_index, now) + pending
+
+    def latency(self, client_index: int, dc_id: int) -> float:
+        link = self._links.get((client_index, dc_id))
+        if link is not None and link.latency is not None:
+            return link.latency
+        # Nothing for this DC yet: fall back to the bot's average elsewhere.
+        known = [l.latency for (i, _), l in self._links.items() if i == client_index and l.latency is not None]
+        return sum(known) / len(known) if known else DEFAULT_LATENCY
+
+    def _candidate(self, client_index: int, dc_id: int, now: float) -> Dict:
+        capacity = max(self._capacity.get(client_index, 0.0), DEFAULT_CAPACITY)
+        load = self.load_bps(client_index, now)
+        spare = max(capacity - load, 0.0)
+        latency = self.latency(client_index, dc_id)
+        score = (spare / (1024 * 1024)) / max(latency, 0.05)
+        return {
+            "client_index": client_index,
+            "home_dc": client_dc_map.get(client_index),
+            "score": round(score, 3),
+            "spare_mbps": round(spare / (1024 * 1024), 3),
+            "load_mbps": round(load / (1024 * 1024), 3),
+            "latency": round(latency, 4),
+            "failures": client_failures.get(client_index, 0),
+            "breaker": breakers.state(client_index, dc_id),
+        }
+
+    def rank(self, dc_id: int, exclude: Optional[int] = None) -> List[Dict]:
+        """Candidate bots for ``dc_id``, best first.
+
+        Bots whose circuit breaker for the DC is not closed are left out,
+        unless that would leave no bot at all.
+        """
+        now = time.time()
+        idxs = [idx for idx in multi_clients if idx != exclude]
+        healthy = [idx for idx in idxs if breakers.allow(idx, dc_id)]
+        candidates = [self._candidate(idx, dc_id, now) for idx in (healthy or idxs)]
+        candidates.sort(key=lambda c: (-c["score"], c["client_index"]))
+        return candidates
+
+    def choose(self, dc_id: int) -> int:
+        """Pick a bot for a new stream of a file in ``dc_id`` and log why."""
+        candidates = self.rank(dc_id)
+        if not candidates:
+            return 0
+        chosen = candidates[0]["client_index"]
+        self._assigned.setdefault(chosen, deque()).append(time.time())
+        self.decisions.appendleft({
+            "ts": round(time.time(), 3),
+            "dc_id": dc_id,
+            "chosen": chosen,
+            "candidates": candidates[:5],
+        })
+        return chosen
+
+    def best_other(self, dc_id: int, exclude: int) -> Optional[int]:
+        """Best bot other than ``exclude``, for fallbacks and hedges."""
+        candidates = self.rank(dc_id, exclude=exclude)
+        return candidates[0]["client_index"] if candidates else None
+
+    def snapshot(self) -> Dict:
+        now = time.time()
+        return {
+            "links": {
+                f"{idx}:{dc}": {
+                    "latency": round(link.latency, 4) if link.latency is not None else None,
+                    "mbps_per_request": round(link.bps / (1024 * 1024), 3) if link.bps is not None else None,
+                    "samples": link.samples,
+                }
+                for (idx, dc), link in self._links.items()
+            },
+            "bots": {
+                idx: {
+                    "load_mbps": round(self.load_bps(idx, now) / (1024 * 1024), 3),
+                    "capacity_mbps": round(max(self._capacity.get(idx, 0.0), DEFAULT_CAPACITY) / (1024 * 1024), 3),
+                }
+                for idx in multi_clients
+            },
+            "breakers": breakers.snapshot(),
+            "decisions": list(self.decisions),
+        }
+
+
+scheduler = BotScheduler()
@@ -0,0 +1,178 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+from pyrogram import Client, raw
+from pyrogram.session import Session
+
+from Backend.config import Telegram
+from Backend.logger import LOGGER
+
+IDLE_TTL = 120        # seconds an extra session may sit unused before it is stopped
+PING_AFTER = 60       # ping a session that has been idle this long
+REAP_INTERVAL = 30
+MAX_ERRORS = 3        # consecutive connection errors before a member is replaced
+
+
+class _Member:
+    __slots__ = ("session", "outstanding", "last_used", "errors", "requests")
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.outstanding = 0
+        self.last_used = time.time()
+        self.errors = 0
+        self.requests = 0
+
+
+class MediaSessionPool:
+    """Several MTProto sessions to one DC for one bot, used like one Session.
+
+    All members share the auth key of the first session, so the exported
+    authorization imported into it covers every member.  ``send`` goes to
+    the member with the fewest outstanding requests; when every member is
+    busy and the pool is below ``max_size`` another session is started in
+    the background.  Extra members idle for ``IDLE_TTL`` are stopped, idle
+    members are pinged, and a member that keeps failing at the connection
+    level is replaced.
+    """
+
+    def __init__(self, client: Client, client_index: int, dc_id: int, first: Session,
+                 max_size: int = Telegram.MEDIA_SESSIONS):
+        self.client = client
+        self.client_index = client_index
+        self.dc_id = dc_id
+        self.max_size = max(1, max_size)
+        self.members: List[_Member] = [_Member(first)]
+        self._growing = False
+
+    async def _new_session(self) -> Session:
+        first = self.members[0].session
+        session = Session(self.client, self.dc_id, first.auth_key, first.test_mode, is_media=True)
+        session.no_updates = True
+        session.timeout = 30
+        session.sleep_threshold = 60
+        await session.start()
+        return session
+
+    async def _grow(self) -> None:
+        try:
+            session = await self._new_session()
+            self.members.append(_Member(session))
+            LOGGER.debug("Media session pool for DC %s grew to %s", self.dc_id, len(self.members))
+        except Exception as e:
+            LOGGER.debug("Could not add a media session for DC %s: %s", self.dc_id, e)
+        finally:
+            self._growing = False
+
+    def _pick(self) -> _Member:
+        member = min(self.members, key=lambda m: (m.outstanding, m.errors))
+        if member.outstanding and len(self.members) < self.max_size and not self._growing:
+            self._growing = True
+            asyncio.create_task(self._grow())
+        return member
+
+    async def send(self, *args, **kwargs):
+        member = self._pick()
+        member.outstanding += 1
+        member.requests += 1
+        member.last_used = time.time()
+        try:
+            r = await member.session.send(*args, **kwargs)
+        except (OSError, asyncio.TimeoutError, ConnectionError):
+            member.errors += 1
+            if member.errors >= MAX_ERRORS:
+                self._retire(member)
+            raise
+        finally:
+            member.outstanding -= 1
+        member.errors = 0
+        return r
+
+    def _retire(self, member: _Member) -> None:
+        if member not in self.members:
+            return
+        self.members.remove(member)
+        if not self.members:
+            # Never leave the pool empty; start over from a fresh session.
+            self.members.append(member)
+            member.errors = 0
+            if not self._growing:
+                self._growing = True
+                asyncio.create_task(self._replace(member))
+            return
+        asyncio.create_task(self._stop(member.session))
+
+    async def _replace(self, member: _Member) -> None:
+        try:
+            session = await self._new_session()
+            self.members = [_Member(session)]
+            self.client.media_sessions[self.dc_id] = session
+            await self._stop(member.session)
+        except Exception as e:
+            LOGGER.debug("Could not replace media session for DC %s: %s", self.dc_id, e)
+        finally:
+            self._growing = False
+
+    @staticmethod
+    async def _stop(session: Session) -> None:
+        try:
+            await session.stop()
+        except Exception:
+            pass
+
+    async def reap(self) -> None:
+        now = time.time()
+        for member in list(self.members[1:]):
+            if member.outstanding == 0 and now - member.last_used > IDLE_TTL:
+                self.members.remove(member)
+                await self._stop(member.session)
+                LOGGER.debug("Reaped idle media session for DC %s", self.dc_id)
+
+        for member in list(self.members):
+            if member.outstanding or now - member.last_used < PING_AFTER:
+                continue
+            try:
+                await asyncio.wait_for(member.session.send(raw.functions.Ping(ping_id=int(now))), timeout=10)
+                member.last_used = time.time()
+            except Exception as e:
+                LOGGER.debug("Media session for DC %s failed its health check: %s", self.dc_id, e)
+                self._retire(member)
+
+    def stats(self) -> Dict:
+        return {
+            "sessions": len(self.members),
+            "max_size": self.max_size,
+            "outstanding": [m.outstanding for m in self.members],
+            "requests": [m.requests for m in self.members],
+        }
+
+
+_pools: Dict[Tuple[int, int], MediaSessionPool] = {}
+_reaper: Optional[asyncio.Task] = None
+
+
+def pool_for(client: Client, client_index: int, dc_id: int, first: Session) -> MediaSessionPool:
+    """The pool wrapping ``first`` (the bot's media session for ``dc_id``)."""
+    global _reaper
+    key = (id(client), dc_id)
+    pool = _pools.get(key)
+    if pool is None:
+        pool = _pools[key] = MediaSessionPool(client, client_index, dc_id, first)
+    if _reaper is None or _reaper.done():
+        _reaper = asyncio.create_task(_reap_forever())
+    return pool
+
+
+async def _reap_forever() -> None:
+    while True:
+        await asyncio.sleep(REAP_INTERVAL)
+        for pool in list(_pools.values()):
+            try:
+                await pool.reap()
+            except Exception as e:
+                LOGGER.debug("Session pool reap failed: %s", e)
+
+
+def pool_stats() -> Dict[str, Dict]:
+    return {f"{pool.client_index}:{pool.dc_id}": pool.stats() for pool in _pools.values()}
@@ -0,0 +1,139 @@
+import hmac
+import json
+import os
+import secrets
+from hashlib import sha256
+from typing import Dict, Optional
+
+from pyrogram import Client
+from pyrogram.crypto import aes
+
+from Backend.config import Telegram
+from Backend.logger import LOGGER
+
+NONCE_SIZE = 16
+MAC_SIZE = 32
+
+
+class SessionStore:
+    """Encrypted on-disk auth keys, one file per bot.
+
+    Each file holds the bot's exported session string (its main-DC auth
+    key) and the auth keys of the media sessions it opened to other DCs
+    after they were authorized there.  On restart the bot starts from its
+    session string and its media sessions reuse their keys, so the
+    ``Auth().create()`` handshake and the Export/ImportAuthorization round
+    trip only happen for DCs the bot has never used or whose key Telegram
+    no longer accepts.
+
+    Files are named after a hash of the bot token and encrypted with
+    AES-256-CTR plus an HMAC-SHA256 tag, both keyed from ``SESSION_SECRET``.
+    A file that fails the tag check (other secret, corrupted) is ignored.
+    """
+
+    def __init__(self, directory: str = Telegram.SESSION_STORE, secret: str = Telegram.SESSION_SECRET):
+        self.directory = directory
+        master = sha256(f"session-store:{secret}".encode()).digest()
+        self._enc_key = sha256(b"enc" + master).digest()
+        self._mac_key = sha256(b"mac" + master).digest()
+        self._cache: Dict[str, Dict] = {}
+        self.reused = 0
+        self.created = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    @staticmethod
+    def bot_key_for_token(token: str) -> str:
+        return sha256(token.encode()).hexdigest()[:16]
+
+    def bot_key(self, client: Client) -> str:
+        return self.bot_key_for_token(getattr(client, "bot_token", None) or client.name)
+
+    def _path(self, bot_key: str) -> str:
+        return os.path.join(self.directory, f"{bot_key}.session")
+
+    def _encrypt(self, data: bytes) -> bytes:
+        nonce = secrets.token_bytes(NONCE_SIZE)
+        body = aes.ctr256_encrypt(data, self._enc_key, bytearray(nonce))
+        tag = hmac.new(self._mac_key, nonce + body, sha256).digest()
+        return nonce + body + tag
+
+    def _decrypt(self, blob: bytes) -> Optional[bytes]:
+        if len(blob) < NONCE_SIZE + MAC_SIZE:
+            return None
+        nonce, body, tag = blob[:NONCE_SIZE], blob[NONCE_SIZE:-MAC_SIZE], blob[-MAC_SIZE:]
+        if not hmac.compare_digest(tag, hmac.new(self._mac_key, nonce + body, sha256).digest()):
+            return None
+        return aes.ctr256_decrypt(body, self._enc_key, bytearray(nonce))
+
+    def _load(self, bot_key: str) -> Dict:
+        entry = self._cache.get(bot_key)
+        if entry is not None:
+            return entry
+        entry = {"session_string": None, "media": {}}
+        if self.enabled:
+            try:
+                with open(self._path(bot_key), "rb") as f:
+                    data = self._decrypt(f.read())
+                if data is None:
+                    LOGGER.warning("Session store file for %s failed verification; ignoring it", bot_key)
+                else:
+                    entry = json.loads(data)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                LOGGER.warning("Could not read session store file for %s: %s", bot_key, e)
+        self._cache[bot_key] = entry
+        return entry
+
+    def _save(self, bot_key: str) -> None:
+        if not self.enabled:
+            return
+        path = self._path(bot_key)
+        tmp = f"{path}.tmp"
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(self._encrypt(json.dumps(self._cache[bot_key]).encode()))
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, path)
+        except Exception as e:
+            LOGGER.warning("Could not write session store file for %s: %s", bot_key, e)
+
+    def session_string(self, bot_key: str) -> Optional[str]:
+        return self._load(bot_key).get("session_string")
+
+    def save_session_string(self, bot_key: str, session_string: Optional[str]) -> None:
+        entry = self._load(bot_key)
+        if entry.get("session_string") == session_string:
+            return
+        entry["session_string"] = session_string
+        self._save(bot_key)
+
+    def media_key(self, client: Client, dc_id: int) -> Optional[bytes]:
+        key = self._load(self.bot_key(client))["media"].get(str(dc_id))
+        return bytes.fromhex(key) if key else None
+
+    def save_media_key(self, client: Client, dc_id: int, auth_key: bytes) -> None:
+        bot_key = self.bot_key(client)
+        self._load(bot_key)["media"][str(dc_id)] = auth_key.hex()
+        self._save(bot_key)
+
+    def forget_media_key(self, client: Client, dc_id: int) -> None:
+        bot_key = self.bot_key(client)
+        if self._load(bot_key)["media"].pop(str(dc_id), None) is not None:
+            self._save(bot_key)
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "bots": len(self._cache),
+            "media_keys": sum(len(e["media"]) for e in self._cache.values()),
+            "reused": self.reused,
+            "created": self.created,
+        }
+
+
+session_store = SessionStore()
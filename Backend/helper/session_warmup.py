@@ -0,0 +1,94 @@
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+from Backend import db
+from Backend.logger import LOGGER
+from Backend.helper.custom_dl import ByteStreamer
+from Backend.pyrofork.bot import multi_clients
+
+DEFAULT_DCS = [1, 2, 4, 5]   # used until there is any stream or file history
+HISTORY_DAYS = 7
+MIN_SHARE = 0.02             # a DC with less of the traffic than this is left cold
+REPLAN_INTERVAL = 1800       # seconds between re-reading the DC distribution
+CONNECT_TIMEOUT = 60
+
+
+class WarmupPlanner:
+    """Open media sessions to the DCs our files actually live on.
+
+    The plan comes from the DC distribution of recent ``stream_analytics``
+    rows and of resolved file ids, so a library that sits in DC 4 doesn't
+    pay for sessions to DC 1.  Every bot connects to every hot DC at once,
+    and the sessions go through the media session pools, whose reaper
+    pings idle sessions so they stay open between viewers.  The plan is
+    re-read every ``REPLAN_INTERVAL`` to follow new uploads.
+    """
+
+    def __init__(self):
+        self.hot_dcs: List[int] = []
+        self.distribution: Dict[int, int] = {}
+        self.last_run: Optional[float] = None
+        self.last_duration = 0.0
+        self.warmed = 0
+        self.failed: Dict[str, str] = {}
+
+    async def plan(self) -> List[int]:
+        try:
+            self.distribution = await db.get_dc_distribution(days=HISTORY_DAYS)
+        except Exception as e:
+            LOGGER.debug("Session warm-up: could not read DC distribution: %s", e)
+            self.distribution = {}
+
+        total = sum(self.distribution.values())
+        if not total:
+            return list(DEFAULT_DCS)
+        ranked = sorted(self.distribution.items(), key=lambda kv: -kv[1])
+        return [dc for dc, count in ranked if count / total >= MIN_SHARE]
+
+    async def _warm_one(self, client_index: int, dc: int) -> None:
+        try:
+            streamer = ByteStreamer.for_client(client_index)
+            await asyncio.wait_for(streamer.get_dc_session(dc), timeout=CONNECT_TIMEOUT)
+            self.failed.pop(f"{client_index}:{dc}", None)
+        except Exception as e:
+            self.failed[f"{client_index}:{dc}"] = str(e) or type(e).__name__
+            LOGGER.debug("Session warm-up: client %s DC %s failed: %s", client_index, dc, e)
+
+    async def run_once(self) -> None:
+        started = time.time()
+        self.hot_dcs = await self.plan()
+        pairs = [
+            (idx, dc) for idx, client in list(multi_clients.items()) for dc in self.hot_dcs
+            if dc not in client.media_sessions
+        ]
+        await asyncio.gather(*(self._warm_one(idx, dc) for idx, dc in pairs))
+        opened = sum(1 for idx, dc in pairs if f"{idx}:{dc}" not in self.failed)
+        self.warmed += opened
+        self.last_run = time.time()
+        self.last_duration = self.last_run - started
+        LOGGER.info(
+            "Session warm-up: opened %s/%s media sessions to DCs %s in %.1fs",
+            opened, len(pairs), self.hot_dcs, self.last_duration,
+        )
+
+    async def run_forever(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                LOGGER.warning("Session warm-up failed: %s", e)
+            await asyncio.sleep(REPLAN_INTERVAL)
+
+    def stats(self) -> Dict:
+        return {
+            "hot_dcs": self.hot_dcs,
+            "distribution": self.distribution,
+            "last_run": round(self.last_run, 3) if self.last_run else None,
+            "last_duration": round(self.last_duration, 2),
+            "warmed": self.warmed,
+            "failed": self.failed,
+        }
+
+
+warmup_planner = WarmupPlanner()
@@ -0,0 +1,147 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from pyrogram.file_id import FileId
+
+from Backend.config import Telegram
+from Backend.logger import LOGGER
+from Backend.helper.custom_dl import ByteStreamer
+from Backend.helper.encrypt import decode_string
+from Backend.helper.file_resolver import file_resolver
+from Backend.helper.memory_governor import memory_governor
+from Backend.helper.range_cache import range_cache
+from Backend.helper.scheduler import scheduler
+from Backend.pyrofork.bot import StreamBot, multi_clients, work_loads, client_failures
+
+HEAD_BYTES = 1024 * 1024      # start of the file the player reads first
+TAIL_BYTES = 1024 * 1024      # end of the file (MKV cues, MP4 moov) players seek to next
+CONCURRENCY = 2               # files warmed at the same time
+BUDGET_WINDOW = 60.0          # seconds over which STREAM_WARMER_BUDGET applies
+
+
+class StreamWarmer:
+    """Prepare the streams Stremio just listed before the user clicks one.
+
+    For the ``STREAM_WARMER_TOP`` best qualities of a ``get_streams``
+    answer the FileIds are resolved in bulk (one ``get_messages`` per
+    chat), the scheduler's pick for the file's DC opens its media session,
+    and the first and last MB of the file are read into the short-lived
+    range cache.  The click then starts on a resolved FileId, a warm
+    session and bytes already in memory.
+
+    Browsing must not turn into load: at most ``STREAM_WARMER_BUDGET``
+    files are warmed per minute across all users, ``CONCURRENCY`` at a
+    time, files still warm are skipped, and nothing is read while the
+    stream memory budget is under pressure.
+    """
+
+    def __init__(self, top: int = Telegram.STREAM_WARMER_TOP, budget: int = Telegram.STREAM_WARMER_BUDGET):
+        self.top = top
+        self.budget = budget
+        self._slots = asyncio.Semaphore(CONCURRENCY)
+        self._recent: Deque[float] = deque()
+        self._warm_until: Dict[str, float] = {}
+        self.scheduled = 0
+        self.warmed = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def _take_budget(self, wanted: int) -> int:
+        now = time.time()
+        while self._recent and now - self._recent[0] > BUDGET_WINDOW:
+            self._recent.popleft()
+        granted = max(0, min(wanted, self.budget - len(self._recent)))
+        self._recent.extend([now] * granted)
+        return granted
+
+    def schedule(self, encoded_ids: List[str]) -> None:
+        """Warm the first ``top`` of ``encoded_ids`` (best first) in the background."""
+        if not Telegram.STREAM_WARMER:
+            return
+        now = time.time()
+        for key, until in list(self._warm_until.items()):
+            if until <= now:
+                del self._warm_until[key]
+        fresh = [i for i in dict.fromkeys(encoded_ids[:self.top]) if i not in self._warm_until]
+        granted = self._take_budget(len(fresh))
+        self.skipped += len(fresh) - granted
+        if not granted:
+            return
+        fresh = fresh[:granted]
+        for encoded in fresh:
+            self._warm_until[encoded] = now + range_cache.ttl
+        self.scheduled += granted
+        asyncio.create_task(self._warm(fresh))
+
+    async def _warm(self, encoded_ids: List[str]) -> None:
+        file_ids = await self.resolve_ids(encoded_ids)
+        await asyncio.gather(*(self.warm_file(f) for f in file_ids))
+
+    async def resolve_ids(self, encoded_ids: List[str]) -> List[FileId]:
+        """Resolve encoded stream ids with one ``get_messages`` per chat and bot."""
+        by_chat: Dict[int, List[int]] = {}
+        for encoded in encoded_ids:
+            try:
+                decoded = await decode_string(encoded)
+                by_chat.setdefault(int(f"-100{decoded['chat_id']}"), []).append(int(decoded["msg_id"]))
+            except Exception as e:
+                LOGGER.debug("Stream warmer: could not decode %s: %s", encoded, e)
+
+        # stream_handler resolves on the main bot, media_streamer on the least loaded one
+        resolvers = {0: StreamBot}
+        if multi_clients:
+            idx = min(multi_clients, key=lambda i: work_loads.get(i, 0) + 3 * client_failures.get(i, 0))
+            resolvers.setdefault(idx, multi_clients[idx])
+
+        file_ids: List[FileId] = []
+        for chat_id, message_ids in by_chat.items():
+            for client_index, client in resolvers.items():
+                try:
+                    resolved = await file_resolver.resolve_many(client, client_index, chat_id, message_ids)
+                except Exception as e:
+                    LOGGER.debug("Stream warmer: bulk resolve in %s failed: %s", chat_id, e)
+                    self.failed += 1
+                    continue
+                if client_index == 0:
+                    file_ids.extend(resolved[m] for m in message_ids if m in resolved)
+        return file_ids
+
+    async def warm_file(self, file_id: FileId, ttl: Optional[float] = None) -> bool:
+        """Open the media session for ``file_id`` and cache its first and last MB for ``ttl`` seconds."""
+        async with self._slots:
+            if memory_governor.under_pressure() or not multi_clients:
+                self.skipped += 1
+                return False
+            try:
+                candidates = scheduler.rank(file_id.dc_id)
+                streamer = ByteStreamer.for_client(candidates[0]["client_index"] if candidates else 0)
+                size = file_id.file_size or 0
+                ranges = [(0, HEAD_BYTES)]
+                if size > HEAD_BYTES:
+                    ranges.append((max(HEAD_BYTES, size - TAIL_BYTES), TAIL_BYTES))
+                for start, length in ranges:
+                    if range_cache.covers(file_id, start):
+                        continue
+                    offset, data = await streamer.read_blocks(file_id, start, length)
+                    range_cache.put(file_id, offset, data, ttl)
+                self.warmed += 1
+                return True
+            except Exception as e:
+                self.failed += 1
+                LOGGER.debug("Stream warmer: warming %s failed: %s", getattr(file_id, "unique_id", None), e)
+                return False
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": Telegram.STREAM_WARMER,
+            "scheduled": self.scheduled,
+            "warmed": self.warmed,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "range_cache": range_cache.stats(),
+        }
+
+
+stream_warmer = StreamWarmer()
@@ -0,0 +1,174 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+from pyrogram.file_id import FileId
+
+from Backend.config import Telegram
+from Backend.helper.memory_governor import memory_governor
+
+SESSION_IDLE_TTL = 120  # seconds without a request or open stream before a session is dropped
+MAX_SESSIONS = 2000
+TAIL_CHUNKS = 4         # undelivered readahead chunks kept for the next request
+NEAR_CHUNKS = 2         # "just after" the last window means within this many chunks
+PLAYING_BYTES = 4 * 1024 * 1024  # a request must deliver this much before it moves the playback position
+
+
+class ViewerSession:
+    """Warm state shared by the successive Range requests of one playback.
+
+    A player opens many short connections for one title (seeks, reconnects,
+    reads from both ends).  The session remembers the bot, chunk size and
+    FileId the first request settled on, where the last readahead window
+    ended, how far the stream's AIMD controller had ramped, and the chunks
+    that were fetched but never delivered.  A follow-up request that lands
+    inside or just after that window continues from this state.
+    """
+
+    def __init__(self, key: Hashable, file_id: FileId, client_index: int, chunk_size: int):
+        self.key = key
+        self.file_id = file_id
+        self.file_id_at = time.time()
+        self.client_index = client_index
+        self.chunk_size = chunk_size
+        self.created_at = self.last_seen = time.time()
+        self.window_start: Optional[int] = None
+        self.window_end: Optional[int] = None
+        self.tail: Dict[int, Tuple[int, bytes]] = {}  # offset -> (limit requested, chunk)
+        self.parallel: Optional[int] = None
+        self.prefetch: Optional[int] = None
+        self.total_bytes = 0
+        self.position = 0
+        self.media_info: Optional[Dict] = None  # title and runtime from the library, looked up once
+        self.active = 0
+        self.requests = 0
+        self.warm_starts = 0
+
+    def touch(self) -> None:
+        self.last_seen = time.time()
+
+    def expired(self, now: Optional[float] = None) -> bool:
+        now = now or time.time()
+        return self.active == 0 and now - self.last_seen > SESSION_IDLE_TTL
+
+    def file_id_fresh(self) -> bool:
+        return time.time() - self.file_id_at < Telegram.FILE_ID_TTL
+
+    def rebind(self, client_index: int, chunk_size: int) -> None:
+        """Move the session to another bot; the old tail no longer lines up."""
+        self.client_index = client_index
+        self.chunk_size = chunk_size
+        self.window_start = self.window_end = None
+        self.drop_tail()
+        self.parallel = self.prefetch = None
+
+    def is_near(self, start: int) -> bool:
+        if self.window_start is None:
+            return False
+        return self.window_start <= start <= self.window_end + NEAR_CHUNKS * self.chunk_size
+
+    def advance(self, delivered_to: int, request_bytes: int) -> None:
+        """Move the playback position to ``delivered_to``.
+
+        Short reads (players fetching the index at the end of the file) are
+        not playback, so only a request that has delivered ``PLAYING_BYTES``
+        moves the position.
+        """
+        if request_bytes >= PLAYING_BYTES and delivered_to > self.position:
+            self.position = delivered_to
+
+    def progress(self) -> float:
+        """Playback position as a fraction of the file."""
+        size = getattr(self.file_id, "file_size", 0) or 0
+        return self.position / size if size else 0.0
+
+    def take_tail(self, offset: int, limit: int) -> Optional[bytes]:
+        """Return ``limit`` bytes at ``offset`` if a tail chunk covers them.
+
+        Tail chunks may be larger than the new stream's chunks (the old
+        stream had ramped up), so a covering chunk is sliced.
+        """
+        for tail_off, (tail_limit, chunk) in self.tail.items():
+            rel = offset - tail_off
+            if rel < 0 or rel >= len(chunk):
+                continue
+            if rel + limit <= len(chunk) or len(chunk) < tail_limit:
+                # Either fully covered, or this chunk ends at end of file.
+                return chunk[rel:rel + limit]
+        return None
+
+    def finish(self, window_start: int, window_end: int, tail: Dict[int, Tuple[int, bytes]],
+               parallel: int, prefetch: int) -> None:
+        """Record where a stream of this session stopped."""
+        self.window_start = window_start
+        self.window_end = max(window_end, window_start)
+        self.tail = {k: tail[k] for k in sorted(tail)[:TAIL_CHUNKS]}
+        # The tail is charged to the memory governor, which drops it first
+        # when a stream needs the room; without room it is not kept at all.
+        tail_bytes = sum(len(chunk) for _, chunk in self.tail.values())
+        if not memory_governor.keep_tail(self, tail_bytes, self.drop_tail):
+            self.tail = {}
+        self.parallel = parallel
+        self.prefetch = prefetch
+        self.touch()
+
+    def drop_tail(self) -> None:
+        self.tail = {}
+        memory_governor.release_tail(self)
+
+
+class ViewerSessions:
+    """Registry of viewer sessions keyed by (token, encoded id)."""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[Hashable, ViewerSession]" = OrderedDict()
+        self.opened = 0
+        self.reused = 0
+
+    def get(self, key: Hashable) -> Optional[ViewerSession]:
+        self._prune()
+        session = self._sessions.get(key)
+        if session is None:
+            return None
+        self._sessions.move_to_end(key)
+        session.touch()
+        self.reused += 1
+        return session
+
+    def open(self, key: Hashable, file_id: FileId, client_index: int, chunk_size: int) -> ViewerSession:
+        self._prune()
+        replaced = self._sessions.get(key)
+        if replaced is not None:
+            replaced.drop_tail()
+        session = ViewerSession(key, file_id, client_index, chunk_size)
+        self._sessions[key] = session
+        self._sessions.move_to_end(key)
+        self.opened += 1
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)[1].drop_tail()
+        return session
+
+    def drop(self, session: ViewerSession) -> None:
+        if self._sessions.get(session.key) is session:
+            del self._sessions[session.key]
+            session.drop_tail()
+
+    def _prune(self) -> None:
+        now = time.time()
+        for key, session in list(self._sessions.items()):
+            if session.expired(now):
+                del self._sessions[key]
+                session.drop_tail()
+
+    def stats(self) -> Dict:
+        return {
+            "sessions": len(self._sessions),
+            "opened": self.opened,
+            "reused": self.reused,
+            "warm_starts": sum(s.warm_starts for s in self._sessions.values()),
+            "tail_bytes": sum(len(c) for s in self._sessions.values() for _, c in s.tail.values()),
+        }
+
+
+viewer_sessions = ViewerSessions()
@@ -2,6 +2,7 @@ from asyncio import gather, create_task
 from pyrogram import Client
 from Backend.logger import LOGGER
 from Backend.config import Telegram
+from Backend.helper.session_store import session_store
 from Backend.pyrofork.bot import multi_clients, work_loads, StreamBot, client_dc_map
 from os import environ
 
@@ -22,15 +23,19 @@ class TokenParser:
 async def start_client(client_id, token):
     try:
         LOGGER.info(f"Starting - Bot Client {client_id}")
-        client = await Client(
-            name=str(client_id),
-            api_id=Telegram.API_ID,
-            api_hash=Telegram.API_HASH,
-            bot_token=token,
-            sleep_threshold=100,
-            no_updates=True,
-            in_memory=True
-        ).start()
+        bot_key = session_store.bot_key_for_token(token)
+        session_string = session_store.session_string(bot_key)
+        client = None
+        if session_string:
+            try:
+                client = await _build_client(client_id, token, session_string).start()
+                LOGGER.info(f"Client {client_id} resumed its stored session")
+            except Exception as e:
+                LOGGER.warning(f"Stored session for Client {client_id} was rejected ({e}); logging in again")
+                client = None
+        if client is None:
+            client = await _build_client(client_id, token).start()
+            session_store.save_session_string(bot_key, await client.export_session_string())
         
         try:
             client_dc = await client.storage.dc_id()
@@ -46,6 +51,18 @@ async def start_client(client_id, token):
         LOGGER.error(f"Failed to start Client - {client_id} Error: {e}", exc_info=True)
         return None
 
+def _build_client(client_id, token, session_string=None):
+    return Client(
+        name=str(client_id),
+        api_id=Telegram.API_ID,
+        api_hash=Telegram.API_HASH,
+        bot_token=token,
+        session_string=session_string,
+        sleep_threshold=100,
+        no_updates=True,
+        in_memory=True
+    )
+
 async def initialize_clients():
     multi_clients[0], work_loads[0] = StreamBot, 0
     
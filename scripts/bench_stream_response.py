@@ -0,0 +1,151 @@
+"""CPU cost of serving /dl bodies: Starlette's StreamingResponse vs ChunkStreamResponse.
+
+Streams the same ranges through ByteStreamer.prefetch_stream against fake
+zero-latency media sessions and into an in-process ASGI ``send`` that only
+counts bytes, so what is measured is our side of the pipeline: producer,
+consumer and response.  Two paths are compared:
+
+  starlette  StreamingResponse, ``request.is_disconnected()`` before every
+             chunk and edge chunks copied to bytes (the /dl path before
+             ChunkStreamResponse)
+  direct     ChunkStreamResponse with its disconnect watcher, memoryview
+             edge slices
+
+Usage (from the repo root, with the project's dependencies installed):
+
+    DATABASE=mongodb://localhost/a,mongodb://localhost/b python scripts/bench_stream_response.py [--gib 3] [--runs 3]
+
+Nothing connects to MongoDB or Telegram.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyrogram.file_id import FileId, FileType
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+
+from Backend import db
+from Backend.fastapi.stream_response import ChunkStreamResponse
+from Backend.helper import custom_dl
+from Backend.helper.chunk_cache import chunk_cache
+from Backend.pyrofork.bot import multi_clients, work_loads
+
+CHUNK = 1024 * 1024
+RANGE = 16 * CHUNK
+FILE_SIZE = 160 * CHUNK + 777
+DATA = os.urandom(FILE_SIZE)
+
+
+class FakeSession:
+    """Media session answering GetFile from DATA without any latency."""
+
+    async def send(self, query, *args, **kwargs):
+        await asyncio.sleep(0)
+        return SimpleNamespace(bytes=DATA[query.offset:query.offset + query.limit])
+
+
+class FakeClient:
+    def __init__(self, dc_id: int):
+        self.media_sessions = {dc_id: FakeSession()}
+
+
+def make_file_id() -> FileId:
+    file_id = FileId(
+        dc_id=4, media_id=1, access_hash=2, file_reference=b"ref",
+        file_type=FileType.DOCUMENT, thumbnail_size="", chat_id=-1001, local_id=0,
+    )
+    file_id.file_size = FILE_SIZE
+    file_id.unique_id = "bench"
+    return file_id
+
+
+async def copy_edges(body):
+    # What /dl used to yield: trimmed edge chunks as fresh bytes objects
+    async for chunk in body:
+        yield bytes(chunk) if isinstance(chunk, memoryview) else chunk
+
+
+async def serve(streamer, file_id, mode: str, start: int, end: int, n: int) -> int:
+    offset = start - start % CHUNK
+    never = asyncio.Event()
+    sent = 0
+
+    async def receive():
+        await never.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal sent
+        if message["type"] == "http.response.body":
+            sent += len(message["body"])
+
+    scope = {"type": "http", "method": "GET", "path": "/dl", "headers": [], "query_string": b""}
+    kwargs = dict(
+        file_id=file_id, client_index=0, offset=offset,
+        first_part_cut=start - offset, last_part_cut=end % CHUNK + 1,
+        part_count=end // CHUNK - offset // CHUNK + 1, chunk_size=CHUNK,
+        prefetch=3, parallelism=4, stream_id=f"bench-{mode}-{n}",
+    )
+    if mode == "starlette":
+        body = await streamer.prefetch_stream(request=Request(scope, receive), **kwargs)
+        response = StreamingResponse(copy_edges(body), status_code=206)
+    else:
+        disconnected = asyncio.Event()
+        body = await streamer.prefetch_stream(disconnected=disconnected, **kwargs)
+        response = ChunkStreamResponse(body, status_code=206, disconnected=disconnected)
+    await response(scope, receive, send)
+    if sent != end - start + 1:
+        raise RuntimeError(f"{mode}: sent {sent} bytes for a {end - start + 1} byte range")
+    return sent
+
+
+async def run(mode: str, gib: float) -> float:
+    """Stream ``gib`` GiB in unaligned 16 MB ranges; return CPU ms per Gbit."""
+    streamer = custom_dl.ByteStreamer(multi_clients[0], 0)
+    file_id = make_file_id()
+    ranges = [
+        (s * CHUNK + 4097 * (s % 7 + 1), s * CHUNK + RANGE - 3001)
+        for s in range(0, FILE_SIZE // CHUNK - 16, 3)
+    ]
+    await serve(streamer, file_id, mode, *ranges[0], -1)  # warm-up
+
+    total, n = 0, 0
+    cpu = time.process_time()
+    while total < gib * 2 ** 30:
+        start, end = ranges[n % len(ranges)]
+        total += await serve(streamer, file_id, mode, start, end, n)
+        n += 1
+    cpu = time.process_time() - cpu
+    return cpu / (total * 8 / 1e9) * 1000
+
+
+async def main(gib: float, runs: int) -> None:
+    multi_clients.clear()
+    multi_clients[0] = FakeClient(make_file_id().dc_id)
+    work_loads[0] = 0
+    chunk_cache.max_bytes = 0  # every chunk goes through a GetFile
+
+    async def no_analytics(entry):
+        return None
+    db.log_stream_stats = no_analytics
+
+    results = {"starlette": [], "direct": []}
+    for _ in range(runs):
+        for mode in results:
+            results[mode].append(await run(mode, gib))
+    for mode, values in results.items():
+        print(f"{mode:>9}: best {min(values):6.1f} ms CPU/Gbit  (runs: {', '.join(f'{v:.1f}' for v in values)})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--gib", type=float, default=3.0, help="GiB streamed per run and path")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.gib, args.runs))
@@ -0,0 +1,4 @@
+import os
+
+# Backend.config reads these at import time; the tests never connect to them.
+os.environ.setdefault("DATABASE", "mongodb://localhost:27017/tracking,mongodb://localhost:27017/storage_1")
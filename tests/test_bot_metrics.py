@@ -0,0 +1,33 @@
+from Backend.helper import bot_metrics
+from Backend.helper.bot_metrics import MIN_SAMPLES, hedge_delay, observe_cancelled, observe_latency
+
+
+def setup_function():
+    bot_metrics.chunk_latency.clear()
+
+
+def test_early_cancellations_do_not_lower_the_hedge_delay():
+    for _ in range(MIN_SAMPLES):
+        observe_latency(0, 4, 0.7)
+    before = hedge_delay(0, 4)
+
+    for _ in range(10 * MIN_SAMPLES):
+        observe_cancelled(0, 4, 0.01)
+
+    assert hedge_delay(0, 4) == before == 0.75
+    assert bot_metrics.chunk_latency[(0, 4)].total == MIN_SAMPLES
+
+
+def test_cancellation_past_p95_counts_as_slow_tail():
+    for _ in range(MIN_SAMPLES):
+        observe_latency(0, 4, 0.3)
+
+    observe_cancelled(0, 4, 4.0)
+
+    assert bot_metrics.chunk_latency[(0, 4)].total == MIN_SAMPLES + 1
+
+
+def test_cancellation_without_history_is_not_recorded():
+    observe_cancelled(1, 4, 9.0)
+
+    assert (1, 4) not in bot_metrics.chunk_latency
@@ -0,0 +1,125 @@
+import asyncio
+import random
+from hashlib import sha256
+
+import pytest
+from pyrogram import raw
+from pyrogram.crypto import aes
+
+from Backend.helper.cdn import CdnFetcher
+from Backend.helper.exceptions import CDNHashMismatch, CDNReuploadFailed
+
+BLOCK = 128 * 1024
+PART = 1024 * 1024
+KEY = bytes(range(32))
+IV = bytes(range(100, 116))   # the last 4 bytes must be replaced by offset / 16
+DATA = random.Random(0).randbytes(4 * PART)
+
+
+def file_hashes(start: int, count: int):
+    return [
+        raw.types.FileHash(offset=off, limit=BLOCK, hash=sha256(DATA[off:off + BLOCK]).digest())
+        for off in range(start, min(start + count * BLOCK, len(DATA)), BLOCK)
+    ]
+
+
+class FakeCdnSession:
+    """CDN DC serving DATA encrypted as Telegram does: AES-256-CTR over the
+    whole file, counter starting from the redirect IV with a zero low word."""
+
+    def __init__(self, reuploads_needed: int = 0):
+        self.ciphertext = bytearray(aes.ctr256_encrypt(DATA, KEY, bytearray(IV[:-4] + bytes(4))))
+        self.reuploads_needed = reuploads_needed
+        self.requests = []
+
+    async def send(self, query):
+        assert isinstance(query, raw.functions.upload.GetCdnFile)
+        self.requests.append((query.offset, query.limit))
+        if self.reuploads_needed:
+            return raw.types.upload.CdnFileReuploadNeeded(request_token=b"request-token")
+        return raw.types.upload.CdnFile(bytes=bytes(self.ciphertext[query.offset:query.offset + query.limit]))
+
+
+class FakeMainSession:
+    """The bot's own media session: hands out hashes and reuploads parts."""
+
+    def __init__(self, cdn: FakeCdnSession):
+        self.cdn = cdn
+        self.hash_requests = []
+        self.reupload_tokens = []
+
+    async def send(self, query):
+        if isinstance(query, raw.functions.upload.GetCdnFileHashes):
+            self.hash_requests.append(query.offset)
+            return file_hashes(query.offset, 8)
+        if isinstance(query, raw.functions.upload.ReuploadCdnFile):
+            self.reupload_tokens.append(query.request_token)
+            self.cdn.reuploads_needed = max(0, self.cdn.reuploads_needed - 1)
+            return file_hashes(0, len(DATA) // BLOCK)
+        raise AssertionError(f"unexpected query {query!r}")
+
+
+def make_fetcher(cdn: FakeCdnSession, main: FakeMainSession, hashes) -> CdnFetcher:
+    redirect = raw.types.upload.FileCdnRedirect(
+        dc_id=203, file_token=b"file-token", encryption_key=KEY, encryption_iv=IV, file_hashes=hashes,
+    )
+
+    async def session_factory(client, dc_id):
+        assert dc_id == 203
+        return cdn
+
+    return CdnFetcher(None, main, redirect, session_factory=session_factory)
+
+
+def test_decrypts_part_at_unaligned_offset():
+    cdn = FakeCdnSession()
+    main = FakeMainSession(cdn)
+    fetcher = make_fetcher(cdn, main, file_hashes(0, len(DATA) // BLOCK))
+    offset = PART + 3 * BLOCK
+
+    data = asyncio.run(fetcher.fetch(offset, PART))
+
+    assert data == DATA[offset:offset + PART]
+    assert cdn.requests == [(offset, PART)]
+    assert main.hash_requests == []
+
+
+def test_corrupted_block_raises_hash_mismatch():
+    cdn = FakeCdnSession()
+    cdn.ciphertext[PART + 2 * BLOCK + 17] ^= 0xFF
+    fetcher = make_fetcher(cdn, FakeMainSession(cdn), file_hashes(0, len(DATA) // BLOCK))
+
+    with pytest.raises(CDNHashMismatch):
+        asyncio.run(fetcher.fetch(PART, PART))
+
+
+def test_missing_hashes_are_fetched_from_main_dc():
+    cdn = FakeCdnSession()
+    main = FakeMainSession(cdn)
+    fetcher = make_fetcher(cdn, main, file_hashes(0, 2))
+
+    data = asyncio.run(fetcher.fetch(2 * PART, PART))
+
+    assert data == DATA[2 * PART:3 * PART]
+    assert main.hash_requests == [2 * PART]
+
+
+def test_reupload_then_success():
+    cdn = FakeCdnSession(reuploads_needed=1)
+    main = FakeMainSession(cdn)
+    fetcher = make_fetcher(cdn, main, [])
+
+    data = asyncio.run(fetcher.fetch(0, PART))
+
+    assert data == DATA[:PART]
+    assert fetcher.reuploads == 1
+    assert main.reupload_tokens == [b"request-token"]
+    assert len(cdn.requests) == 2
+
+
+def test_endless_reupload_is_not_a_hash_mismatch():
+    cdn = FakeCdnSession(reuploads_needed=10)
+    fetcher = make_fetcher(cdn, FakeMainSession(cdn), file_hashes(0, len(DATA) // BLOCK))
+
+    with pytest.raises(CDNReuploadFailed):
+        asyncio.run(fetcher.fetch(0, PART))
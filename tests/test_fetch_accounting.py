@@ -0,0 +1,179 @@
+import asyncio
+import os
+from typing import Optional
+
+import pytest
+from pyrogram import raw
+from pyrogram.errors import FloodWait
+from pyrogram.file_id import FileId, FileType
+
+from Backend import db
+from Backend.config import Telegram
+from Backend.helper import bot_metrics, circuit_breaker, custom_dl, scheduler as scheduler_module, session_pool
+from Backend.helper.chunk_cache import chunk_cache
+from Backend.helper.exceptions import CDNHashMismatch
+from Backend.pyrofork.bot import client_failures, multi_clients, work_loads
+
+MB = 1024 * 1024
+DC = 4
+DATA = os.urandom(4 * MB)
+
+
+class FakeSession:
+    """Media session answering GetFile from DATA.
+
+    The first request for an offset listed in ``gated`` waits for
+    ``release`` and then raises the error mapped to it, if any.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.cdn_supported = []
+        self.redirect = False
+        self.gated = {}
+        self.arrived = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def send(self, query, *args, **kwargs):
+        self.requests.append(query.offset)
+        self.cdn_supported.append(query.cdn_supported)
+        if self.redirect and query.cdn_supported:
+            return raw.types.upload.FileCdnRedirect(
+                dc_id=203, file_token=b"token", encryption_key=bytes(32), encryption_iv=bytes(16), file_hashes=[],
+            )
+        if query.offset in self.gated:
+            error = self.gated.pop(query.offset)
+            self.arrived.set()
+            await self.release.wait()
+            if error is not None:
+                raise error
+        await asyncio.sleep(0)
+        return raw.types.upload.File(
+            type=raw.types.storage.FilePartial(), mtime=0, bytes=DATA[query.offset:query.offset + query.limit],
+        )
+
+
+class FakeClient:
+    def __init__(self):
+        self.media_sessions = {DC: FakeSession()}
+
+
+def make_file_id() -> FileId:
+    file_id = FileId(
+        dc_id=DC, media_id=1, access_hash=2, file_reference=b"ref",
+        file_type=FileType.DOCUMENT, thumbnail_size="", chat_id=-1001, local_id=0,
+    )
+    file_id.file_size = len(DATA)
+    file_id.unique_id = "accounting"
+    return file_id
+
+
+@pytest.fixture
+def bots(monkeypatch):
+    async def no_analytics(entry):
+        return None
+
+    async def no_probe(idx, file_id):
+        return None
+
+    board = circuit_breaker.BreakerBoard()
+    monkeypatch.setattr(custom_dl, "breakers", board)
+    monkeypatch.setattr(scheduler_module, "breakers", board)
+    monkeypatch.setattr(custom_dl, "probe_when_due", no_probe)
+    monkeypatch.setattr(db, "log_stream_stats", no_analytics)
+    monkeypatch.setattr(chunk_cache, "max_bytes", 0)
+    clients = [FakeClient(), FakeClient()]
+    multi_clients.clear()
+    work_loads.clear()
+    client_failures.clear()
+    for idx, client in enumerate(clients):
+        multi_clients[idx] = client
+        work_loads[idx] = 0
+    yield clients
+    multi_clients.clear()
+    work_loads.clear()
+    client_failures.clear()
+    custom_dl.ByteStreamer._instances.clear()
+    session_pool._pools.clear()
+
+
+async def read_first_mb(client_index: int) -> bytes:
+    streamer = custom_dl.ByteStreamer(multi_clients[client_index], client_index)
+    body = await streamer.prefetch_stream(
+        file_id=make_file_id(), client_index=client_index, offset=0, first_part_cut=0,
+        last_part_cut=MB, part_count=1, chunk_size=MB, prefetch=1, parallelism=1,
+        stream_id=f"accounting-{client_index}",
+    )
+    return b"".join([bytes(chunk) async for chunk in body])
+
+
+async def join_request_of_bot_0(bots, error: Optional[Exception] = None, release: bool = True):
+    """Stream on bot 0, have bot 1's stream join its in-flight request,
+    then let it answer or fail with ``error`` (``release=False``: it never does)."""
+    sender = bots[0].media_sessions[DC]
+    sender.gated[0] = error
+    coalesced = custom_dl.getfile_flights.coalesced
+    first = asyncio.create_task(read_first_mb(0))
+    await asyncio.wait_for(sender.arrived.wait(), 5)
+    second = asyncio.create_task(read_first_mb(1))
+    while custom_dl.getfile_flights.coalesced == coalesced:
+        await asyncio.sleep(0)
+    if release:
+        await asyncio.sleep(0.3)
+        sender.release.set()
+    return await asyncio.wait_for(asyncio.gather(first, second), 10)
+
+
+def test_flood_on_a_joined_request_holds_only_the_sender(bots):
+    results = asyncio.run(join_request_of_bot_0(bots, FloodWait(value=30)))
+
+    assert results == [DATA[:MB], DATA[:MB]]
+    assert custom_dl.breakers.held_for(0, DC) > 0
+    assert custom_dl.breakers.held_for(1, DC) == 0
+
+
+def test_timeout_of_a_joined_request_is_charged_only_to_the_sender(bots, monkeypatch):
+    monkeypatch.setattr(custom_dl, "GETFILE_TIMEOUT", 0.2)
+
+    results = asyncio.run(join_request_of_bot_0(bots, release=False))
+
+    assert results == [DATA[:MB], DATA[:MB]]
+    assert client_failures == {0: 1}
+    assert custom_dl.breakers.get(0, DC).last_error == "timeout"
+    assert custom_dl.breakers.get(1, DC).last_error is None
+
+
+class BrokenCdnFetcher:
+    def __init__(self, client, main_session, redirect):
+        self.dc_id = redirect.dc_id
+
+    async def fetch(self, offset, limit):
+        raise CDNHashMismatch(f"CDN block at offset {offset} failed verification")
+
+
+def test_cdn_failure_falls_back_to_plain_getfile_without_charging_the_bot(bots, monkeypatch):
+    monkeypatch.setattr(Telegram, "CDN_DOWNLOADS", True)
+    monkeypatch.setattr(custom_dl, "CdnFetcher", BrokenCdnFetcher)
+    monkeypatch.setattr(custom_dl, "_cdn_failed", {})
+    session = bots[0].media_sessions[DC]
+    session.redirect = True
+
+    async def run():
+        first = await read_first_mb(0)
+        second = await read_first_mb(0)
+        return first, second
+
+    assert asyncio.run(run()) == (DATA[:MB], DATA[:MB])
+    # Redirected once; the retry and the next request skip the CDN
+    assert session.cdn_supported == [True, None, None]
+    assert custom_dl.breakers.get(0, DC).last_error is None
+    assert client_failures == {}
+
+
+def test_latency_of_a_joined_request_is_observed_only_for_the_sender(bots, monkeypatch):
+    monkeypatch.setattr(bot_metrics, "chunk_latency", {})
+
+    asyncio.run(join_request_of_bot_0(bots))
+
+    assert set(bot_metrics.chunk_latency) == {(0, DC)}
+    assert bot_metrics.chunk_latency[(0, DC)].total == 1
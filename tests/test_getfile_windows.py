@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+from Backend.helper.custom_dl import getfile_windows
+
+KB = 1024
+MB = 1024 * KB
+
+
+def assert_legal(windows, start, end):
+    for offset, limit in windows:
+        assert offset % (4 * KB) == 0
+        assert limit % (4 * KB) == 0 and MB % limit == 0
+        assert offset // MB == (offset + limit - 1) // MB
+    assert windows[0][0] <= start
+    assert windows[-1][0] + windows[-1][1] > end
+    for (a, la), (b, _) in zip(windows, windows[1:]):
+        assert a + la == b
+
+
+def test_small_range_straddling_a_power_of_two_boundary():
+    # 4 bytes around 512 KB used to cost the whole first megabyte
+    assert getfile_windows(524287, 524290) == [(520192, 8 * KB)]
+
+
+def test_offset_need_not_be_a_multiple_of_the_limit():
+    assert getfile_windows(5000, 70000) == [(4 * KB, 128 * KB)]
+
+
+def test_range_crossing_a_megabyte_gets_one_window_per_side():
+    assert getfile_windows(MB - 1, MB) == [(MB - 4 * KB, 4 * KB), (MB, 4 * KB)]
+
+
+def test_window_that_would_overshoot_the_block_is_split():
+    # 12 KB up to the boundary: a 16 KB window would cross it
+    assert getfile_windows(MB - 12 * KB, MB - 1) == [(MB - 12 * KB, 8 * KB), (MB - 4 * KB, 4 * KB)]
+
+
+def test_head_probe():
+    assert getfile_windows(0, 1023) == [(0, 4 * KB)]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_ranges_are_legal_and_contiguous(seed):
+    rng = random.Random(seed)
+    for _ in range(500):
+        start = rng.randrange(0, 8 * MB)
+        end = start + rng.randrange(0, 256 * KB)
+        assert_legal(getfile_windows(start, end), start, end)
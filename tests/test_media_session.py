@@ -0,0 +1,117 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from pyrogram.errors import AuthBytesInvalid, AuthKeyUnregistered
+
+from Backend.helper import custom_dl
+from Backend.helper.session_store import SessionStore
+
+HOME_DC, MEDIA_DC = 2, 4
+real_sleep = asyncio.sleep
+
+
+class FakeSession:
+    """pyrogram Session double; ``behaviour`` maps query names to an exception to raise."""
+
+    created = []
+
+    def __init__(self, client, dc_id, auth_key, test_mode, **kwargs):
+        self.dc_id = dc_id
+        self.auth_key = auth_key
+        self.behaviour = client.behaviour.get(auth_key, {})
+        self.running = False
+        FakeSession.created.append(self)
+
+    async def start(self):
+        self.running = True
+
+    async def stop(self):
+        self.running = False
+
+    async def send(self, query):
+        error = self.behaviour.get(type(query).__name__)
+        if error is not None:
+            raise error
+        return SimpleNamespace()
+
+
+class FakeAuth:
+    def __init__(self, client, dc_id, test_mode):
+        pass
+
+    async def create(self):
+        return b"fresh-key"
+
+
+class FakeStorage:
+    async def test_mode(self):
+        return False
+
+    async def dc_id(self):
+        return HOME_DC
+
+    async def auth_key(self):
+        return b"home-key"
+
+
+class FakeClient:
+    def __init__(self, behaviour=None):
+        self.name = "bot"
+        self.bot_token = "123:token"
+        self.storage = FakeStorage()
+        self.media_sessions = {}
+        self.behaviour = behaviour or {}
+
+    async def invoke(self, query):
+        return SimpleNamespace(id=1, bytes=b"exported")
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    FakeSession.created = []
+    monkeypatch.setattr(custom_dl, "Session", FakeSession)
+    monkeypatch.setattr(custom_dl, "Auth", FakeAuth)
+    monkeypatch.setattr(asyncio, "sleep", lambda *_: real_sleep(0))  # import retries back off
+    store = SessionStore(str(tmp_path), "secret")
+    monkeypatch.setattr(custom_dl, "session_store", store)
+    return store
+
+
+def open_session(client):
+    return asyncio.run(custom_dl.ByteStreamer(client, -1)._open_media_session(MEDIA_DC))
+
+
+def test_stored_key_is_reused(store):
+    client = FakeClient()
+    store.save_media_key(client, MEDIA_DC, b"stored-key")
+
+    session = open_session(client)
+
+    assert session.auth_key == b"stored-key"
+    assert len(FakeSession.created) == 1
+
+
+@pytest.mark.parametrize("error", [AuthKeyUnregistered(), asyncio.TimeoutError(), OSError("reset")])
+def test_failed_key_check_stops_session_and_reauthorizes(store, error):
+    client = FakeClient({b"stored-key": {"GetUsers": error}})
+    store.save_media_key(client, MEDIA_DC, b"stored-key")
+
+    session = open_session(client)
+
+    checked, fresh = FakeSession.created
+    assert not checked.running
+    assert fresh is session and fresh.running and fresh.auth_key == b"fresh-key"
+    assert store.media_key(client, MEDIA_DC) == b"fresh-key"
+
+
+def test_failed_import_raises_and_stops_session(store):
+    client = FakeClient({b"fresh-key": {"ImportAuthorization": AuthBytesInvalid()}})
+
+    with pytest.raises(AuthBytesInvalid):
+        open_session(client)
+
+    (session,) = FakeSession.created
+    assert not session.running
+    assert store.media_key(client, MEDIA_DC) is None
+    assert client.media_sessions == {}
@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+
+from Backend.helper import viewer_session
+from Backend.helper.memory_governor import MemoryGovernor
+from Backend.helper.viewer_session import ViewerSessions
+
+MB = 1024 * 1024
+
+
+class Owner:
+    def __init__(self):
+        self.dropped = 0
+
+    def drop(self):
+        self.dropped += 1
+
+
+def test_each_stream_gets_a_fair_share():
+    governor = MemoryGovernor(8 * MB)
+    governor.register("a")
+    governor.register("b")
+
+    assert governor.fair_share() == 4 * MB
+    assert governor.try_reserve("a", 4 * MB)
+    assert not governor.try_reserve("a", MB)
+    assert governor.try_reserve("b", 4 * MB)
+    assert governor.denied == 1
+
+
+def test_a_stream_holding_nothing_always_gets_one_chunk():
+    governor = MemoryGovernor(4 * MB)
+    governor.register("a")
+    governor.try_reserve("a", 4 * MB)
+    governor.register("b")
+
+    # The budget is gone, but "b" must not deadlock
+    assert governor.try_reserve("b", MB)
+    assert not governor.try_reserve("b", MB)
+    assert governor.reserved == 5 * MB
+
+
+def test_release_and_unregister_give_bytes_back():
+    governor = MemoryGovernor(8 * MB)
+    governor.register("a")
+    governor.try_reserve("a", 2 * MB)
+    governor.try_reserve("a", 2 * MB)
+    assert governor.under_pressure() is False
+
+    governor.release("a", 2 * MB)
+    assert governor.held_by("a") == 2 * MB
+    governor.release("a", 10 * MB)  # never below zero
+    assert governor.held_by("a") == 0
+    governor.try_reserve("a", 2 * MB)
+    governor.unregister("a")
+    assert (governor.reserved, governor.peak) == (0, 4 * MB)
+
+
+def test_under_pressure_past_three_quarters():
+    governor = MemoryGovernor(8 * MB)
+    governor.register("a")
+    governor.try_reserve("a", 6 * MB)
+
+    assert governor.under_pressure()
+
+
+def test_wait_for_release_wakes_on_release():
+    governor = MemoryGovernor(8 * MB)
+    governor.register("a")
+    governor.try_reserve("a", MB)
+
+    async def run():
+        waiter = asyncio.create_task(governor.wait_for_release(timeout=5))
+        await asyncio.sleep(0)
+        governor.release("a", MB)
+        await asyncio.wait_for(waiter, 1)
+
+    asyncio.run(run())
+
+
+def test_tails_are_charged_and_dropped_oldest_first_for_streams():
+    governor = MemoryGovernor(8 * MB)
+    old, new = Owner(), Owner()
+    assert governor.keep_tail(old, 2 * MB, old.drop)
+    assert governor.keep_tail(new, 2 * MB, new.drop)
+    assert (governor.reserved, governor.tail_bytes) == (4 * MB, 4 * MB)
+
+    governor.register("s")
+    assert governor.try_reserve("s", 4 * MB)
+    assert governor.try_reserve("s", 2 * MB)
+
+    assert (old.dropped, new.dropped) == (1, 0)
+    assert (governor.reserved, governor.tail_bytes) == (8 * MB, 2 * MB)
+
+
+def test_tail_must_fit_under_the_pressure_mark():
+    governor = MemoryGovernor(8 * MB)
+    governor.register("s")
+    governor.try_reserve("s", 5 * MB)
+    owner = Owner()
+
+    assert not governor.keep_tail(owner, 2 * MB, owner.drop)
+    assert governor.keep_tail(owner, 1 * MB, owner.drop)
+    assert governor.reserved == 6 * MB
+
+
+def test_keep_tail_replaces_what_the_owner_held():
+    governor = MemoryGovernor(8 * MB)
+    owner = Owner()
+    governor.keep_tail(owner, 2 * MB, owner.drop)
+    governor.keep_tail(owner, 1 * MB, owner.drop)
+    assert governor.tail_bytes == 1 * MB
+
+    governor.release_tail(owner)
+    assert (governor.reserved, governor.tail_bytes, owner.dropped) == (0, 0, 0)
+
+
+@pytest.fixture
+def governor(monkeypatch):
+    governor = MemoryGovernor(64 * MB)
+    monkeypatch.setattr(viewer_session, "memory_governor", governor)
+    return governor
+
+
+def finish_with_tail(session, nbytes):
+    session.finish(0, nbytes, {0: (nbytes, b"x" * nbytes)}, 2, 2)
+
+
+def test_viewer_tails_are_released_on_eviction_and_expiry(governor, monkeypatch):
+    sessions = ViewerSessions(max_sessions=1)
+    first = sessions.open("a", None, 0, MB)
+    finish_with_tail(first, MB)
+    assert governor.tail_bytes == MB
+
+    sessions.open("b", None, 0, MB)  # evicts "a"
+    assert (first.tail, governor.tail_bytes) == ({}, 0)
+
+    second = sessions.get("b")
+    finish_with_tail(second, MB)
+    monkeypatch.setattr(second, "last_seen", second.last_seen - viewer_session.SESSION_IDLE_TTL - 1)
+    assert sessions.get("b") is None
+    assert (second.tail, governor.tail_bytes) == ({}, 0)
+
+
+def test_viewer_tail_is_dropped_when_a_stream_needs_the_room(governor):
+    session = ViewerSessions().open("a", None, 0, MB)
+    finish_with_tail(session, 4 * MB)
+
+    governor.register("s")
+    while governor.try_reserve("s", MB):
+        pass
+
+    assert session.tail == {}
+    assert session.take_tail(0, MB) is None
+    assert governor.tail_bytes == 0
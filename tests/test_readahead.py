@@ -0,0 +1,139 @@
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+from pyrogram.file_id import FileId, FileType
+
+from Backend import db
+from Backend.helper import custom_dl, readahead, session_pool
+from Backend.helper.chunk_cache import chunk_cache
+from Backend.helper.readahead import BitratePacer
+from Backend.pyrofork.bot import multi_clients, work_loads
+
+MB = 1024 * 1024
+DATA = os.urandom(24 * MB)
+
+
+class FakeSession:
+    """Media session answering GetFile from DATA without any latency."""
+
+    def __init__(self):
+        self.requests = []
+
+    async def send(self, query, *args, **kwargs):
+        self.requests.append((query.offset, query.limit))
+        await asyncio.sleep(0)
+        return SimpleNamespace(bytes=DATA[query.offset:query.offset + query.limit])
+
+
+class FakeClient:
+    def __init__(self):
+        self.media_sessions = {4: FakeSession()}
+
+
+def make_file_id() -> FileId:
+    file_id = FileId(
+        dc_id=4, media_id=1, access_hash=2, file_reference=b"ref",
+        file_type=FileType.DOCUMENT, thumbnail_size="", chat_id=-1001, local_id=0,
+    )
+    file_id.file_size = len(DATA)
+    file_id.unique_id = "paced"
+    return file_id
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def no_analytics(entry):
+        return None
+
+    monkeypatch.setattr(db, "log_stream_stats", no_analytics)
+    monkeypatch.setattr(chunk_cache, "max_bytes", 0)
+    fake = FakeClient()
+    multi_clients.clear()
+    multi_clients[0] = fake
+    work_loads.clear()
+    work_loads[0] = 0
+    yield fake
+    multi_clients.clear()
+    work_loads.clear()
+    custom_dl.ByteStreamer._instances.clear()
+    session_pool._pools.clear()
+
+
+def test_pacer_sprints_until_the_lead_reaches_the_target(monkeypatch):
+    monkeypatch.setattr(readahead, "MIN_PACE_AHEAD", 0)
+    pacer = BitratePacer(bitrate=MB, buffer_seconds=10, start=100 * MB)
+    t0 = pacer.started_at
+
+    assert pacer.delay(105 * MB, now=t0) == 0
+    assert pacer.delay(110 * MB, now=t0) == 0
+    # 11 MB delivered at t0: one past the 10 s target, hold down to the 5 s low water
+    assert pacer.delay(111 * MB, now=t0) == pytest.approx(6)
+    assert (pacer.sprinting, pacer.holds) == (False, 1)
+    # Playback caught up 3 s: still above low water, keep holding
+    assert pacer.delay(111 * MB, now=t0 + 3) == pytest.approx(3)
+    # Under low water: sprint again without a wait
+    assert pacer.delay(111 * MB, now=t0 + 6) == 0
+    assert pacer.sprinting
+
+
+def test_pacer_lead_is_measured_from_the_request_start(monkeypatch):
+    monkeypatch.setattr(readahead, "MIN_PACE_AHEAD", 0)
+    # A seek to 1 GB: the lead is what was delivered past the seek point
+    pacer = BitratePacer(bitrate=MB, buffer_seconds=10, start=1024 * MB)
+
+    assert pacer.delay(1024 * MB + 4 * MB, now=pacer.started_at) == 0
+    assert pacer.lead == 4 * MB
+
+
+def test_pacer_never_holds_under_min_pace_ahead():
+    pacer = BitratePacer(bitrate=MB, buffer_seconds=1)
+
+    assert pacer.target == readahead.MIN_PACE_AHEAD
+    assert pacer.delay(readahead.MIN_PACE_AHEAD, now=pacer.started_at) == 0
+
+
+def test_for_file_needs_a_runtime_and_a_buffer():
+    assert BitratePacer.for_file(10 * MB, None) is None
+    assert BitratePacer.for_file(10 * MB, "2 min", buffer_seconds=0) is None
+    assert BitratePacer.for_file(120 * MB, "2 min").bitrate == MB
+
+
+def test_stream_holds_once_far_enough_ahead_of_playback(client, monkeypatch):
+    # 24 MB over a 6 s runtime is 4 MB/s; with a 1 s buffer the stream may
+    # run 4 MB ahead of the viewer and then has to wait for playback.
+    monkeypatch.setattr(readahead, "MIN_PACE_AHEAD", 0)
+    monkeypatch.setattr(
+        custom_dl.BitratePacer, "for_file",
+        classmethod(lambda cls, size, runtime, start: cls(size / 6, 1, start)),
+    )
+    entries = []
+
+    async def log_stream_stats(entry):
+        entries.append(entry)
+
+    monkeypatch.setattr(db, "log_stream_stats", log_stream_stats)
+
+    async def run():
+        streamer = custom_dl.ByteStreamer(client, 0)
+        body = await streamer.prefetch_stream(
+            file_id=make_file_id(), client_index=0, offset=0, first_part_cut=0,
+            last_part_cut=MB, part_count=12, chunk_size=MB,
+            prefetch=2, parallelism=2, stream_id="paced", meta={"runtime": "1 min"},
+        )
+        started = time.monotonic()
+        data = b"".join([bytes(chunk) async for chunk in body])
+        return data, time.monotonic() - started
+
+    data, elapsed = asyncio.run(run())
+
+    assert data == DATA[:12 * MB]
+    pacing = entries[-1]["pacing"]
+    assert pacing["holds"] >= 1
+    # 12 MB at 4 MB/s with a 4 MB lead: playback has to reach 8 MB, 2 s in
+    assert elapsed >= 1.5
+    # The held chunk backs the producer up: readahead stays within the queue
+    fetched = sum(limit for _, limit in client.media_sessions[4].requests)
+    assert fetched <= len(data) + 4 * MB
@@ -0,0 +1,72 @@
+import pytest
+
+from Backend.helper import circuit_breaker, scheduler as scheduler_module
+from Backend.helper.scheduler import BotScheduler, DEFAULT_LATENCY, WINDOW
+from Backend.pyrofork.bot import multi_clients
+
+MB = 1024 * 1024
+DC = 4
+
+
+@pytest.fixture
+def bots(monkeypatch):
+    board = circuit_breaker.BreakerBoard()
+    monkeypatch.setattr(scheduler_module, "breakers", board)
+    multi_clients.clear()
+    multi_clients.update({0: object(), 1: object(), 2: object()})
+    yield board
+    multi_clients.clear()
+
+
+def test_prefers_the_bot_with_lower_latency(bots):
+    scheduler = BotScheduler()
+    scheduler.observe(0, DC, MB, 0.8)
+    scheduler.observe(1, DC, MB, 0.1)
+    scheduler.observe(2, DC, MB, 0.4)
+
+    assert [c["client_index"] for c in scheduler.rank(DC)] == [1, 2, 0]
+    assert scheduler.best_other(DC, exclude=1) == 2
+
+
+def test_new_streams_are_spread_across_idle_bots(bots):
+    scheduler = BotScheduler()
+
+    chosen = [scheduler.choose(DC) for _ in range(3)]
+
+    # Each assignment is charged a provisional demand until its bytes show up
+    assert sorted(chosen) == [0, 1, 2]
+
+
+def test_a_busy_bot_loses_to_an_idle_one(bots, monkeypatch):
+    scheduler = BotScheduler()
+    now = 1000.0
+    monkeypatch.setattr(scheduler_module.time, "time", lambda: now)
+    for _ in range(100):
+        scheduler.observe(0, DC, 2 * MB, 0.1)
+    scheduler.observe(1, DC, 2 * MB, 0.1)
+
+    assert scheduler.rank(DC)[0]["client_index"] == 1
+    # Once its bytes fall out of the window bot 0 is idle again and keeps its measured capacity
+    now += WINDOW + 1
+    assert scheduler.load_bps(0) == 0
+    assert scheduler.rank(DC)[0]["client_index"] == 0
+
+
+def test_bots_whose_breaker_is_not_closed_are_skipped(bots):
+    scheduler = BotScheduler()
+    scheduler.observe(0, DC, MB, 0.05)
+    bots.hold(0, DC, 30, "FloodWait")
+
+    assert [c["client_index"] for c in scheduler.rank(DC)] == [1, 2]
+    for idx in (1, 2):
+        bots.hold(idx, DC, 30, "FloodWait")
+    # Nobody is healthy: rank everyone rather than nobody
+    assert len(scheduler.rank(DC)) == 3
+
+
+def test_latency_falls_back_to_other_dcs_then_the_default(bots):
+    scheduler = BotScheduler()
+    scheduler.observe(0, 2, MB, 0.3)
+
+    assert scheduler.latency(0, DC) == pytest.approx(0.3)
+    assert scheduler.latency(1, DC) == DEFAULT_LATENCY
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from Backend.helper.single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b"chunk"
+
+    async def run():
+        return await asyncio.gather(*(flight.run("k", fetch) for _ in range(5)))
+
+    assert asyncio.run(run()) == [b"chunk"] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"in_flight": 0, "started": 1, "coalesced": 4, "abandoned": 0}
+
+
+def test_every_waiter_gets_the_error():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def run():
+        return await asyncio.gather(flight.run("k", fail), flight.run("k", fail), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert [type(r) for r in results] == [ValueError, ValueError]
+    assert flight.started == 1
+
+
+def test_a_finished_call_is_not_reused():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return len(calls)
+
+    async def run():
+        return [await flight.run("k", fetch), await flight.run("k", fetch)]
+
+    assert asyncio.run(run()) == [1, 2]
+
+
+def test_a_leaving_waiter_does_not_cancel_the_others():
+    flight = SingleFlight()
+    release = None
+
+    async def fetch():
+        await release.wait()
+        return b"chunk"
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        leaving = asyncio.create_task(flight.run("k", fetch))
+        staying = asyncio.create_task(flight.run("k", fetch))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        return await staying
+
+    assert asyncio.run(run()) == b"chunk"
+    assert flight.abandoned == 0
+
+
+def test_the_call_is_cancelled_once_the_last_waiter_leaves():
+    flight = SingleFlight()
+    cancelled = False
+
+    async def fetch():
+        nonlocal cancelled
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+
+    async def run():
+        waiter = asyncio.create_task(flight.run("k", fetch))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert cancelled
+    assert flight.stats()["in_flight"] == 0
+    assert flight.abandoned == 1
@@ -0,0 +1,132 @@
+import asyncio
+
+from Backend.fastapi.stream_response import ChunkStreamResponse
+
+SCOPE = {"type": "http", "method": "GET", "path": "/dl"}
+
+
+class Client:
+    """ASGI receive/send pair for one response; ``leave()`` disconnects."""
+
+    def __init__(self, block_send: bool = False):
+        self.messages = []
+        self.gone = asyncio.Event()
+        self.block_send = block_send
+
+    def leave(self) -> None:
+        self.gone.set()
+
+    async def receive(self):
+        await self.gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(self, message):
+        self.messages.append(message)
+        if self.block_send and message["type"] == "http.response.body":
+            await asyncio.Event().wait()  # a client that stopped reading
+
+    @property
+    def body(self) -> bytes:
+        return b"".join(bytes(m["body"]) for m in self.messages if m["type"] == "http.response.body")
+
+
+def test_sends_chunks_and_memoryviews_as_given():
+    async def body():
+        yield b"abc"
+        yield memoryview(b"0123456789")[2:5]
+
+    async def main():
+        client = Client()
+        response = ChunkStreamResponse(body(), status_code=206, headers={"Content-Range": "bytes 0-5/10"})
+        await response(SCOPE, client.receive, client.send)
+        return client, response
+
+    client, response = asyncio.run(main())
+
+    assert client.messages[0]["type"] == "http.response.start"
+    assert client.messages[0]["status"] == 206
+    assert client.body == b"abc234"
+    assert client.messages[-1] == {"type": "http.response.body", "body": b"", "more_body": False}
+    assert not response.disconnected.is_set()
+
+
+def test_disconnect_while_waiting_for_a_chunk():
+    state = {}
+
+    async def body():
+        try:
+            yield b"first"
+            await asyncio.Event().wait()  # the next chunk never arrives
+            yield b"never"
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+        finally:
+            state["closed"] = True
+
+    async def main():
+        client = Client()
+        disconnected = asyncio.Event()
+        response = ChunkStreamResponse(body(), disconnected=disconnected)
+        call = asyncio.create_task(response(SCOPE, client.receive, client.send))
+        await asyncio.sleep(0.01)
+        client.leave()
+        await asyncio.sleep(0.05)
+        assert call.done()  # returned on its own, without being cancelled
+        await call
+        return client, disconnected
+
+    client, disconnected = asyncio.run(main())
+
+    assert disconnected.is_set()
+    assert state == {"cancelled": True, "closed": True}
+    assert client.body == b"first"
+    assert all(m.get("more_body", True) for m in client.messages[1:])
+
+
+def test_disconnect_while_sending_closes_the_body():
+    state = {}
+
+    async def body():
+        try:
+            while True:
+                yield b"x" * 1024
+        finally:
+            state["closed"] = True
+
+    async def main():
+        client = Client(block_send=True)
+        response = ChunkStreamResponse(body())
+        call = asyncio.create_task(response(SCOPE, client.receive, client.send))
+        await asyncio.sleep(0.01)
+        client.leave()
+        await asyncio.sleep(0.05)
+        assert call.done()  # returned on its own, without being cancelled
+        await call
+        return response
+
+    response = asyncio.run(main())
+
+    assert response.disconnected.is_set()
+    assert state["closed"]
+
+
+def test_server_cancellation_is_not_swallowed_after_disconnect():
+    async def body():
+        yield b"first"
+        await asyncio.Event().wait()
+
+    async def main():
+        client = Client(block_send=False)
+        response = ChunkStreamResponse(body())
+        call = asyncio.create_task(response(SCOPE, client.receive, client.send))
+        await asyncio.sleep(0.01)
+        response.disconnected.set()  # seen, but the watcher has not acted yet
+        call.cancel()
+        try:
+            await call
+        except asyncio.CancelledError:
+            return True
+        return False
+
+    assert asyncio.run(main())